@@ -0,0 +1,18 @@
+'''
+    common
+        Building blocks shared by post_service, feed_service and profile_service:
+            - circuit_breaker: CircuitBreaker guarding calls to profile_service
+            - bulkhead: bounded concurrency of the calls to one dependency
+            - single_flight: concurrent lookups of the same key share one fetch
+            - breaker_status: breaker state changes shared between replicas over Redis
+            - health_prober: elected background /healthz prober driving the breaker
+            - ttl_cache: bounded LRU/TTL cache, in process or shared over Redis
+            - profile_cache: ttl_cache set up for profiles, served stale as a fallback
+            - db_pool: thread-safe, blocking-with-timeout psycopg2 connection pool
+            - metrics: Prometheus instrumentation served at /metrics
+            - health: /healthz and cached /readyz endpoints
+            - bulk_ingest: streaming NDJSON ingestion in chunked transactions
+            - http_client: pooled keep-alive HTTP session and timeouts
+            - profile_client: breaker-protected, cached access to profile_service
+            - async_profile_client: asyncio version of profile_client
+'''
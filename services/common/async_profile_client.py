@@ -0,0 +1,144 @@
+# async_profile_client.py
+import asyncio
+import time
+from typing import Dict, List, Optional
+
+import httpx
+from loguru import logger
+
+from common.bulkhead import Bulkhead
+from common.circuit_breaker import CircuitBreaker
+from common.metrics import PROFILE_CALLS
+from common.profile_cache import ProfileCache, RedisProfileCache
+from common.single_flight import AsyncSingleFlight
+
+
+'''
+    async_profile_client
+        AsyncProfileClient: asyncio counterpart of ProfileClient for services
+        served by an ASGI server.
+
+        - Same breaker and cache semantics as ProfileClient; the breaker and the
+          in-process cache only hold their locks for O(1) work, so they are safe
+          to call from the event loop.
+        - Misses are split in chunks of `max_batch_size` ids and the chunks are
+          fetched concurrently, at most `max_concurrency` at a time, so latency
+          is bounded by the slowest chunk rather than their sum.
+        - Concurrent misses for the same user_id share one in-flight fan-out
+          (single-flight); the other callers get stale cache entries at once when
+          there are some.
+        - The whole fan-out counts as one breaker call, and takes one slot of the
+          optional bulkhead; a full bulkhead is never waited on from the event
+          loop, the request takes the stale-cache fallback instead.
+        - The shared Redis tier uses a blocking client and is run in a worker
+          thread so it never stalls the event loop.
+'''
+
+
+class _ServerError(Exception):
+    pass
+
+
+class AsyncProfileClient:
+
+    def __init__(self, base_url: str, breaker: CircuitBreaker, cache: ProfileCache,
+                 http_client: httpx.AsyncClient,
+                 shared_cache: Optional[RedisProfileCache] = None,
+                 max_batch_size: int = 100,
+                 max_concurrency: int = 4,
+                 bulkhead: Optional[Bulkhead] = None):
+        self.base_url = base_url
+        self.breaker = breaker
+        self.cache = cache
+        self.http_client = http_client
+        self.shared_cache = shared_cache
+        self.max_batch_size = max_batch_size
+        self.bulkhead = bulkhead
+        self.single_flight = AsyncSingleFlight()
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _from_cache(self, user_ids: List[int], allow_stale: bool = False) -> Dict[int, dict]:
+        users = self.cache.get_many(user_ids, allow_stale=allow_stale)
+        missing = [user_id for user_id in user_ids if user_id not in users]
+        if missing and self.shared_cache:
+            shared_users, ages = await asyncio.to_thread(self.shared_cache.get_many, missing, allow_stale)
+            self.cache.put_many(shared_users, ages)
+            users.update(shared_users)
+        return users
+
+    async def _fetch_chunk(self, user_ids: List[int]) -> Dict[int, dict]:
+        async with self.semaphore:
+            response = await self.http_client.get(f'{self.base_url}/get_users_info',
+                                                  params={'user_ids': ','.join(str(user_id) for user_id in user_ids)})
+        if response.status_code >= 500:
+            raise _ServerError(f"profile_service answered {response.status_code}")
+        response.raise_for_status()
+        return {user['user_id']: user for user in response.json()['users']}
+
+    async def get_users_info(self, user_ids: List[int]) -> Dict[int, dict]:
+        '''Return {user_id: user_info} for every user_id that could be resolved.'''
+        user_ids = list(dict.fromkeys(user_ids))
+        users = await self._from_cache(user_ids)
+        missing = [user_id for user_id in user_ids if user_id not in users]
+        if not missing:
+            return users
+
+        # Concurrent misses of the same user_ids share one call
+        users.update(await self.single_flight.do_many(
+            missing, self._resolve, fallback=lambda keys: self._from_cache(keys, allow_stale=True)))
+        return users
+
+    async def _resolve(self, missing: List[int]) -> Dict[int, dict]:
+        '''Fetch `missing` from profile_service, falling back to stale cache entries.'''
+        if self.bulkhead and not self.bulkhead.acquire(timeout=0):
+            logger.warning("Returning cached values as the profile_service bulkhead is full")
+            PROFILE_CALLS.labels('bulkhead_full').inc()
+            return await self._from_cache(missing, allow_stale=True)
+        try:
+            return await self._fetch(missing)
+        finally:
+            if self.bulkhead:
+                self.bulkhead.release()
+
+    async def _fetch(self, missing: List[int]) -> Dict[int, dict]:
+        if not self.breaker.allow_request():
+            # Serve whatever the cache still has while the breaker is open
+            logger.info(f"Returning cached values as profile_service breaker is {self.breaker.state}")
+            PROFILE_CALLS.labels('rejected').inc()
+            return await self._from_cache(missing, allow_stale=True)
+
+        chunks = [missing[i:i + self.max_batch_size] for i in range(0, len(missing), self.max_batch_size)]
+        start = time.monotonic()
+        try:
+            logger.info(f"Hitting profile_service for user_ids: {missing} in {len(chunks)} concurrent calls")
+            results = await asyncio.gather(*(self._fetch_chunk(chunk) for chunk in chunks))
+        except httpx.HTTPStatusError:
+            # profile_service answered, it is just not a 2xx
+            self.breaker.record_success(time.monotonic() - start)
+            PROFILE_CALLS.labels('success').inc()
+            raise
+        except (httpx.HTTPError, _ServerError, ValueError, KeyError, TypeError) as e:
+            # Transport errors, timeouts, 5xx, but also undecodable bodies and invalid JSON or payloads
+            logger.error(f"Failed to reach profile_service for user_ids: {missing} ({e})")
+            self.breaker.record_failure(time.monotonic() - start)
+            PROFILE_CALLS.labels('timeout' if isinstance(e, httpx.TimeoutException) else 'failure').inc()
+            # Return cached values if available
+            return await self._from_cache(missing, allow_stale=True)
+        except BaseException:
+            # Anything else (cancellation included) still gives the breaker permit back,
+            # a HALF_OPEN breaker would otherwise wait forever for its trial call
+            self.breaker.record_failure(time.monotonic() - start)
+            PROFILE_CALLS.labels('failure').inc()
+            raise
+
+        self.breaker.record_success(time.monotonic() - start)
+        PROFILE_CALLS.labels('success').inc()
+
+        fetched = {}
+        for result in results:
+            fetched.update(result)
+        # Cache the fetched user info
+        self.cache.put_many(fetched)
+        if self.shared_cache:
+            await asyncio.to_thread(self.shared_cache.put_many, fetched)
+        return fetched
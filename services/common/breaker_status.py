@@ -0,0 +1,173 @@
+# breaker_status.py
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Callable, Optional
+
+import redis
+from loguru import logger
+
+from common.circuit_breaker import CLOSED, OPEN, CircuitBreaker
+from common.metrics import REDIS_PUBLISHES
+
+
+'''
+    breaker_status
+        BreakerStatusBroadcaster: shares a circuit breaker's state with the other
+        replicas over a Redis channel, one message per state change instead of
+        one per call.
+
+        - Local transitions map to a status: OPEN -> "DOWN", CLOSED -> "UP".
+          HALF_OPEN is a local trial and is not broadcast.
+        - The breaker listener only records the latest status. A background
+          thread publishes it `coalesce_window` seconds later, so a burst of
+          transitions gives at most one message, and nothing is sent when the
+          status equals the last one broadcast or received.
+        - Payload (JSON): {"breaker", "status", "version", "timestamp", "origin"}.
+          `version` comes from INCR on "<channel>:version" and orders messages
+          across replicas; receivers drop their own messages and any message not
+          newer than the last one they applied.
+        - A received status is applied to the local breaker without being
+          broadcast again.
+'''
+
+
+STATUS_CHANNEL = 'profile_service_status'
+UP = 'UP'
+DOWN = 'DOWN'
+
+_STATUS_BY_STATE = {OPEN: DOWN, CLOSED: UP}
+
+
+class BreakerStatusBroadcaster:
+
+    def __init__(self, breaker: CircuitBreaker, redis_client,
+                 channel: str = STATUS_CHANNEL,
+                 coalesce_window: float = 0.1,
+                 origin: Optional[str] = None,
+                 clock: Callable[[], float] = time.time):
+        self.breaker = breaker
+        self.redis_client = redis_client
+        self.channel = channel
+        self.version_key = f'{channel}:version'
+        self.coalesce_window = coalesce_window
+        self.origin = origin or f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self._clock = clock
+
+        self._cond = threading.Condition(threading.Lock())
+        # Status waiting to be published, and the last one broadcast or received
+        self._pending: Optional[str] = None
+        self._current = _STATUS_BY_STATE.get(breaker.state)
+        self._last_version = 0
+        self._thread: Optional[threading.Thread] = None
+        self.published = 0
+        self.applied = 0
+        self.ignored = 0
+
+        breaker.add_state_listener(self._on_state_change)
+
+    # Runs under the breaker lock: only record the status
+    def _on_state_change(self, old_state: str, new_state: str):
+        status = _STATUS_BY_STATE.get(new_state)
+        if status is None:
+            return
+        with self._cond:
+            self._pending = status
+            self._cond.notify()
+
+    def start(self):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f'{self.breaker.name}-status',
+                                                daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None:
+                    self._cond.wait()
+            # Let a burst of transitions settle into a single message
+            time.sleep(self.coalesce_window)
+            self.flush()
+
+    def flush(self) -> bool:
+        '''Publish the pending status if it changed; returns True if a message was sent.'''
+        with self._cond:
+            status, self._pending = self._pending, None
+            if status is None or status == self._current:
+                return False
+            self._current = status
+
+        try:
+            version = self.redis_client.incr(self.version_key)
+            self.redis_client.publish(self.channel, json.dumps({
+                'breaker': self.breaker.name,
+                'status': status,
+                'version': version,
+                'timestamp': self._clock(),
+                'origin': self.origin
+            }))
+        except redis.RedisError as e:
+            logger.error(f"Could not broadcast {self.breaker.name} status {status}: {e}")
+            with self._cond:
+                # Retried on the next transition
+                if self._current == status:
+                    self._current = None
+            return False
+
+        with self._cond:
+            self._last_version = max(self._last_version, version)
+            self.published += 1
+        REDIS_PUBLISHES.labels(self.channel, status).inc()
+        logger.info(f"Broadcast {self.breaker.name} status {status} (version {version})")
+        return True
+
+    def reset_sequence(self):
+        '''Accept any version again, e.g. after (re)subscribing to a Redis that may have lost the counter.'''
+        with self._cond:
+            self._last_version = 0
+
+    def handle_message(self, data: bytes) -> bool:
+        '''Apply a status broadcast by another replica; returns True if it was applied.'''
+        try:
+            message = json.loads(data)
+            status = message['status']
+            version = int(message['version'])
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"Ignored malformed {self.channel} message: {data!r}")
+            self.ignored += 1
+            return False
+        if message.get('breaker') != self.breaker.name or status not in (UP, DOWN):
+            self.ignored += 1
+            return False
+
+        with self._cond:
+            if message.get('origin') == self.origin or version <= self._last_version:
+                self.ignored += 1
+                return False
+            self._last_version = version
+            # The transition caused below must not be broadcast again
+            self._current = status
+            self._pending = None
+            self.applied += 1
+
+        self.breaker.apply_remote_status(status)
+        logger.info(f"{self.breaker.name} status {status} (version {version}) received from {message.get('origin')}")
+        return True
+
+    def stats(self):
+        return {'published': self.published, 'applied': self.applied, 'ignored': self.ignored}
+
+
+def broadcaster_from_env(breaker: CircuitBreaker, redis_client, channel: str = STATUS_CHANNEL) -> BreakerStatusBroadcaster:
+    '''Build a BreakerStatusBroadcaster configured through BREAKER_STATUS_* environment variables.'''
+    return BreakerStatusBroadcaster(
+        breaker,
+        redis_client,
+        channel=channel,
+        coalesce_window=float(os.getenv('BREAKER_STATUS_COALESCE_SECONDS', '0.1'))
+    )
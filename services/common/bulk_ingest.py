@@ -0,0 +1,152 @@
+# bulk_ingest.py
+import json
+import os
+import time
+from typing import Any, Callable, Dict, IO, Iterator, List, Optional, Tuple
+
+from flask import Response, stream_with_context
+from loguru import logger
+
+
+'''
+    bulk_ingest
+        Streaming NDJSON ingestion shared by the bulk endpoints (users, posts,
+        impressions), for backfills and event log replays.
+
+        - The request body is read line by line, one JSON object per line, so
+          the whole payload is never held in memory.
+        - parse(record) turns a record into a row tuple and raises ValueError
+          for an invalid record; invalid lines are skipped and reported with
+          their line number.
+        - Rows are written `chunk_size` at a time (BULK_CHUNK_SIZE, default
+          1000) by write(cur, rows), one transaction per chunk, on a pooled
+          connection that is given back between chunks. A failed chunk is
+          rolled back and reported; the following chunks are still written.
+        - The response is NDJSON as well: one result per chunk as soon as it is
+          committed (or failed), then a summary line. The chunk results are
+          sent while the body is still being read, so they are kept small (no
+          per-row ids): a client that only reads once its upload is done does
+          not fill the socket buffers and deadlock. Only the invalid lines of
+          the chunk are listed, a client sending mostly invalid lines should
+          read the response while it uploads.
+'''
+
+
+Row = Tuple
+Result = Dict[str, Any]
+
+# Range of the INT / SERIAL id columns
+INT4_MIN, INT4_MAX = -2**31, 2**31 - 1
+
+
+def read_ndjson(stream: IO[bytes]) -> Iterator[Tuple[int, Any]]:
+    '''Yield (line_number, record) for each non-empty line, record being a ValueError when the line is not JSON.'''
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as e:
+            yield line_number, ValueError(f"invalid JSON: {e}")
+
+
+def _chunks(stream: IO[bytes], parse: Callable[[Any], Row], chunk_size: int):
+    # Yields (first_line, last_line, rows, invalid) with at most chunk_size valid rows each
+    first_line, rows, invalid = None, [], []
+    line_number = 0
+    for line_number, record in read_ndjson(stream):
+        if first_line is None:
+            first_line = line_number
+        try:
+            if isinstance(record, ValueError):
+                raise record
+            if not isinstance(record, dict):
+                raise ValueError("each line must be a JSON object")
+            rows.append(parse(record))
+        except ValueError as e:
+            invalid.append({'line': line_number, 'error': str(e)})
+        if len(rows) >= chunk_size:
+            yield first_line, line_number, rows, invalid
+            first_line, rows, invalid = None, [], []
+    if first_line is not None:
+        yield first_line, line_number, rows, invalid
+
+
+def ingest_ndjson(stream: IO[bytes],
+                  parse: Callable[[Any], Row],
+                  write: Callable[[Any, List[Row]], None],
+                  get_connection: Callable,
+                  release_connection: Callable,
+                  chunk_size: int = 1000,
+                  on_commit: Optional[Callable[[], None]] = None) -> Iterator[Result]:
+    '''Write the rows of an NDJSON stream chunk by chunk, yielding one result per chunk then a summary.'''
+    summary = {'chunks': 0, 'failed_chunks': 0, 'rows': 0, 'invalid_lines': 0}
+    start = time.monotonic()
+    for index, (first_line, last_line, rows, invalid) in enumerate(_chunks(stream, parse, chunk_size)):
+        result = {'chunk': index, 'first_line': first_line, 'last_line': last_line, 'rows': 0}
+        summary['chunks'] += 1
+        summary['invalid_lines'] += len(invalid)
+        if rows:
+            conn = None
+            try:
+                conn = get_connection()
+                conn.autocommit = False
+                write(conn.cursor(), rows)
+                conn.commit()
+                result['status'] = 'committed'
+                result['rows'] = len(rows)
+                summary['rows'] += len(rows)
+                if on_commit:
+                    on_commit()
+            except Exception as e:
+                logger.error(f"Bulk chunk {index} (lines {first_line}-{last_line}) failed: {e}")
+                if conn:
+                    conn.rollback()
+                result['status'] = 'failed'
+                result['error'] = str(e)
+                summary['failed_chunks'] += 1
+            finally:
+                if conn:
+                    release_connection(conn)
+        else:
+            result['status'] = 'skipped'
+        if invalid:
+            result['invalid'] = invalid
+        yield result
+
+    summary['seconds'] = round(time.monotonic() - start, 3)
+    logger.info(f"Bulk ingestion done: {summary}")
+    yield {'summary': summary}
+
+
+def bulk_response(stream: IO[bytes], parse: Callable[[Any], Row],
+                  write: Callable[[Any, List[Row]], None],
+                  get_connection: Callable, release_connection: Callable,
+                  on_commit: Optional[Callable[[], None]] = None) -> Response:
+    '''Streamed application/x-ndjson response of ingest_ndjson() for the current request.'''
+    results = ingest_ndjson(stream, parse, write, get_connection, release_connection,
+                            chunk_size=int(os.getenv('BULK_CHUNK_SIZE', '1000')), on_commit=on_commit)
+    lines = (json.dumps(result) + '\n' for result in results)
+    return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+
+
+def required_int(record: Dict[str, Any], field: str) -> int:
+    value = record.get(field)
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f"{field} must be an integer")
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValueError(f"{field} must be an integer")
+    if not INT4_MIN <= value <= INT4_MAX:
+        raise ValueError(f"{field} must be a 32-bit integer")
+    return value
+
+
+def required_str(record: Dict[str, Any], field: str, max_length: Optional[int] = None) -> str:
+    value = record.get(field)
+    if not isinstance(value, str) or not value:
+        raise ValueError(f"{field} is required")
+    if max_length is not None and len(value) > max_length:
+        raise ValueError(f"{field} is longer than {max_length} characters")
+    return value
@@ -0,0 +1,77 @@
+# bulkhead.py
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+
+'''
+    bulkhead
+        Bulkhead: bounded number of concurrent calls to one dependency, so a slow
+        dependency holds at most `max_concurrent` request threads of a process
+        and the others keep serving requests that do not need it.
+
+        - acquire() waits at most `max_wait` seconds (default 0: never waits) for
+          a free slot and returns False when the bulkhead is full; the caller then
+          takes its fallback path instead of queueing.
+        - Every successful acquire() must be followed by exactly one release().
+        - stats() reports the calls in flight, the peak, and how many were
+          admitted / rejected.
+'''
+
+
+class Bulkhead:
+
+    def __init__(self, name: str, max_concurrent: int = 10, max_wait: float = 0.0):
+        if max_concurrent < 1:
+            raise ValueError("max_concurrent must be at least 1")
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_wait = max_wait
+        self._cond = threading.Condition(threading.Lock())
+        self._in_flight = 0
+        self._peak = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        timeout = self.max_wait if timeout is None else timeout
+        with self._cond:
+            if self._in_flight >= self.max_concurrent and timeout > 0:
+                deadline = time.monotonic() + timeout
+                while self._in_flight >= self.max_concurrent:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not self._cond.wait(remaining):
+                        break
+            if self._in_flight >= self.max_concurrent:
+                self.rejected += 1
+                return False
+            self._in_flight += 1
+            self._peak = max(self._peak, self._in_flight)
+            self.admitted += 1
+            return True
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                'in_flight': self._in_flight,
+                'max_concurrent': self.max_concurrent,
+                'peak': self._peak,
+                'admitted': self.admitted,
+                'rejected': self.rejected
+            }
+
+
+def bulkhead_from_env(name: str, default_max_concurrent: int = 4) -> Bulkhead:
+    '''Build a Bulkhead for `name` configured through <NAME>_BULKHEAD_* environment variables.'''
+    prefix = name.upper()
+    return Bulkhead(
+        name,
+        max_concurrent=int(os.getenv(f'{prefix}_BULKHEAD_MAX_CONCURRENT', str(default_max_concurrent))),
+        max_wait=float(os.getenv(f'{prefix}_BULKHEAD_MAX_WAIT_SECONDS', '0'))
+    )
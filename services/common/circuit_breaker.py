@@ -0,0 +1,200 @@
+# circuit_breaker.py
+import os
+import threading
+import time
+from typing import Callable, List, Optional
+
+from loguru import logger
+
+
+'''
+    circuit_breaker
+        CircuitBreaker with CLOSED / OPEN / HALF_OPEN states.
+
+        - CLOSED   : every call goes through, outcomes are recorded in a sliding
+                     window of the last `window_size` calls.
+        - OPEN     : calls are rejected (callers use their fallback) until
+                     `cooldown` seconds have passed since the breaker tripped.
+        - HALF_OPEN: up to `half_open_max_calls` trial calls are let through;
+                     if they all succeed the breaker closes, any failure re-opens it.
+
+        The breaker trips when, over a window holding at least `minimum_calls`
+        outcomes, the failure rate or the slow-call rate (calls slower than
+        `slow_call_duration` seconds) reaches its threshold.
+
+        The CLOSED fast path of `allow_request` reads a single attribute and takes
+        no lock; the lock is only held for O(1) counter updates. State listeners
+        (`on_state_change` / add_state_listener) run under that lock, so they must
+        be short and must not call back into the breaker.
+'''
+
+
+CLOSED = "CLOSED"
+OPEN = "OPEN"
+HALF_OPEN = "HALF_OPEN"
+
+_FAILURE = 1
+_SLOW = 2
+
+
+class CircuitBreaker:
+
+    def __init__(self,
+                 name: str,
+                 failure_rate_threshold: float = 0.5,
+                 slow_call_rate_threshold: float = 1.0,
+                 slow_call_duration: float = 1.0,
+                 window_size: int = 20,
+                 minimum_calls: int = 5,
+                 cooldown: float = 5.0,
+                 half_open_max_calls: int = 1,
+                 on_state_change: Optional[Callable[[str, str], None]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        if window_size < 1:
+            raise ValueError("window_size must be at least 1")
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.slow_call_duration = slow_call_duration
+        self.window_size = window_size
+        self.minimum_calls = min(minimum_calls, window_size)
+        self.cooldown = cooldown
+        self.half_open_max_calls = half_open_max_calls
+        self._state_listeners: List[Callable[[str, str], None]] = []
+        if on_state_change:
+            self._state_listeners.append(on_state_change)
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._retry_at = 0.0
+        self._opened_at = 0.0
+        self._half_open_in_flight = 0
+        self._half_open_successes = 0
+        self._reset_window()
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def open_for(self) -> float:
+        '''Seconds since the breaker last opened, HALF_OPEN included; 0 when it is closed.'''
+        if self._state == CLOSED:
+            return 0.0
+        return self._clock() - self._opened_at
+
+    def add_state_listener(self, listener: Callable[[str, str], None]):
+        '''Call listener(old_state, new_state) on every transition.'''
+        self._state_listeners.append(listener)
+
+    def _reset_window(self):
+        # Ring buffer of call outcomes (bit flags) plus running totals
+        self._outcomes = [0] * self.window_size
+        self._index = 0
+        self._calls = 0
+        self._failures = 0
+        self._slow_calls = 0
+
+    def allow_request(self) -> bool:
+        '''Return True if the caller may hit the protected dependency.
+
+        Every True answer must be followed by exactly one record_success or
+        record_failure call.
+        '''
+        state = self._state
+        if state == CLOSED:
+            return True
+        if state == OPEN and self._clock() < self._retry_at:
+            return False
+
+        with self._lock:
+            if self._state == OPEN:
+                if self._clock() < self._retry_at:
+                    return False
+                self._transition(HALF_OPEN)
+            if self._state == HALF_OPEN:
+                if self._half_open_in_flight >= self.half_open_max_calls:
+                    return False
+                self._half_open_in_flight += 1
+            return True
+
+    def record_success(self, duration: float = 0.0):
+        self._record(_SLOW if duration >= self.slow_call_duration else 0)
+
+    def record_failure(self, duration: float = 0.0):
+        self._record(_FAILURE | (_SLOW if duration >= self.slow_call_duration else 0))
+
+    def _record(self, outcome: int):
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+                if outcome & _FAILURE:
+                    self._trip()
+                else:
+                    self._half_open_successes += 1
+                    if self._half_open_successes >= self.half_open_max_calls:
+                        self._transition(CLOSED)
+                return
+
+            if self._state == OPEN:
+                # Late result of a call let through before the breaker tripped
+                return
+
+            evicted = self._outcomes[self._index]
+            self._outcomes[self._index] = outcome
+            self._index = (self._index + 1) % self.window_size
+            if self._calls < self.window_size:
+                self._calls += 1
+            self._failures += (outcome & _FAILURE) - (evicted & _FAILURE)
+            self._slow_calls += ((outcome & _SLOW) - (evicted & _SLOW)) >> 1
+
+            if self._calls >= self.minimum_calls and (
+                    self._failures / self._calls >= self.failure_rate_threshold or
+                    self._slow_calls / self._calls >= self.slow_call_rate_threshold):
+                self._trip()
+
+    def apply_remote_status(self, status: str):
+        '''Align the breaker with a status broadcast by another replica ("UP" / "DOWN").'''
+        with self._lock:
+            if status == "DOWN" and self._state == CLOSED:
+                self._trip()
+            elif status == "UP" and self._state != CLOSED:
+                self._transition(CLOSED)
+
+    def _trip(self):
+        self._opened_at = self._clock()
+        self._retry_at = self._opened_at + self.cooldown
+        self._transition(OPEN)
+
+    # Must be called with self._lock held
+    def _transition(self, new_state: str):
+        old_state = self._state
+        if old_state == new_state:
+            return
+        self._state = new_state
+        self._half_open_in_flight = 0
+        self._half_open_successes = 0
+        if new_state == CLOSED:
+            self._reset_window()
+        logger.info(f"Circuit breaker {self.name}: {old_state} -> {new_state}")
+        for listener in self._state_listeners:
+            try:
+                listener(old_state, new_state)
+            except Exception as e:
+                logger.error(f"Circuit breaker {self.name}: state listener failed: {e}")
+
+
+def breaker_from_env(name: str, **kwargs) -> CircuitBreaker:
+    '''Build a CircuitBreaker configured through BREAKER_* environment variables.'''
+    options = dict(
+        failure_rate_threshold=float(os.getenv('BREAKER_FAILURE_RATE', '0.5')),
+        slow_call_rate_threshold=float(os.getenv('BREAKER_SLOW_CALL_RATE', '1.0')),
+        slow_call_duration=float(os.getenv('BREAKER_SLOW_CALL_SECONDS', '1.0')),
+        window_size=int(os.getenv('BREAKER_WINDOW_SIZE', '20')),
+        minimum_calls=int(os.getenv('BREAKER_MINIMUM_CALLS', '5')),
+        cooldown=float(os.getenv('BREAKER_COOLDOWN_SECONDS', '5')),
+        half_open_max_calls=int(os.getenv('BREAKER_HALF_OPEN_CALLS', '1'))
+    )
+    # Explicit arguments win over the environment
+    options.update(kwargs)
+    return CircuitBreaker(name=name, **options)
@@ -0,0 +1,234 @@
+# db_pool.py
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import psycopg2
+from psycopg2 import extensions
+from loguru import logger
+
+
+'''
+    db_pool
+        ConnectionPool: thread-safe psycopg2 connection pool replacing
+        psycopg2.pool.SimpleConnectionPool (which is not thread-safe and fails
+        immediately once exhausted).
+
+        - getconn() waits up to `timeout` seconds for a connection when all
+          `max_size` are in use, then raises PoolTimeout.
+        - A connection idle for more than `check_after_idle` seconds is checked
+          with `SELECT 1` before being handed out; broken ones are replaced.
+        - Connections older than `max_lifetime` seconds are closed and replaced
+          on checkout / return, so server-side resources are recycled.
+        - putconn() rolls back any open transaction before the connection is
+          reused.
+        - stats() reports size, in-use, idle, waiters, wait counts and times,
+          and timeouts for monitoring; ping() backs the readiness checks.
+'''
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class _PooledConnection:
+    __slots__ = ('conn', 'created_at', 'last_used')
+
+    def __init__(self, conn, now: float):
+        self.conn = conn
+        self.created_at = now
+        self.last_used = now
+
+
+class ConnectionPool:
+
+    def __init__(self,
+                 connect: Callable[[], "extensions.connection"],
+                 min_size: int = 1,
+                 max_size: int = 10,
+                 timeout: float = 5.0,
+                 max_lifetime: float = 1800.0,
+                 check_after_idle: float = 10.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.check_after_idle = check_after_idle
+        self._clock = clock
+
+        self._cond = threading.Condition(threading.Lock())
+        self._idle: List[_PooledConnection] = []
+        self._in_use: Dict[int, _PooledConnection] = {}
+        # Connections being opened, or checked / rolled back between _idle and _in_use,
+        # count towards max_size
+        self._opening = 0
+        self._checking = 0
+        self._waiters = 0
+        self._waits = 0
+        self._wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+        self._timeouts = 0
+        self._closed = False
+
+        for _ in range(min_size):
+            self._idle.append(_PooledConnection(self._connect(), self._clock()))
+
+    def _size(self) -> int:
+        return len(self._idle) + len(self._in_use) + self._opening + self._checking
+
+    def getconn(self, timeout: Optional[float] = None):
+        timeout = self.timeout if timeout is None else timeout
+        start = self._clock()
+        deadline = start + timeout
+        waited = False
+        while True:
+            with self._cond:
+                while not self._idle and self._size() >= self.max_size:
+                    if self._closed:
+                        raise PoolTimeout("connection pool is closed")
+                    remaining = deadline - self._clock()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(f"no database connection available after {timeout}s "
+                                          f"({len(self._in_use)} in use)")
+                    waited = True
+                    self._waiters += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiters -= 1
+                if waited:
+                    wait_seconds = self._clock() - start
+                    self._waits += 1
+                    self._wait_seconds += wait_seconds
+                    self._max_wait_seconds = max(self._max_wait_seconds, wait_seconds)
+                    waited = False
+                if self._idle:
+                    pooled = self._idle.pop()
+                    self._checking += 1
+                else:
+                    pooled = None
+                    self._opening += 1
+
+            if pooled is None:
+                try:
+                    pooled = _PooledConnection(self._connect(), self._clock())
+                finally:
+                    with self._cond:
+                        self._opening -= 1
+                        if pooled is None:
+                            self._cond.notify()
+            else:
+                try:
+                    usable = self._usable(pooled)
+                except BaseException:
+                    self._discard(pooled)
+                    raise
+                if not usable:
+                    self._discard(pooled)
+                    continue
+                with self._cond:
+                    self._checking -= 1
+
+            with self._cond:
+                self._in_use[id(pooled.conn)] = pooled
+            return pooled.conn
+
+    def _usable(self, pooled: _PooledConnection) -> bool:
+        now = self._clock()
+        if pooled.conn.closed or now - pooled.created_at > self.max_lifetime:
+            return False
+        if now - pooled.last_used > self.check_after_idle:
+            try:
+                with pooled.conn.cursor() as cur:
+                    cur.execute('SELECT 1')
+                pooled.conn.rollback()
+            except psycopg2.Error as e:
+                logger.error(f"Dropping broken database connection: {e}")
+                return False
+        return True
+
+    # `pooled` was counted in _checking
+    def _discard(self, pooled: _PooledConnection):
+        try:
+            pooled.conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._checking -= 1
+            self._cond.notify()
+
+    def putconn(self, conn, close: bool = False):
+        with self._cond:
+            pooled = self._in_use.pop(id(conn), None)
+            if pooled is not None:
+                self._checking += 1
+        if pooled is None:
+            raise ValueError("connection does not belong to this pool")
+
+        if not close and not conn.closed:
+            try:
+                if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                close = True
+        if close or conn.closed or self._closed or self._clock() - pooled.created_at > self.max_lifetime:
+            self._discard(pooled)
+            return
+
+        pooled.last_used = self._clock()
+        with self._cond:
+            self._checking -= 1
+            self._idle.append(pooled)
+            self._cond.notify()
+
+    def ping(self, timeout: float = 1.0):
+        '''Run SELECT 1 on a pooled connection; raises PoolTimeout or psycopg2.Error when the database is not usable.'''
+        conn = self.getconn(timeout)
+        close = False
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+        except psycopg2.Error:
+            close = True
+            raise
+        finally:
+            self.putconn(conn, close=close)
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for pooled in idle:
+            pooled.conn.close()
+
+    def stats(self) -> Dict[str, float]:
+        with self._cond:
+            return {
+                'size': self._size(),
+                'max_size': self.max_size,
+                'in_use': len(self._in_use),
+                'idle': len(self._idle),
+                'waiters': self._waiters,
+                'waits': self._waits,
+                'wait_seconds_total': round(self._wait_seconds, 6),
+                'wait_seconds_max': round(self._max_wait_seconds, 6),
+                'timeouts': self._timeouts
+            }
+
+
+def pool_from_env(**connect_kwargs) -> ConnectionPool:
+    '''Build a ConnectionPool configured through DB_POOL_* environment variables.'''
+    return ConnectionPool(
+        lambda: psycopg2.connect(**connect_kwargs),
+        min_size=int(os.getenv('DB_POOL_MIN_SIZE', '1')),
+        max_size=int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+        timeout=float(os.getenv('DB_POOL_TIMEOUT_SECONDS', '5')),
+        max_lifetime=float(os.getenv('DB_POOL_MAX_LIFETIME_SECONDS', '1800')),
+        check_after_idle=float(os.getenv('DB_POOL_CHECK_AFTER_IDLE_SECONDS', '10'))
+    )
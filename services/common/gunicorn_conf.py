@@ -0,0 +1,43 @@
+# gunicorn_conf.py
+import os
+
+
+'''
+    gunicorn_conf
+        Production serving configuration shared by the three services:
+            gunicorn -c common/gunicorn_conf.py "post_server:create_app()"
+
+        - WEB_WORKERS        : worker processes (default 2)
+        - WEB_THREADS        : threads per worker (gthread workers, default 8)
+        - WEB_TIMEOUT        : seconds before a silent worker is restarted (default 30)
+        - PORT               : port to bind on 0.0.0.0
+        - PROMETHEUS_MULTIPROC_DIR : when set, /metrics aggregates all workers
+
+        The app is not preloaded: every worker imports the service after the
+        fork and its create_app() builds the DB pool and starts the Redis status
+        listener inside that worker, so no connection or thread is shared across
+        processes.
+
+        Every worker has its own DB pool of up to DB_POOL_MAX_SIZE connections,
+        so a service can open WEB_WORKERS * DB_POOL_MAX_SIZE connections and the
+        sum over the three services must stay below Postgres's max_connections
+        (100 by default). Hence the small default instead of 2 * cores + 1; scale
+        with threads, or raise max_connections / put PgBouncer in front first.
+'''
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('WEB_WORKERS', '2'))
+threads = int(os.getenv('WEB_THREADS', '8'))
+worker_class = 'gthread'
+timeout = int(os.getenv('WEB_TIMEOUT', '30'))
+keepalive = 5
+preload_app = False
+accesslog = '-'
+errorlog = '-'
+
+
+def child_exit(server, worker):
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,132 @@
+# health.py
+import asyncio
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from flask import Flask, jsonify
+from loguru import logger
+
+
+'''
+    health
+        Liveness and readiness endpoints shared by the services.
+
+        - GET /healthz: the process is up and serving; no I/O at all, so it can
+          be polled at high frequency (the health probers poll profile_service's).
+        - GET /readyz: every dependency check passed (e.g. a DB pool connection
+          answers SELECT 1, Redis answers PING). 200 when ready, 503 otherwise,
+          with the outcome of each check.
+
+        ReadinessCheck caches the outcome for `ttl` seconds (READINESS_CACHE_SECONDS,
+        default 0.5), so probes hitting /readyz at any rate cost each dependency at
+        most one check per process per `ttl`. Only one thread (or coroutine, for
+        async_status) refreshes an expired result; the others keep answering with
+        the previous one meanwhile. Async checks fail after `timeout` seconds
+        (READINESS_CHECK_TIMEOUT_SECONDS, default 1), so an exhausted pool cannot
+        make /readyz hang.
+'''
+
+
+Result = Tuple[bool, Dict[str, str]]
+
+
+class ReadinessCheck:
+
+    def __init__(self, checks: Dict[str, Callable], ttl: float = 0.5,
+                 clock: Callable[[], float] = time.monotonic, timeout: float = 1.0):
+        # name -> callable raising when the dependency is not usable (coroutine functions for async_status)
+        self.checks = checks
+        self.ttl = ttl
+        self.timeout = timeout
+        self._clock = clock
+        self._async_refresh: Optional[asyncio.Future] = None
+        self._refresh_lock = threading.Lock()
+        self._result: Optional[Result] = None
+        self._expires_at = 0.0
+
+    def _store(self, outcomes: Dict[str, Optional[Exception]]) -> Result:
+        details = {}
+        for name, error in outcomes.items():
+            details[name] = 'ok' if error is None else f'{type(error).__name__}: {error}'
+        ready = all(error is None for error in outcomes.values())
+        if self._result is not None and ready != self._result[0]:
+            logger.info(f"Readiness changed to {ready}: {details}")
+        self._result = (ready, details)
+        self._expires_at = self._clock() + self.ttl
+        return self._result
+
+    def status(self) -> Result:
+        result = self._result
+        if result is not None and self._clock() < self._expires_at:
+            return result
+
+        if not self._refresh_lock.acquire(blocking=result is None):
+            # Another thread is running the checks, answer with the previous result
+            return result
+        try:
+            if self._result is not None and self._clock() < self._expires_at:
+                return self._result
+            outcomes = {}
+            for name, check in self.checks.items():
+                try:
+                    check()
+                    outcomes[name] = None
+                except Exception as e:
+                    outcomes[name] = e
+            return self._store(outcomes)
+        finally:
+            self._refresh_lock.release()
+
+    async def async_status(self) -> Result:
+        '''status() for checks that are coroutine functions, run concurrently.'''
+        result = self._result
+        if result is not None and self._clock() < self._expires_at:
+            return result
+        if self._async_refresh is None:
+            self._async_refresh = asyncio.ensure_future(self._refresh_async())
+        elif result is not None:
+            # Another request is running the checks, answer with the previous result
+            return result
+        # Shielded: a cancelled request does not cancel the refresh the others wait for
+        return await asyncio.shield(self._async_refresh)
+
+    async def _refresh_async(self) -> Result:
+        try:
+            names = list(self.checks)
+            results = await asyncio.gather(*(_run_async(self.checks[name], self.timeout) for name in names),
+                                           return_exceptions=True)
+            return self._store({name: result if isinstance(result, Exception) else None
+                                for name, result in zip(names, results)})
+        finally:
+            self._async_refresh = None
+
+
+async def _run_async(check: Callable, timeout: float):
+    # Errors raised before the coroutine is created are reported like the others
+    try:
+        await asyncio.wait_for(check(), timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"no answer within {timeout}s")
+
+
+def readiness_from_env(checks: Dict[str, Callable]) -> ReadinessCheck:
+    return ReadinessCheck(checks, ttl=float(os.getenv('READINESS_CACHE_SECONDS', '0.5')),
+                          timeout=float(os.getenv('READINESS_CHECK_TIMEOUT_SECONDS', '1')))
+
+
+def init_health(app: Flask, checks: Dict[str, Callable[[], None]]) -> ReadinessCheck:
+    '''Serve /healthz and /readyz on `app`; `checks` maps a dependency name to a callable raising when it is down.'''
+    readiness = readiness_from_env(checks)
+
+    @app.route('/healthz', methods=['GET'])
+    def healthz():
+        return jsonify({'status': 'ok'}), 200
+
+    @app.route('/readyz', methods=['GET'])
+    def readyz():
+        ready, details = readiness.status()
+        return jsonify({'status': 'ready' if ready else 'not ready', 'checks': details}), 200 if ready else 503
+
+    return readiness
@@ -0,0 +1,162 @@
+# health_prober.py
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+import redis
+import requests
+from loguru import logger
+
+from common.breaker_status import DOWN, UP
+from common.circuit_breaker import CircuitBreaker
+
+
+'''
+    health_prober
+        HealthProber: background GET <url>/healthz with a short timeout that
+        drives a circuit breaker, so user requests never serve as recovery probes.
+
+        - One replica probes at a time: the prober holding the Redis key
+          `lock_key` (renewed every `interval`, expiring after `lock_ttl`) is the
+          leader; the others only retry to take over the key. If Redis is
+          unreachable, every replica probes for itself.
+        - After `fall` failed probes in a row the leader opens its breaker; after
+          `rise` successful ones it closes it again (from OPEN or HALF_OPEN), but
+          not before `min_open` seconds since the breaker opened. The transitions are broadcast by
+          common.breaker_status, so the other replicas follow the leader.
+        - The breaker's own cooldown is raised to `fallback_cooldown`: its
+          time-based HALF_OPEN trial on user traffic is only a fallback for when
+          no prober reports back.
+        - Probes use their own session, so they never wait on the pool used by
+          user requests.
+'''
+
+
+class HealthProber:
+
+    def __init__(self, breaker: CircuitBreaker, base_url: str, redis_client,
+                 origin: str,
+                 interval: float = 1.0,
+                 timeout: float = 0.2,
+                 rise: int = 2,
+                 fall: int = 2,
+                 min_open: float = 5.0,
+                 fallback_cooldown: Optional[float] = 30.0,
+                 lock_key: Optional[str] = None,
+                 lock_ttl: Optional[float] = None,
+                 session: Optional[requests.Session] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.breaker = breaker
+        self.url = f'{base_url}/healthz'
+        self.redis_client = redis_client
+        self.origin = origin
+        self.interval = interval
+        self.timeout = timeout
+        self.rise = rise
+        self.fall = fall
+        self.min_open = min_open
+        self.lock_key = lock_key or f'{breaker.name}:prober'
+        self.lock_ttl = lock_ttl or 3 * interval
+        self.session = session or requests.Session()
+        self._clock = clock
+        if fallback_cooldown is not None:
+            breaker.cooldown = max(breaker.cooldown, fallback_cooldown)
+
+        self._successes = 0
+        self._failures = 0
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.is_leader = False
+        self.probes = 0
+        self.probe_failures = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f'{self.breaker.name}-prober', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        logger.info(f"Starting {self.breaker.name} health prober on {self.url}")
+        while not self._stopped.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"{self.breaker.name} health prober failed: {e}")
+
+    def _acquire_leadership(self) -> bool:
+        # Compare-and-set on the lock key: take it when free, renew it when ours
+        try:
+            with self.redis_client.pipeline() as pipe:
+                pipe.watch(self.lock_key)
+                holder = pipe.get(self.lock_key)
+                if holder is not None and holder.decode() != self.origin:
+                    leader = False
+                else:
+                    pipe.multi()
+                    pipe.set(self.lock_key, self.origin, px=int(self.lock_ttl * 1000))
+                    pipe.execute()
+                    leader = True
+        except redis.WatchError:
+            leader = False
+        except redis.RedisError as e:
+            logger.warning(f"{self.breaker.name} prober election unavailable ({e}), probing locally")
+            leader = True
+
+        if leader != self.is_leader:
+            logger.info(f"{self.breaker.name} prober {self.origin}: leader={leader}")
+            self.is_leader = leader
+            self._successes = self._failures = 0
+        return leader
+
+    def probe(self) -> bool:
+        try:
+            response = self.session.get(self.url, timeout=(self.timeout, self.timeout))
+            return response.status_code == 200
+        except requests.exceptions.RequestException:
+            return False
+
+    def run_once(self) -> Optional[bool]:
+        '''Probe once if this replica is the leader; returns the probe result, None when not leading.'''
+        if not self._acquire_leadership():
+            return None
+
+        healthy = self.probe()
+        self.probes += 1
+        if healthy:
+            self._successes += 1
+            self._failures = 0
+        else:
+            self.probe_failures += 1
+            self._failures += 1
+            self._successes = 0
+
+        if not healthy and self._failures >= self.fall:
+            self.breaker.apply_remote_status(DOWN)
+        elif healthy and self._successes >= self.rise and self.breaker.open_for() >= self.min_open:
+            self.breaker.apply_remote_status(UP)
+        return healthy
+
+    def stats(self):
+        return {'leader': int(self.is_leader), 'probes': self.probes, 'probe_failures': self.probe_failures}
+
+
+def prober_from_env(breaker: CircuitBreaker, base_url: str, redis_client, origin: str) -> Optional[HealthProber]:
+    '''Build a HealthProber configured through HEALTH_PROBE_* environment variables, None if disabled.'''
+    if os.getenv('HEALTH_PROBE_ENABLED', 'true').lower() not in ('1', 'true', 'yes'):
+        return None
+    return HealthProber(
+        breaker,
+        base_url,
+        redis_client,
+        origin,
+        interval=float(os.getenv('HEALTH_PROBE_INTERVAL_SECONDS', '1')),
+        timeout=float(os.getenv('HEALTH_PROBE_TIMEOUT_SECONDS', '0.2')),
+        rise=int(os.getenv('HEALTH_PROBE_RISE', '2')),
+        fall=int(os.getenv('HEALTH_PROBE_FALL', '2')),
+        min_open=float(os.getenv('HEALTH_PROBE_MIN_OPEN_SECONDS', '5')),
+        fallback_cooldown=float(os.getenv('HEALTH_PROBE_FALLBACK_COOLDOWN_SECONDS', '30'))
+    )
@@ -0,0 +1,41 @@
+# http_client.py
+import os
+from typing import Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+'''
+    http_client
+        Keep-alive, connection-pooled requests.Session for service to service calls.
+
+        - HTTP_POOL_SIZE           : connections kept open per host (default 20)
+        - HTTP_POOL_BLOCK          : wait for a free connection instead of opening
+                                     throw-away ones when the pool is exhausted
+        - HTTP_CONNECT_TIMEOUT     : seconds to establish a connection (default 0.5)
+        - HTTP_READ_TIMEOUT        : seconds to wait for the response (default 2)
+
+        Every call made through the session must pass `timeout=` so that a hung
+        dependency fails fast instead of holding a worker thread forever.
+'''
+
+
+def session_from_env() -> requests.Session:
+    pool_size = int(os.getenv('HTTP_POOL_SIZE', '20'))
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        pool_block=os.getenv('HTTP_POOL_BLOCK', 'false').lower() in ('1', 'true', 'yes'),
+        max_retries=0
+    )
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def timeout_from_env() -> Tuple[float, float]:
+    '''(connect, read) timeout tuple accepted by requests.'''
+    return (float(os.getenv('HTTP_CONNECT_TIMEOUT', '0.5')),
+            float(os.getenv('HTTP_READ_TIMEOUT', '2')))
@@ -0,0 +1,140 @@
+# metrics.py
+import os
+import time
+from typing import Callable, Dict, Iterable
+
+from flask import Flask, Response, g, request
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from common.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+'''
+    metrics
+        Prometheus instrumentation shared by the services, served at GET /metrics.
+
+        - http_request_duration_seconds{route,method,status}: request latency
+        - circuit_breaker_state{breaker}: 0 closed, 1 half-open, 2 open
+        - circuit_breaker_transitions_total{breaker,from_state,to_state}
+        - profile_service_calls_total{outcome}: success / failure / timeout /
+          rejected (breaker open)
+        - redis_publish_total{channel,message}
+        - db_round_trips_per_request{route}
+        - <source>_<stat>: read from the stats() of the DB pool and the profile
+          caches at scrape time, so the hot path pays nothing for them
+
+        Under gunicorn with several workers, set PROMETHEUS_MULTIPROC_DIR so that
+        counters and histograms are aggregated across workers; the stats()
+        based metrics then describe the worker that answered the scrape.
+'''
+
+
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'Request latency per route',
+                            ['route', 'method', 'status'])
+BREAKER_STATE = Gauge('circuit_breaker_state', 'Circuit breaker state: 0 closed, 1 half-open, 2 open',
+                      ['breaker'], multiprocess_mode='max')
+BREAKER_TRANSITIONS = Counter('circuit_breaker_transitions_total', 'Circuit breaker state transitions',
+                              ['breaker', 'from_state', 'to_state'])
+PROFILE_CALLS = Counter('profile_service_calls_total', 'Calls to profile_service by outcome', ['outcome'])
+REDIS_PUBLISHES = Counter('redis_publish_total', 'Messages published to Redis', ['channel', 'message'])
+DB_ROUND_TRIPS = Histogram('db_round_trips_per_request', 'Database round trips made per request', ['route'],
+                           buckets=(0, 1, 2, 3, 4, 6, 8, 12, 16))
+
+_BREAKER_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class _StatsCollector:
+
+    def __init__(self):
+        self.sources: Dict[str, tuple] = {}
+
+    def collect(self):
+        for prefix, (stats, counters) in self.sources.items():
+            for key, value in stats().items():
+                name = f'{prefix}_{key}'
+                if key in counters:
+                    family = CounterMetricFamily(name, f'{prefix} {key}')
+                else:
+                    family = GaugeMetricFamily(name, f'{prefix} {key}')
+                family.add_metric([], value)
+                yield family
+
+
+_stats_collector = _StatsCollector()
+
+
+def register_stats(prefix: str, stats: Callable[[], Dict[str, float]], counters: Iterable[str] = ()):
+    '''Export stats() as <prefix>_<key> metrics; keys listed in `counters` are exported as counters.'''
+    _stats_collector.sources[prefix] = (stats, set(counters))
+
+
+def observe_breaker(breaker: CircuitBreaker):
+    BREAKER_STATE.labels(breaker.name).set(_BREAKER_STATE_VALUES[breaker.state])
+
+    def on_state_change(old_state: str, new_state: str):
+        BREAKER_STATE.labels(breaker.name).set(_BREAKER_STATE_VALUES[new_state])
+        BREAKER_TRANSITIONS.labels(breaker.name, old_state, new_state).inc()
+
+    breaker.add_state_listener(on_state_change)
+
+
+_registry = None
+
+
+def _get_registry() -> CollectorRegistry:
+    global _registry
+    if _registry is None:
+        if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+            _registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(_registry)
+        else:
+            _registry = REGISTRY
+        _registry.register(_stats_collector)
+    return _registry
+
+
+def init_metrics(app: Flask):
+    '''Time every request of `app` and serve the metrics at /metrics.'''
+    registry = _get_registry()
+
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def observe_request(response):
+        start = g.get('request_start')
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            REQUEST_LATENCY.labels(route, request.method, response.status_code).observe(time.perf_counter() - start)
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+
+def init_async_metrics(app):
+    '''init_metrics for a Quart `app` (asyncio serving mode).'''
+    # Only the async Feed service needs Quart
+    from quart import Response as QuartResponse, g as quart_g, request as quart_request
+    registry = _get_registry()
+
+    @app.before_request
+    async def start_timer():
+        quart_g.request_start = time.perf_counter()
+
+    @app.after_request
+    async def observe_request(response):
+        start = getattr(quart_g, 'request_start', None)
+        if start is not None:
+            route = quart_request.url_rule.rule if quart_request.url_rule else 'unmatched'
+            REQUEST_LATENCY.labels(route, quart_request.method, response.status_code).observe(
+                time.perf_counter() - start)
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    async def metrics():
+        return QuartResponse(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
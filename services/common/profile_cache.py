@@ -0,0 +1,58 @@
+# profile_cache.py
+import os
+import time
+from typing import Callable, Optional
+
+import redis
+
+from common.ttl_cache import RedisTTLCache, TTLCache
+
+
+'''
+    profile_cache
+        ProfileCache / RedisProfileCache: the TTL caches of common.ttl_cache set
+        up for profiles, whose stale entries are served for `max_stale` seconds
+        as a fallback while profile_service is unavailable. The shared tier
+        stores `profile:<user_id>` keys.
+'''
+
+
+class ProfileCache(TTLCache):
+
+    def __init__(self,
+                 max_entries: int = 10000,
+                 ttl: float = 60.0,
+                 max_stale: float = 3600.0,
+                 clock: Callable[[], float] = time.monotonic):
+        super().__init__(max_entries=max_entries, ttl=ttl, max_stale=max_stale, clock=clock)
+
+
+class RedisProfileCache(RedisTTLCache):
+
+    def __init__(self,
+                 redis_client: redis.Redis,
+                 ttl: float = 60.0,
+                 max_stale: float = 3600.0,
+                 key_prefix: str = 'profile:',
+                 clock: Callable[[], float] = time.time):
+        super().__init__(redis_client, key_prefix, ttl=ttl, max_stale=max_stale, clock=clock)
+
+
+def cache_from_env() -> ProfileCache:
+    '''Build a ProfileCache configured through PROFILE_CACHE_* environment variables.'''
+    return ProfileCache(
+        max_entries=int(os.getenv('PROFILE_CACHE_MAX_ENTRIES', '10000')),
+        ttl=float(os.getenv('PROFILE_CACHE_TTL_SECONDS', '60')),
+        max_stale=float(os.getenv('PROFILE_CACHE_MAX_STALE_SECONDS', '3600'))
+    )
+
+
+def shared_cache_from_env(redis_client: redis.Redis) -> Optional[RedisProfileCache]:
+    '''Build the shared Redis tier if PROFILE_CACHE_REDIS is enabled, else return None.'''
+    if os.getenv('PROFILE_CACHE_REDIS', 'false').lower() not in ('1', 'true', 'yes'):
+        return None
+    return RedisProfileCache(
+        redis_client,
+        ttl=float(os.getenv('PROFILE_CACHE_TTL_SECONDS', '60')),
+        max_stale=float(os.getenv('PROFILE_CACHE_MAX_STALE_SECONDS', '3600'))
+    )
@@ -0,0 +1,163 @@
+# profile_client.py
+import time
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from loguru import logger
+
+from common.bulkhead import Bulkhead
+from common.circuit_breaker import CircuitBreaker
+from common.metrics import PROFILE_CALLS
+from common.profile_cache import ProfileCache, RedisProfileCache
+from common.single_flight import SingleFlight
+
+
+'''
+    profile_client
+        ProfileClient: breaker-protected, cached access to profile_service shared
+        by post_service and feed_service.
+
+        - Fresh cache hits are served without calling profile_service; the
+          in-process cache is checked first, then the optional shared Redis tier
+          (whose hits are copied into the in-process cache).
+        - Misses are resolved with calls to /get_users_info of at most
+          `max_batch_size` ids (profile_service's MAX_BATCH_SIZE) while the
+          breaker allows it; the result is cached. Calls go through a pooled
+          keep-alive session with connect/read timeouts.
+        - Connection errors, timeouts, 5xx answers and unreadable bodies count as
+          breaker failures; every call let through by the breaker records
+          exactly one outcome, whatever it raises.
+        - Concurrent misses for the same user_id share one in-flight call
+          (single-flight); only the thread leading that call takes a bulkhead
+          slot and a breaker permit. The others are served a stale cache entry
+          right away when there is one, and only wait for the call otherwise.
+        - An optional bulkhead bounds the calls in flight; when it is full the
+          call is not made and misses are served from stale cache entries, so a
+          slow profile_service cannot hold every request thread.
+        - While the breaker is open, or when the call fails, misses are served
+          from stale cache entries (stale-while-unavailable) where available.
+        - Nothing is published per call; breaker state changes are shared with
+          the other replicas by common.breaker_status.
+'''
+
+
+class ProfileClient:
+
+    def __init__(self, base_url: str, breaker: CircuitBreaker, cache: ProfileCache,
+                 shared_cache: Optional[RedisProfileCache] = None,
+                 session: Optional[requests.Session] = None,
+                 timeout: Tuple[float, float] = (0.5, 2.0),
+                 bulkhead: Optional[Bulkhead] = None,
+                 max_batch_size: int = 100):
+        self.base_url = base_url
+        self.session = session or requests.Session()
+        self.timeout = timeout
+        self.breaker = breaker
+        self.cache = cache
+        self.shared_cache = shared_cache
+        self.bulkhead = bulkhead
+        self.max_batch_size = max_batch_size
+        self.single_flight = SingleFlight()
+
+    def _from_cache(self, user_ids: List[int], allow_stale: bool = False) -> Dict[int, dict]:
+        users = self.cache.get_many(user_ids, allow_stale=allow_stale)
+        missing = [user_id for user_id in user_ids if user_id not in users]
+        if missing and self.shared_cache:
+            shared_users, ages = self.shared_cache.get_many(missing, allow_stale=allow_stale)
+            self.cache.put_many(shared_users, ages)
+            users.update(shared_users)
+        return users
+
+    def get_users_info(self, user_ids: List[int]) -> Dict[int, dict]:
+        '''Return {user_id: user_info} for every user_id that could be resolved.'''
+        user_ids = list(dict.fromkeys(user_ids))
+        users = self._from_cache(user_ids)
+        missing = [user_id for user_id in user_ids if user_id not in users]
+        if not missing:
+            return users
+
+        # Concurrent misses of the same user_ids share one call; while it runs the
+        # other callers get stale entries at once rather than wait outside the bulkhead
+        users.update(self.single_flight.do_many(missing, self._resolve, timeout=self._max_call_seconds(len(missing)),
+                                                fallback=lambda keys: self._from_cache(keys, allow_stale=True)))
+        return users
+
+    def _max_call_seconds(self, count: int) -> float:
+        calls = -(-count // self.max_batch_size)
+        return sum(self.timeout) * calls + (self.bulkhead.max_wait if self.bulkhead else 0.0)
+
+    def _resolve(self, missing: List[int]) -> Dict[int, dict]:
+        '''Fetch `missing` from profile_service, falling back to stale cache entries.'''
+        if self.bulkhead and not self.bulkhead.acquire():
+            # Too many calls already waiting on profile_service, don't add one more
+            logger.warning("Returning cached values as the profile_service bulkhead is full")
+            PROFILE_CALLS.labels('bulkhead_full').inc()
+            return self._from_cache(missing, allow_stale=True)
+        try:
+            return self._fetch(missing)
+        finally:
+            if self.bulkhead:
+                self.bulkhead.release()
+
+    def _fetch(self, missing: List[int]) -> Dict[int, dict]:
+        if not self.breaker.allow_request():
+            # Serve whatever the cache still has while the breaker is open
+            logger.info(f"Returning cached values as profile_service breaker is {self.breaker.state}")
+            PROFILE_CALLS.labels('rejected').inc()
+            return self._from_cache(missing, allow_stale=True)
+
+        # profile_service takes at most max_batch_size user_ids per call; the
+        # chunks are fetched one after the other and count as one breaker call
+        chunks = [missing[i:i + self.max_batch_size] for i in range(0, len(missing), self.max_batch_size)]
+        fetched = {}
+        slowest = 0.0
+        start = time.monotonic()
+        try:
+            logger.info(f"Hitting profile_service for user_ids: {missing} in {len(chunks)} calls")
+            for chunk in chunks:
+                start = time.monotonic()
+                fetched.update(self._fetch_chunk(chunk))
+                slowest = max(slowest, time.monotonic() - start)
+        except requests.exceptions.HTTPError:
+            # profile_service answered, it is just not a 2xx
+            self.breaker.record_success(max(slowest, time.monotonic() - start))
+            PROFILE_CALLS.labels('success').inc()
+            raise
+        except (requests.exceptions.RequestException, ValueError, KeyError, TypeError) as e:
+            # Connection errors, timeouts, 5xx, but also truncated or undecodable bodies and invalid JSON or payloads
+            logger.error(f"Failed to reach profile_service for user_ids: {missing} ({e})")
+            self.breaker.record_failure(max(slowest, time.monotonic() - start))
+            PROFILE_CALLS.labels('timeout' if isinstance(e, requests.exceptions.Timeout) else 'failure').inc()
+            # Keep the chunks already fetched, return cached values for the others if available
+            self._store(fetched)
+            users = self._from_cache([user_id for user_id in missing if user_id not in fetched], allow_stale=True)
+            users.update(fetched)
+            return users
+        except BaseException:
+            # Anything else still gives the breaker permit back, a HALF_OPEN breaker
+            # would otherwise wait forever for the result of its trial call
+            self.breaker.record_failure(max(slowest, time.monotonic() - start))
+            PROFILE_CALLS.labels('failure').inc()
+            raise
+
+        self.breaker.record_success(slowest)
+        PROFILE_CALLS.labels('success').inc()
+        self._store(fetched)
+        return fetched
+
+    def _fetch_chunk(self, user_ids: List[int]) -> Dict[int, dict]:
+        response = self.session.get(f'{self.base_url}/get_users_info',
+                                    params={'user_ids': ','.join(str(user_id) for user_id in user_ids)},
+                                    timeout=self.timeout)
+        if response.status_code >= 500:
+            raise requests.exceptions.ConnectionError(f"profile_service answered {response.status_code}")
+        response.raise_for_status()  # Raise exception if the response is not 2xx
+        return {user['user_id']: user for user in response.json()['users']}
+
+    def _store(self, fetched: Dict[int, dict]):
+        # Cache the fetched user info
+        if not fetched:
+            return
+        self.cache.put_many(fetched)
+        if self.shared_cache:
+            self.shared_cache.put_many(fetched)
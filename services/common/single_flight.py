@@ -0,0 +1,134 @@
+# single_flight.py
+import asyncio
+import threading
+from typing import Awaitable, Callable, Dict, Hashable, Iterable, List, Optional
+
+
+'''
+    single_flight
+        Request coalescing: concurrent lookups of the same key share one
+        in-flight fetch instead of each calling the dependency.
+
+        - do_many(keys, fetch) calls fetch() once for the keys nobody is fetching
+          yet (this caller leads that flight) and waits for the flights already
+          in progress for the other keys (this caller follows them).
+        - fetch(keys) returns {key: value} for the keys it could resolve; a key
+          missing from the result, or a fetch that raised, leaves the followers
+          of that key without a value (they do not retry on their own).
+        - fallback(keys), when given, is called for the keys this caller would
+          follow: the keys it resolves are returned at once instead of waiting
+          for their flight (e.g. stale cache entries), so followers of a slow
+          fetch do not wait outside the bulkhead that bounds the leader.
+        - A flight only lives while its fetch runs, nothing is cached here.
+
+        SingleFlight is for threads, AsyncSingleFlight for coroutines of one
+        event loop.
+'''
+
+
+class _Flight:
+    __slots__ = ('done', 'result')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Dict = {}
+
+
+class SingleFlight:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.flights = 0
+        self.shared_keys = 0
+
+    def do_many(self, keys: Iterable[Hashable], fetch: Callable[[List[Hashable]], Dict],
+                timeout: Optional[float] = None,
+                fallback: Optional[Callable[[List[Hashable]], Dict]] = None) -> Dict:
+        flight = _Flight()
+        leading: List[Hashable] = []
+        following: Dict[Hashable, _Flight] = {}
+        with self._lock:
+            for key in keys:
+                other = self._flights.get(key)
+                if other is None:
+                    self._flights[key] = flight
+                    leading.append(key)
+                else:
+                    following[key] = other
+            if leading:
+                self.flights += 1
+            self.shared_keys += len(following)
+
+        found = fallback(list(following)) if following and fallback else {}
+        if leading:
+            try:
+                flight.result = fetch(leading)
+                found.update(flight.result)
+            finally:
+                with self._lock:
+                    for key in leading:
+                        if self._flights.get(key) is flight:
+                            del self._flights[key]
+                flight.done.set()
+
+        for key, other in following.items():
+            if key in found:
+                continue
+            if other.done.wait(timeout) and key in other.result:
+                found[key] = other.result[key]
+        return found
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'in_flight_keys': len(self._flights), 'flights': self.flights, 'shared_keys': self.shared_keys}
+
+
+class AsyncSingleFlight:
+
+    def __init__(self):
+        self._flights: Dict[Hashable, asyncio.Future] = {}
+        self.flights = 0
+        self.shared_keys = 0
+
+    async def do_many(self, keys: Iterable[Hashable], fetch: Callable[[List[Hashable]], Awaitable[Dict]],
+                      fallback: Optional[Callable[[List[Hashable]], Awaitable[Dict]]] = None) -> Dict:
+        flight: Optional[asyncio.Future] = None
+        leading: List[Hashable] = []
+        following: Dict[Hashable, asyncio.Future] = {}
+        for key in keys:
+            other = self._flights.get(key)
+            if other is None:
+                if flight is None:
+                    flight = asyncio.get_running_loop().create_future()
+                self._flights[key] = flight
+                leading.append(key)
+            else:
+                following[key] = other
+        if leading:
+            self.flights += 1
+        self.shared_keys += len(following)
+
+        found = await fallback(list(following)) if following and fallback else {}
+        if leading:
+            result = {}
+            try:
+                result = await fetch(leading)
+                found.update(result)
+            finally:
+                for key in leading:
+                    if self._flights.get(key) is flight:
+                        del self._flights[key]
+                # Followers get what was resolved, never the leader's error or cancellation
+                flight.set_result(result)
+
+        for key, other in following.items():
+            if key in found:
+                continue
+            result = await asyncio.shield(other)
+            if key in result:
+                found[key] = result[key]
+        return found
+
+    def stats(self) -> Dict[str, int]:
+        return {'in_flight_keys': len(self._flights), 'flights': self.flights, 'shared_keys': self.shared_keys}
@@ -0,0 +1,197 @@
+# ttl_cache.py
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional
+
+import redis
+from loguru import logger
+
+
+'''
+    ttl_cache
+        TTLCache: bounded, thread-safe LRU cache with per-entry TTL, used for
+        profiles (profile_cache) and posts (post_service/post_cache).
+
+        - An entry is fresh for `ttl` seconds after it was stored.
+        - A stale entry (older than `ttl`) is kept for another `max_stale` seconds
+          (default 0: never) and is only returned when the caller asks for it with
+          allow_stale=True, i.e. as a fallback while the source is unavailable.
+        - Once the cache holds `max_entries` entries, the least recently used
+          entry is evicted.
+
+        Regular lookups count hits / misses, fallback lookups (allow_stale=True)
+        count fallback_hits / fallback_misses (only reported by stats() when
+        `max_stale` > 0), and evictions are counted too.
+
+        RedisTTLCache: optional second tier shared by all replicas, stored in
+        redis_server as one JSON string per key (`<key_prefix><key>`) that expires
+        after ttl + max_stale seconds. Batch reads are a single MGET, batch writes
+        one pipelined round trip. Redis errors are logged and treated as misses so
+        the shared tier can never fail a request.
+'''
+
+
+class TTLCache:
+
+    def __init__(self,
+                 max_entries: int = 10000,
+                 ttl: float = 60.0,
+                 max_stale: float = 0.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._clock = clock
+        self._lock = threading.Lock()
+        # key -> (value, stored_at)
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.fallback_hits = 0
+        self.fallback_misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: Hashable, allow_stale: bool = False) -> Optional[Any]:
+        return self.get_many([key], allow_stale=allow_stale).get(key)
+
+    def get_many(self, keys: Iterable[Hashable], allow_stale: bool = False) -> Dict[Hashable, Any]:
+        now = self._clock()
+        found = {}
+        hits = misses = 0
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    misses += 1
+                    continue
+                value, stored_at = entry
+                age = now - stored_at
+                if age > self.ttl + self.max_stale:
+                    # Too old to be served even as a fallback
+                    del self._entries[key]
+                    misses += 1
+                    continue
+                if age > self.ttl and not allow_stale:
+                    misses += 1
+                    continue
+                self._entries.move_to_end(key)
+                hits += 1
+                found[key] = value
+            if allow_stale:
+                self.fallback_hits += hits
+                self.fallback_misses += misses
+            else:
+                self.hits += hits
+                self.misses += misses
+        return found
+
+    def put(self, key: Hashable, value: Any):
+        self.put_many({key: value})
+
+    def put_many(self, values: Dict[Hashable, Any], ages: Optional[Dict[Hashable, float]] = None):
+        '''Store values; `ages` gives how old (in seconds) an entry already is, e.g. when copied from Redis.'''
+        now = self._clock()
+        with self._lock:
+            for key, value in values.items():
+                age = ages.get(key, 0.0) if ages else 0.0
+                self._entries[key] = (value, now - age)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        stats = {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+        if self.max_stale > 0:
+            stats.update(fallback_hits=self.fallback_hits, fallback_misses=self.fallback_misses)
+        stats['evictions'] = self.evictions
+        return stats
+
+
+class RedisTTLCache:
+
+    def __init__(self,
+                 redis_client: redis.Redis,
+                 key_prefix: str,
+                 ttl: float = 60.0,
+                 max_stale: float = 0.0,
+                 clock: Callable[[], float] = time.time):
+        self.redis_client = redis_client
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.key_prefix = key_prefix
+        self._clock = clock
+        self._expire_seconds = max(1, math.ceil(ttl + max_stale))
+        self.hits = 0
+        self.misses = 0
+        self.fallback_hits = 0
+        self.fallback_misses = 0
+        self.errors = 0
+
+    def get_many(self, keys: Iterable[Hashable], allow_stale: bool = False):
+        '''Return ({key: value}, {key: age_in_seconds}) for the entries found in Redis.'''
+        keys = list(keys)
+        found, ages = {}, {}
+        if not keys:
+            return found, ages
+        try:
+            raw_values = self.redis_client.mget([f'{self.key_prefix}{key}' for key in keys])
+        except redis.RedisError as e:
+            self.errors += 1
+            logger.error(f"Shared cache {self.key_prefix}* unavailable: {e}")
+            return found, ages
+
+        now = self._clock()
+        for key, raw_value in zip(keys, raw_values):
+            if raw_value is None:
+                continue
+            try:
+                entry = json.loads(raw_value)
+                age = max(0.0, now - entry['stored_at'])
+                value = entry['value']
+            except (ValueError, KeyError, TypeError) as e:
+                # Corrupt, or written by something else under our prefix: a miss
+                self.errors += 1
+                logger.error(f"Shared cache entry {self.key_prefix}{key} is unreadable: {e!r}")
+                continue
+            if age > self.ttl and not allow_stale:
+                continue
+            found[key] = value
+            ages[key] = age
+
+        hits = len(found)
+        if allow_stale:
+            self.fallback_hits += hits
+            self.fallback_misses += len(keys) - hits
+        else:
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return found, ages
+
+    def put_many(self, values: Dict[Hashable, Any]):
+        if not values:
+            return
+        now = self._clock()
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for key, value in values.items():
+                pipe.set(f'{self.key_prefix}{key}',
+                         json.dumps({'value': value, 'stored_at': now}),
+                         ex=self._expire_seconds)
+            pipe.execute()
+        except redis.RedisError as e:
+            self.errors += 1
+            logger.error(f"Shared cache {self.key_prefix}* unavailable: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        stats = {'hits': self.hits, 'misses': self.misses}
+        if self.max_stale > 0:
+            stats.update(fallback_hits=self.fallback_hits, fallback_misses=self.fallback_misses)
+        stats['errors'] = self.errors
+        return stats
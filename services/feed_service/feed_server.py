@@ -1,21 +1,37 @@
 # feed_service.py
-from flask import Flask, request, jsonify, abort
+from flask import Flask, request, jsonify, abort, g, has_request_context
+from werkzeug.exceptions import HTTPException
 import os
-import psycopg2
-from psycopg2 import pool
 from loguru import logger
-import requests
 import redis
 import threading
-from typing import List
+import time
+from typing import List, Optional, Tuple
+from common.bulk_ingest import bulk_response, required_int
+from common.db_pool import PoolTimeout, pool_from_env
+from common.health import init_health
+from common.breaker_status import STATUS_CHANNEL, broadcaster_from_env
+from common.bulkhead import bulkhead_from_env
+from common.circuit_breaker import breaker_from_env
+from common.health_prober import prober_from_env
+from common.metrics import DB_ROUND_TRIPS, init_metrics, observe_breaker, register_stats
+from common.http_client import session_from_env, timeout_from_env
+from common.profile_cache import cache_from_env, shared_cache_from_env
+from common.profile_client import ProfileClient
+from impression_buffer import BufferFull, ImpressionBuffer, write_impressions
+from ranking import RANK_COLUMNS, TopPostsCache, feed_entry, next_cursor, parse_expand, parse_page_args, parse_rank
+from trending import TRENDING_EPOCH, TRENDING_WEIGHT, reconciler_from_env
 
 app = Flask(__name__)
 
 '''
 feed service:
     Endpoints:
+        - '/healthz', methods=['GET']
+        - '/readyz', methods=['GET']
         - '/fetch_feed', methods=['GET']
         - '/submit_impression', methods=['POST']
+        - '/bulk_submit_impressions', methods=['POST']
 
 '''
 
@@ -27,37 +43,58 @@ DB_USER = os.getenv('DB_USER', 'your_user')
 DB_PASSWORD = os.getenv('DB_PASSWORD', 'your_password')
 PROFILE_SERVICE_URL = os.getenv('PROFILE_SERVICE_URL', 'http://profile_service:5002')
 PORT = os.getenv('PORT', '5003')
+# Page size of /fetch_feed and /get_trending_user_info: default and hard upper bound
+FEED_DEFAULT_PAGE_SIZE = int(os.getenv('FEED_DEFAULT_PAGE_SIZE', '10'))
+FEED_MAX_PAGE_SIZE = int(os.getenv('FEED_MAX_PAGE_SIZE', '100'))
 
 
 redis_client = redis.StrictRedis(host='redis_server', port=6379, db=0)
-# Initial state variables
-count = 0
-profile_service_status = "Unknown"
-cached_value = {}
-
-# Subscribe to the profile_service_status channel
-pubsub = redis_client.pubsub()
-pubsub.subscribe('profile_service_status')
-
-
-# Create a connection pool (minconn: minimum connections, maxconn: maximum connections)
-connection_pool = psycopg2.pool.SimpleConnectionPool(
-    minconn=1,
-    maxconn=10,
-    host=DB_HOST,
-    database=DB_NAME,
-    user=DB_USER,
-    password=DB_PASSWORD
-)
+# Circuit breaker guarding every call to profile_service
+profile_breaker = breaker_from_env('profile_service')
+# Bounded LRU/TTL cache of profiles, also used as fallback while the breaker is open,
+# optionally backed by a cache in redis_server shared by all replicas
+profile_cache = cache_from_env()
+shared_profile_cache = shared_cache_from_env(redis_client)
+# Request threads allowed to wait on profile_service at a time (half the worker's threads by default);
+# a full bulkhead sends requests to the cache fallback instead of queueing
+profile_bulkhead = bulkhead_from_env('profile_service',
+                                     default_max_concurrent=max(1, int(os.getenv('WEB_THREADS', '8')) // 2))
+profile_client = ProfileClient(PROFILE_SERVICE_URL, profile_breaker, profile_cache,
+                               shared_cache=shared_profile_cache,
+                               session=session_from_env(),
+                               timeout=timeout_from_env(),
+                               bulkhead=profile_bulkhead,
+                               max_batch_size=int(os.getenv('PROFILE_BATCH_SIZE', '100')))
+# Breaker state changes (not individual calls) are shared with the other replicas
+status_broadcaster = broadcaster_from_env(profile_breaker, redis_client)
+# Background /healthz probes of profile_service drive the breaker, one replica probing at a time
+health_prober = prober_from_env(profile_breaker, PROFILE_SERVICE_URL, redis_client, status_broadcaster.origin)
+
+
+
+# Connection pool, created in each worker process by init_db_pool
+connection_pool = None
+
+def init_db_pool():
+    global connection_pool
+    # Thread-safe pool: waits up to DB_POOL_TIMEOUT_SECONDS for a free connection
+    connection_pool = pool_from_env(
+        host=DB_HOST,
+        database=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD
+    )
 
 # Function to get a connection from the pool
 def get_db_connection():
     try:
-        conn = connection_pool.getconn()
-        if conn:
-            return conn
+        # Get a connection from the pool
+        return connection_pool.getconn()
+    except PoolTimeout as e:
+        logger.error(f"Error getting connection: {e}")
+        abort(503)
     except Exception as e:
-        print(f"Error getting connection: {e}")
+        logger.error(f"Error getting connection: {e}")
         abort(500)
 
 # Function to release the connection back to the pool
@@ -65,100 +102,186 @@ def release_db_connection(conn):
     if conn:
         connection_pool.putconn(conn)
 
+# Route to get the DB pool statistics (in use, waiters, wait time, ...)
+@app.route('/pool_stats', methods=['GET'])
+def pool_stats():
+    return jsonify(connection_pool.stats()), 200
+
+# Readiness of this worker: a pooled connection answers SELECT 1 and redis_server answers PING
+def check_database():
+    if connection_pool is None:
+        raise RuntimeError('database pool not initialised')
+    connection_pool.ping(timeout=float(os.getenv('READINESS_DB_TIMEOUT_SECONDS', '0.5')))
+
+readiness = init_health(app, {'database': check_database, 'redis': lambda: redis_client.ping()})
+
+# Prometheus metrics served at /metrics
+init_metrics(app)
+register_stats('db_pool', lambda: connection_pool.stats() if connection_pool else {},
+               counters=('waits', 'wait_seconds_total', 'timeouts'))
+observe_breaker(profile_breaker)
+register_stats('breaker_status', status_broadcaster.stats, counters=('published', 'applied', 'ignored'))
+register_stats('profile_bulkhead', profile_bulkhead.stats, counters=('admitted', 'rejected'))
+register_stats('profile_single_flight', profile_client.single_flight.stats, counters=('flights', 'shared_keys'))
+if health_prober:
+    register_stats('health_prober', health_prober.stats, counters=('probes', 'probe_failures'))
+register_stats('profile_cache', profile_cache.stats,
+               counters=('hits', 'misses', 'fallback_hits', 'fallback_misses', 'evictions'))
+if shared_profile_cache:
+    register_stats('shared_profile_cache', shared_profile_cache.stats,
+                   counters=('hits', 'misses', 'fallback_hits', 'fallback_misses', 'errors'))
+
+# Count the database round trips made while serving the current request
+def count_db_round_trip():
+    if has_request_context():
+        g.db_round_trips = g.get('db_round_trips', 0) + 1
+
+@app.after_request
+def report_db_round_trips(response):
+    round_trips = g.get('db_round_trips', 0)
+    response.headers['X-DB-Round-Trips'] = str(round_trips)
+    if request.url_rule:
+        DB_ROUND_TRIPS.labels(request.url_rule.rule).observe(round_trips)
+    logger.info(f"{request.path} made {round_trips} database round trips")
+    return response
+
+# Ranked (post_id, rank value, author user_id, title, content) rows; Score_table rows always have a Post_table row
+RANKED_POSTS_QUERY = (
+    'SELECT s.post_id, {column}, p.user_id, p.title, p.content FROM Score_table s '
+    'JOIN Post_table p ON p.post_id = s.post_id '
+    '{where} ORDER BY {column} DESC, s.post_id DESC LIMIT %s'
+)
+
+# Top of Score_table ordered by score (or trending score), served from a short-TTL snapshot
+def load_top_posts(limit : int, rank : str = 'score'):
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        logger.info(f"Fetching top {limit} posts from Score_table by {rank}")
+        cur.execute(RANKED_POSTS_QUERY.format(column=RANK_COLUMNS[rank], where=''), (limit,))
+        count_db_round_trip()
+        return cur.fetchall()
+    finally:
+        release_db_connection(conn)
+
+# Page of Score_table following the (score, post_id) cursor
+def load_posts_after(cursor : Tuple[float, int], limit : int, rank : str = 'score'):
+    column = RANK_COLUMNS[rank]
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        logger.info(f"Fetching {limit} posts from Score_table by {rank} after {cursor}")
+        cur.execute(
+            RANKED_POSTS_QUERY.format(column=column, where=f'WHERE ({column}, s.post_id) < (%s, %s)'),
+            (cursor[0], cursor[1], limit)
+        )
+        count_db_round_trip()
+        return cur.fetchall()
+    finally:
+        release_db_connection(conn)
+
+def get_top_posts(limit : int, cursor : Optional[Tuple[float, int]] = None, rank : str = 'score'):
+    if cursor is None:
+        return ranking_caches[rank].get(limit)
+    return load_posts_after(cursor, limit, rank)
+
+top_posts_cache = TopPostsCache(
+    load_top_posts,
+    ttl=float(os.getenv('FEED_RANKING_CACHE_TTL_SECONDS', '1')),
+    size=int(os.getenv('FEED_RANKING_CACHE_SIZE', '100'))
+)
+trending_posts_cache = TopPostsCache(
+    lambda limit: load_top_posts(limit, 'trending'),
+    ttl=float(os.getenv('FEED_RANKING_CACHE_TTL_SECONDS', '1')),
+    size=int(os.getenv('FEED_RANKING_CACHE_SIZE', '100'))
+)
+ranking_caches = {'score': top_posts_cache, 'trending': trending_posts_cache}
+
+# Both rankings change with every score write
+def invalidate_rankings():
+    for cache in ranking_caches.values():
+        cache.invalidate()
+
+# Periodic rebuild of the time-decayed scores from Impression_table (one replica at a time)
+trending_reconciler = reconciler_from_env(get_db_connection, release_db_connection,
+                                          on_rebuild=trending_posts_cache.invalidate)
+if trending_reconciler:
+    register_stats('trending_reconciler', trending_reconciler.stats, counters=('runs', 'skipped', 'failures'))
+
+# Optional write-behind mode for /submit_impression
+IMPRESSION_BUFFER_ENABLED = os.getenv('IMPRESSION_BUFFER_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+impression_buffer = ImpressionBuffer(
+    get_db_connection,
+    release_db_connection,
+    flush_interval=float(os.getenv('IMPRESSION_FLUSH_INTERVAL_SECONDS', '1')),
+    flush_size=int(os.getenv('IMPRESSION_FLUSH_SIZE', '500')),
+    max_pending=int(os.getenv('IMPRESSION_BUFFER_MAX_PENDING', '50000')),
+    on_flush=invalidate_rankings
+) if IMPRESSION_BUFFER_ENABLED else None
+if impression_buffer:
+    register_stats('impression_buffer', impression_buffer.stats,
+                   counters=('flushed', 'orphans', 'dead_lettered', 'dropped'))
+
 #  a function that will always running as a seperate thread
 def redis_listener():
     logger.info("Starting Redis listener...")
-    global profile_service_status,count
-    for message in pubsub.listen():
-        # Check if the message is from the 'profile_service_status' channel
-        if message['type'] == 'message' and message['channel'] == b'profile_service_status':
-            if message['data'].decode('utf-8') in ["UP","DOWN"]:
-                profile_service_status=message['data'].decode('utf-8')
-                count=0
-                logger.info(f" profile_service_status: updated to {profile_service_status}")
-        else:
-            logger.info(f"Ignored message from channel: {message['channel']}")
-    return
+    while True:
+        try:
+            # Subscribe to the profile_service_status channel
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(STATUS_CHANNEL)
+            # Redis may have restarted and lost the version counter
+            status_broadcaster.reset_sequence()
+            for message in pubsub.listen():
+                status_broadcaster.handle_message(message['data'])
+        except redis.ConnectionError as e:
+            logger.error(f"Redis listener lost its connection ({e}), reconnecting")
+            time.sleep(1)
 
 # Example API Endpoint: Fetching posts from Score_table
 
-def get_trending_users_gracefully(user_ids : List[str]) :
-    global count, profile_service_status, cached_value
-    
-    trending_users = []
-        
-    if profile_service_status == "Unknown" or profile_service_status == "UP" or count == 2:
-        try:
-            # Try to fetch data for all user_ids from profile_service
-            for user_id in user_ids:
-                user_service_url = f'{PROFILE_SERVICE_URL}/get_user_info?user_id={user_id}'
-                logger.info(f"Hitting profile_service for user_id: {user_id}")
-                
-                # Request user info from profile_service
-                response = requests.get(user_service_url)
-                response.raise_for_status()  # Will raise an exception for any error responses
-                
-                user_info = response.json()
-                trending_users.append(user_info)
-                
-                # Cache the fetched user info
-                cached_value[user_id] = user_info
-
-            # Broadcast that profile_service is "UP" after successful fetch
-            redis_client.publish('profile_service_status', 'UP')
-            count = 0  # Reset count after successful hit
-            
-        except requests.exceptions.ConnectionError:
-            logger.error("Failed to connect to profile_service, broadcasting status as Down")
-            
-            # Broadcast that profile_service is "Down"
-            redis_client.publish('profile_service_status', 'Down')
-            count = 0  # Reset count
-            # Return cached values if service is down
-            trending_users = [cached_value.get(user_id) for user_id in user_ids if user_id in cached_value]
-    
-    else:
-        # If profile_service is "Down", return cached values and increment the count
-        logger.info(f"Returning cached values as profile_service is {profile_service_status}")
-        trending_users = [cached_value.get(user_id) for user_id in user_ids if user_id in cached_value]
-        count += 1
-
-    return trending_users
+def get_trending_users_gracefully(user_ids : List[int]) :
+    users = profile_client.get_users_info(user_ids)
+    return [users[user_id] for user_id in user_ids if user_id in users]
 
 
 
 @app.route('/fetch_feed', methods=['GET'])
 def fetch_feed():
     logger.info(f"Got a new request to fetch_feed")
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
+        # Get page size and cursor from query parameters, default to the top 10
+        N, cursor = parse_page_args(request.args, FEED_DEFAULT_PAGE_SIZE, FEED_MAX_PAGE_SIZE)
+        # Optional post / author details, so a feed page takes one request instead of N+1
+        expand = parse_expand(request.args)
+        # All-time score or time-decayed trending score
+        rank = parse_rank(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        # Fetch the next N post_ids from Score_table, ordered by score
+        posts = get_top_posts(N, cursor, rank)
 
-        # Get N from query parameters, default to 10 if not provided
-        N = 10
-        logger.info(f"Fetching top {N} posts from Score_table")
-        # Fetch top N post_ids from Score_table, ordered by score
-        cur.execute('SELECT post_id FROM Score_table ORDER BY score DESC LIMIT %s', (N,))
-        posts = cur.fetchall()
+        authors = {}
+        if 'author' in expand:
+            # One breaker-protected batch lookup for the whole page, cache fallback when it is down
+            authors = profile_client.get_users_info(list(dict.fromkeys(post[2] for post in posts)))
 
-        top_posts = [{'post_id': post[0]} for post in posts]
+        top_posts = [feed_entry(post, expand, authors) for post in posts]
 
-        return jsonify({'top_posts': top_posts}), 200
+        return jsonify({'top_posts': top_posts, 'next_cursor': next_cursor(posts, N)}), 200
 
+    except HTTPException:
+        # e.g. 503 from get_db_connection when the pool is exhausted
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-    finally:
-        if conn:
-            release_db_connection(conn)
-
 # Example API Endpoint: Submitting impressions and updating Score_table
 @app.route('/submit_impression', methods=['POST'])
 def submit_impression():
-    global cached_value
     logger.info(f"Got a new request to submit_impression")
-    logger.info(f"message is {cached_value}")
     data = request.json
     post_id = data.get('post_id')
     user_id = data.get('user_id')
@@ -167,6 +290,18 @@ def submit_impression():
     if not post_id or not user_id or not impression_type:
         return jsonify({'error': 'post_id, user_id, and impression_type are required'}), 400
 
+    if impression_buffer:
+        if impression_type not in ('UP', 'DOWN'):
+            return jsonify({'error': "Invalid impression_type. Must be 'UP' or 'DOWN'."}), 400
+        try:
+            # Written to Impression_table / Score_table by the next flush
+            impression_buffer.add(int(post_id), int(user_id), impression_type)
+        except ValueError:
+            return jsonify({'error': 'post_id and user_id must be 32-bit integers'}), 400
+        except BufferFull as e:
+            return jsonify({'error': str(e)}), 503
+        return jsonify({'message': 'Impression accepted'}), 202
+
     conn = None
     try:
         conn = get_db_connection()
@@ -182,20 +317,28 @@ def submit_impression():
             'VALUES (%s, %s, %s, NOW())',
             (post_id, user_id, impression_type)
         )
+        count_db_round_trip()
 
-        # Update score in Score_table based on impression type
-        if impression_type == 'UP':
-            cur.execute('UPDATE Score_table SET score = score + 1 WHERE post_id = %s', (post_id,))
-        elif impression_type == 'DOWN':
-            cur.execute('UPDATE Score_table SET score = score - 1 WHERE post_id = %s', (post_id,))
-        else:
+        # Update the raw and the time-decayed score in Score_table based on impression type
+        if impression_type not in ('UP', 'DOWN'):
             raise ValueError("Invalid impression_type. Must be 'UP' or 'DOWN'.")
+        delta = 1 if impression_type == 'UP' else -1
+        cur.execute(
+            f'UPDATE Score_table AS s SET score = s.score + %s, trending = s.trending + %s * {TRENDING_WEIGHT} '
+            f'FROM {TRENDING_EPOCH} WHERE s.post_id = %s',
+            (delta, delta, post_id)
+        )
+        count_db_round_trip()
 
         # Commit the transaction
         conn.commit()
+        count_db_round_trip()
+        invalidate_rankings()
 
         return jsonify({'message': 'Impression submitted successfully'}), 201
 
+    except HTTPException:
+        raise
     except Exception as e:
         if conn:
             conn.rollback()  # Roll back the transaction if any error occurs
@@ -205,54 +348,78 @@ def submit_impression():
         if conn:
             release_db_connection(conn)
 
+# Bulk ingestion: (post_id, user_id, impression_type) rows of an NDJSON stream, written
+# like an impression buffer flush (multi-row INSERT + one score delta per post) per chunk
+def parse_impression(record):
+    impression_type = record.get('impression_type')
+    if impression_type not in ('UP', 'DOWN'):
+        raise ValueError("Invalid impression_type. Must be 'UP' or 'DOWN'.")
+    return (required_int(record, 'post_id'), required_int(record, 'user_id'), impression_type)
+
+# Route to submit many impressions from an NDJSON body ({"post_id", "user_id", "impression_type"} per line)
+@app.route('/bulk_submit_impressions', methods=['POST'])
+def bulk_submit_impressions():
+    logger.info(f"Got a new request to bulk_submit_impressions")
+    return bulk_response(request.stream, parse_impression, write_impressions, get_db_connection,
+                         release_db_connection, on_commit=invalidate_rankings)
+
 @app.route('/get_trending_user_info', methods=['GET'])
 def get_trending_user_info():
     logger.info(f"Got a new request to get_trending_user_info")
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-
-        # Get N from query parameters, default to 10 if not provided
-        N = 10
-        logger.info(f"Fetching top {N} posts from Score_table")
+        # Get page size and cursor from query parameters, default to the top 10
+        N, cursor = parse_page_args(request.args, FEED_DEFAULT_PAGE_SIZE, FEED_MAX_PAGE_SIZE)
+        rank = parse_rank(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-        # Step 1: Fetch top N post_ids from Score_table ordered by score
-        cur.execute('SELECT post_id FROM Score_table ORDER BY score DESC LIMIT %s', (N,))
-        top_posts = cur.fetchall()
+    try:
+        # Step 1: Fetch the next N posts with their authors, ordered by score (or trending score)
+        top_posts = get_top_posts(N, cursor, rank)
 
         if not top_posts:
+            if cursor is not None:
+                # Past the last page of a non-empty ranking
+                return jsonify({'trending_users': [], 'next_cursor': None}), 200
             return jsonify({'message': 'No trending posts found'}), 404
 
-        # Step 2: Fetch user_ids corresponding to post_ids from Post_table
-        post_ids = [post[0] for post in top_posts]
-        cur.execute('SELECT user_id FROM Post_table WHERE post_id IN %s', (tuple(post_ids),))
-        user_ids = cur.fetchall()
-        user_ids=[user_id[0] for user_id in user_ids]
+        # Step 2: Authors in score order, each listed once
+        user_ids = list(dict.fromkeys(post[2] for post in top_posts))
         logger.info(f"User ids {user_ids}")
-        
-        
-        if not user_ids:
-            return jsonify({'message': 'No users found for trending posts'}), 404
-        
-        # Step 3: Hit the user_service to get user info for each user_id
+
+        # Step 3: Hit the user_service to get user info for all user_ids
         trending_users=get_trending_users_gracefully(user_ids)
         # Step 4: Return the list of trending user info as JSON
-        return jsonify({'trending_users': trending_users}), 200
+        return jsonify({'trending_users': trending_users, 'next_cursor': next_cursor(top_posts, N)}), 200
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-    finally:
-        if conn:
-            release_db_connection(conn)
-
 
 
-# Start the Flask app
+# Initialise the per-process resources (pools, Redis listener) and return the app.
+# Called once per worker, after the WSGI server forked, e.g. gunicorn "module:create_app()"
+initialised = False
+init_lock = threading.Lock()
+
+def create_app():
+    global initialised
+    with init_lock:
+        if not initialised:
+            init_db_pool()
+            listener_thread = threading.Thread(target=redis_listener, name='redis-listener', daemon=True)
+            listener_thread.start()
+            status_broadcaster.start()
+            if health_prober:
+                health_prober.start()
+            if trending_reconciler:
+                trending_reconciler.start()
+            initialised = True
+    return app
+
+# Start the Flask development server
 if __name__ == '__main__':
-    
-    listener_thread = threading.Thread(target=redis_listener)
-    listener_thread.start()
-    app.run(host='0.0.0.0', port=int(PORT))
+    create_app().run(host='0.0.0.0', port=int(PORT), threaded=True)
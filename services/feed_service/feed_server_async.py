@@ -0,0 +1,320 @@
+# feed_server_async.py
+from quart import Quart, request, jsonify
+import asyncio
+import os
+import asyncpg
+import httpx
+from loguru import logger
+import redis
+import redis.asyncio as aioredis
+from typing import List, Optional, Tuple
+from common.async_profile_client import AsyncProfileClient
+from common.breaker_status import STATUS_CHANNEL, broadcaster_from_env
+from common.bulkhead import bulkhead_from_env
+from common.circuit_breaker import breaker_from_env
+from common.health import readiness_from_env
+from common.health_prober import prober_from_env
+from common.http_client import timeout_from_env
+from common.metrics import init_async_metrics, observe_breaker, register_stats
+from common.profile_cache import cache_from_env, shared_cache_from_env
+from ranking import (RANK_COLUMNS, AsyncTopPostsCache, feed_entry, next_cursor, parse_expand, parse_page_args,
+                     parse_rank)
+from trending import TRENDING_EPOCH, TRENDING_WEIGHT
+
+app = Quart(__name__)
+
+'''
+feed service (asyncio / ASGI serving mode):
+    Same endpoints and responses as feed_server.py, served by an ASGI server, e.g.
+        hypercorn feed_server_async:app --bind 0.0.0.0:5003
+
+    Endpoints:
+        - '/healthz', methods=['GET']
+        - '/readyz', methods=['GET']
+        - '/fetch_feed', methods=['GET']
+        - '/submit_impression', methods=['POST']
+        - '/get_trending_user_info', methods=['GET']
+
+    Postgres is accessed through an asyncpg pool and profile_service through an
+    httpx.AsyncClient, so a request waiting on a downstream call does not hold
+    a thread.
+'''
+
+
+# Fetch database credentials from environment variables
+DB_HOST = os.getenv('DB_HOST', 'localhost')
+DB_NAME = os.getenv('DB_NAME', 'impressions_db')
+DB_USER = os.getenv('DB_USER', 'your_user')
+DB_PASSWORD = os.getenv('DB_PASSWORD', 'your_password')
+PROFILE_SERVICE_URL = os.getenv('PROFILE_SERVICE_URL', 'http://profile_service:5002')
+REDIS_HOST = os.getenv('REDIS_HOST', 'redis_server')
+# Concurrent calls to profile_service per request
+PROFILE_FANOUT_CONCURRENCY = int(os.getenv('PROFILE_FANOUT_CONCURRENCY', '4'))
+PROFILE_BATCH_SIZE = int(os.getenv('PROFILE_BATCH_SIZE', '100'))
+# Page size of /fetch_feed and /get_trending_user_info: default and hard upper bound
+FEED_DEFAULT_PAGE_SIZE = int(os.getenv('FEED_DEFAULT_PAGE_SIZE', '10'))
+FEED_MAX_PAGE_SIZE = int(os.getenv('FEED_MAX_PAGE_SIZE', '100'))
+
+# Circuit breaker guarding every call to profile_service
+profile_breaker = breaker_from_env('profile_service')
+# Bounded LRU/TTL cache of profiles, also used as fallback while the breaker is open,
+# optionally backed by a cache in redis_server shared by all replicas
+profile_cache = cache_from_env()
+# Requests waiting on profile_service at a time; a full bulkhead sends requests to the cache fallback
+profile_bulkhead = bulkhead_from_env('profile_service', default_max_concurrent=64)
+# Blocking client for the shared cache tier and the status broadcasts, used from worker threads
+sync_redis_client = redis.StrictRedis(host=REDIS_HOST, port=6379, db=0)
+shared_profile_cache = shared_cache_from_env(sync_redis_client)
+# Breaker state changes (not individual calls) are shared with the other replicas
+status_broadcaster = broadcaster_from_env(profile_breaker, sync_redis_client)
+# Background /healthz probes of profile_service drive the breaker, one replica probing at a time
+health_prober = prober_from_env(profile_breaker, PROFILE_SERVICE_URL, sync_redis_client, status_broadcaster.origin)
+
+# Created on startup, inside the server's event loop
+db_pool = None
+redis_client = None
+http_client = None
+profile_client = None
+listener_task = None
+
+init_async_metrics(app)
+# asyncpg pool, in the keys of ConnectionPool.stats()
+register_stats('db_pool', lambda: {
+    'size': db_pool.get_size(),
+    'max_size': db_pool.get_max_size(),
+    'in_use': db_pool.get_size() - db_pool.get_idle_size(),
+    'idle': db_pool.get_idle_size()
+} if db_pool else {})
+observe_breaker(profile_breaker)
+register_stats('breaker_status', status_broadcaster.stats, counters=('published', 'applied', 'ignored'))
+register_stats('profile_bulkhead', profile_bulkhead.stats, counters=('admitted', 'rejected'))
+register_stats('profile_single_flight', lambda: profile_client.single_flight.stats() if profile_client else {},
+               counters=('flights', 'shared_keys'))
+if health_prober:
+    register_stats('health_prober', health_prober.stats, counters=('probes', 'probe_failures'))
+register_stats('profile_cache', profile_cache.stats,
+               counters=('hits', 'misses', 'fallback_hits', 'fallback_misses', 'evictions'))
+if shared_profile_cache:
+    register_stats('shared_profile_cache', shared_profile_cache.stats,
+                   counters=('hits', 'misses', 'fallback_hits', 'fallback_misses', 'errors'))
+
+
+@app.before_serving
+async def startup():
+    global db_pool, redis_client, http_client, profile_client, listener_task
+    db_pool = await asyncpg.create_pool(
+        min_size=1,
+        max_size=10,
+        host=DB_HOST,
+        database=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD
+    )
+    redis_client = aioredis.StrictRedis(host=REDIS_HOST, port=6379, db=0)
+    connect_timeout, read_timeout = timeout_from_env()
+    pool_size = int(os.getenv('HTTP_POOL_SIZE', '20'))
+    http_client = httpx.AsyncClient(
+        timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+    )
+    profile_client = AsyncProfileClient(PROFILE_SERVICE_URL, profile_breaker, profile_cache,
+                                        http_client,
+                                        shared_cache=shared_profile_cache,
+                                        max_batch_size=PROFILE_BATCH_SIZE,
+                                        max_concurrency=PROFILE_FANOUT_CONCURRENCY,
+                                        bulkhead=profile_bulkhead)
+    listener_task = asyncio.create_task(redis_listener())
+    status_broadcaster.start()
+    if health_prober:
+        health_prober.start()
+
+
+@app.after_serving
+async def shutdown():
+    listener_task.cancel()
+    await http_client.aclose()
+    await redis_client.close()
+    await db_pool.close()
+
+
+# Background task following the profile_service_status channel, resubscribing after connection losses
+async def redis_listener():
+    logger.info("Starting Redis listener...")
+    while True:
+        pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(STATUS_CHANNEL)
+            # Redis may have restarted and lost the version counter
+            status_broadcaster.reset_sequence()
+            async for message in pubsub.listen():
+                status_broadcaster.handle_message(message['data'])
+        except (redis.ConnectionError, redis.TimeoutError) as e:
+            logger.error(f"Redis listener lost its connection ({e}), reconnecting")
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
+
+
+# Liveness: no I/O
+@app.route('/healthz', methods=['GET'])
+async def healthz():
+    return jsonify({'status': 'ok'}), 200
+
+
+# Readiness: Postgres answers SELECT 1 and redis_server answers PING, cached for READINESS_CACHE_SECONDS
+readiness = readiness_from_env({
+    'database': lambda: db_pool.fetchval('SELECT 1'),
+    'redis': lambda: redis_client.ping()
+})
+
+
+@app.route('/readyz', methods=['GET'])
+async def readyz():
+    ready, details = await readiness.async_status()
+    return jsonify({'status': 'ready' if ready else 'not ready', 'checks': details}), 200 if ready else 503
+
+
+# Top of Score_table ordered by score (or trending score), served from a short-TTL snapshot
+async def load_top_posts(limit : int, rank : str = 'score'):
+    logger.info(f"Fetching top {limit} posts from Score_table by {rank}")
+    column = RANK_COLUMNS[rank]
+    # Ranked (post_id, rank value, author user_id, title, content) rows in one round trip
+    return await db_pool.fetch(
+        f'SELECT s.post_id, {column}, p.user_id, p.title, p.content FROM Score_table s '
+        'JOIN Post_table p ON p.post_id = s.post_id '
+        f'ORDER BY {column} DESC, s.post_id DESC LIMIT $1',
+        limit
+    )
+
+
+ranking_caches = {
+    rank: AsyncTopPostsCache(
+        lambda limit, rank=rank: load_top_posts(limit, rank),
+        ttl=float(os.getenv('FEED_RANKING_CACHE_TTL_SECONDS', '1')),
+        size=int(os.getenv('FEED_RANKING_CACHE_SIZE', '100'))
+    )
+    for rank in RANK_COLUMNS
+}
+
+
+# Both rankings change with every score write
+def invalidate_rankings():
+    for cache in ranking_caches.values():
+        cache.invalidate()
+
+
+# Page of Score_table ordered by score (or trending score), following the (score, post_id) cursor if any
+async def get_top_posts(limit : int, cursor : Optional[Tuple[float, int]] = None, rank : str = 'score'):
+    if cursor is None:
+        return await ranking_caches[rank].get(limit)
+    logger.info(f"Fetching {limit} posts from Score_table by {rank} after {cursor}")
+    column = RANK_COLUMNS[rank]
+    return await db_pool.fetch(
+        f'SELECT s.post_id, {column}, p.user_id, p.title, p.content FROM Score_table s '
+        'JOIN Post_table p ON p.post_id = s.post_id '
+        f'WHERE ({column}, s.post_id) < ($1, $2) '
+        f'ORDER BY {column} DESC, s.post_id DESC LIMIT $3',
+        cursor[0], cursor[1], limit
+    )
+
+
+async def get_trending_users_gracefully(user_ids : List[int]) :
+    users = await profile_client.get_users_info(user_ids)
+    return [users[user_id] for user_id in user_ids if user_id in users]
+
+
+@app.route('/fetch_feed', methods=['GET'])
+async def fetch_feed():
+    logger.info(f"Got a new request to fetch_feed")
+    try:
+        N, cursor = parse_page_args(request.args, FEED_DEFAULT_PAGE_SIZE, FEED_MAX_PAGE_SIZE)
+        expand = parse_expand(request.args)
+        rank = parse_rank(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        # Fetch the next N post_ids from Score_table, ordered by score
+        posts = await get_top_posts(N, cursor, rank)
+
+        authors = {}
+        if 'author' in expand:
+            authors = await profile_client.get_users_info(list(dict.fromkeys(post['user_id'] for post in posts)))
+
+        top_posts = [feed_entry(post, expand, authors) for post in posts]
+
+        return jsonify({'top_posts': top_posts, 'next_cursor': next_cursor(posts, N)}), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/submit_impression', methods=['POST'])
+async def submit_impression():
+    logger.info(f"Got a new request to submit_impression")
+    data = await request.get_json()
+    post_id = data.get('post_id')
+    user_id = data.get('user_id')
+    impression_type = data.get('impression_type')
+
+    if not post_id or not user_id or not impression_type:
+        return jsonify({'error': 'post_id, user_id, and impression_type are required'}), 400
+
+    if impression_type not in ('UP', 'DOWN'):
+        return jsonify({'error': "Invalid impression_type. Must be 'UP' or 'DOWN'."}), 500
+
+    try:
+        async with db_pool.acquire() as conn:
+            async with conn.transaction():
+                logger.info(f"Hitting the database to update Score_table")
+                # Insert into Impression_table
+                await conn.execute(
+                    'INSERT INTO Impression_table (post_id, user_id, impression_type, time_of_impression) '
+                    'VALUES ($1, $2, $3, NOW())',
+                    int(post_id), int(user_id), impression_type
+                )
+                # Update the raw and the time-decayed score in Score_table based on impression type
+                await conn.execute(
+                    f'UPDATE Score_table AS s SET score = s.score + $1, trending = s.trending + $1 * {TRENDING_WEIGHT} '
+                    f'FROM {TRENDING_EPOCH} WHERE s.post_id = $2',
+                    1 if impression_type == 'UP' else -1, int(post_id)
+                )
+        invalidate_rankings()
+
+        return jsonify({'message': 'Impression submitted successfully'}), 201
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/get_trending_user_info', methods=['GET'])
+async def get_trending_user_info():
+    logger.info(f"Got a new request to get_trending_user_info")
+    try:
+        N, cursor = parse_page_args(request.args, FEED_DEFAULT_PAGE_SIZE, FEED_MAX_PAGE_SIZE)
+        rank = parse_rank(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        # Step 1: Fetch the next N posts with their authors, ordered by score (or trending score)
+        top_posts = await get_top_posts(N, cursor, rank)
+
+        if not top_posts:
+            if cursor is not None:
+                # Past the last page of a non-empty ranking
+                return jsonify({'trending_users': [], 'next_cursor': None}), 200
+            return jsonify({'message': 'No trending posts found'}), 404
+
+        # Step 2: Authors in score order, each listed once
+        user_ids = list(dict.fromkeys(post['user_id'] for post in top_posts))
+        logger.info(f"User ids {user_ids}")
+
+        # Step 3: Resolve all users through the breaker-protected profile client
+        trending_users = await get_trending_users_gracefully(user_ids)
+        # Step 4: Return the list of trending user info as JSON
+        return jsonify({'trending_users': trending_users, 'next_cursor': next_cursor(top_posts, N)}), 200
+
+    except Exception as e:
+        logger.error(f"Error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,223 @@
+# impression_buffer.py
+import atexit
+import threading
+from collections import defaultdict, deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+import psycopg2
+from psycopg2.extras import execute_values
+from loguru import logger
+
+from common.bulk_ingest import INT4_MAX, INT4_MIN
+from trending import TRENDING_EPOCH, TRENDING_WEIGHT
+
+
+'''
+    impression_buffer
+        ImpressionBuffer: write-behind buffering for /submit_impression.
+
+        Impressions are appended to an in-memory buffer and a background thread
+        flushes them every `flush_interval` seconds, or as soon as `flush_size`
+        impressions are pending. One flush is one transaction that
+            - inserts all buffered rows into Impression_table with execute_values
+            - applies one aggregated score delta per post to Score_table (raw
+              and trending score) in a single UPDATE ... FROM (VALUES ...) statement
+        so a viral post takes its row lock once per flush instead of once per
+        impression.
+
+        Durability: an impression is acknowledged once it is in memory. Pending
+        impressions are flushed at interpreter exit, but a crash (or kill -9)
+        loses at most the impressions received since the last flush, i.e. up to
+        `flush_interval` seconds or `max_pending` impressions.
+
+        Failures:
+            - add() rejects ids outside the int4 range of the tables with ValueError.
+            - Impressions referencing unknown posts or users are dropped (`orphans`).
+            - Any other database error raised by the data itself (DataError, ...)
+              would fail on every retry: the batch is split in halves until the
+              offending rows are isolated, and these are logged and dead-lettered
+              (`dead_lettered`) while the rest is written.
+            - Transient failures (connection lost, pool timeout, deadlock, ...) put
+              the rows back to be retried on the next flush. When `max_pending` rows
+              are waiting, new impressions are rejected with BufferFull, and the
+              put-back rows that no longer fit are logged and counted (`dropped`).
+'''
+
+
+class BufferFull(Exception):
+    pass
+
+
+class ImpressionBuffer:
+
+    def __init__(self,
+                 get_connection: Callable,
+                 release_connection: Callable,
+                 flush_interval: float = 1.0,
+                 flush_size: int = 500,
+                 max_pending: int = 50000,
+                 on_flush: Optional[Callable[[], None]] = None):
+        self.get_connection = get_connection
+        self.release_connection = release_connection
+        self.on_flush = on_flush
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        # (post_id, user_id, impression_type)
+        self._pending: List[Tuple[int, int, str]] = []
+        self._thread = None
+        self.flushed = 0
+        self.orphans = 0
+        self.dead_lettered = 0
+        self.dropped = 0
+
+    def add(self, post_id: int, user_id: int, impression_type: str):
+        if not (INT4_MIN <= post_id <= INT4_MAX and INT4_MIN <= user_id <= INT4_MAX):
+            raise ValueError('post_id and user_id must be 32-bit integers')
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                raise BufferFull(f"{len(self._pending)} impressions are waiting to be written")
+            self._pending.append((post_id, user_id, impression_type))
+            pending = len(self._pending)
+            if self._thread is None:
+                # Started lazily so it also runs in workers forked by a WSGI server
+                self._thread = threading.Thread(target=self._run, name='impression-flusher', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+        if pending >= self.flush_size:
+            self._wakeup.set()
+
+    def _run(self):
+        logger.info("Starting impression flusher...")
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Impression flush failed: {e}")
+
+    def flush(self) -> int:
+        '''Write all pending impressions; returns the number of rows written.'''
+        with self._flush_lock:
+            with self._lock:
+                rows, self._pending = self._pending, []
+            if not rows:
+                return 0
+            batches = deque([rows])
+            written = 0
+            try:
+                while batches:
+                    try:
+                        written += self._write(batches[0])
+                        batches.popleft()
+                    except psycopg2.OperationalError:
+                        raise
+                    except psycopg2.DatabaseError as e:
+                        # Not transient: retrying the same batch would fail forever
+                        self._split(batches, e)
+            except Exception:
+                self._requeue([row for batch in batches for row in batch])
+                raise
+            finally:
+                self.flushed += written
+            logger.info(f"Flushed {written} impressions")
+            if written and self.on_flush:
+                self.on_flush()
+            return written
+
+    def _split(self, batches: deque, error: Exception):
+        # Replaces the failed first batch by its halves, dead-letters it once it is a single row
+        batch = batches.popleft()
+        if len(batch) == 1:
+            self.dead_lettered += 1
+            logger.error(f"Dead-lettered impression {batch[0]}: {error}")
+            return
+        middle = len(batch) // 2
+        batches.extendleft([batch[middle:], batch[:middle]])
+
+    def _requeue(self, rows: List[Tuple[int, int, str]]):
+        with self._lock:
+            # Put the rows back in front of those received meanwhile
+            pending = rows + self._pending
+            if len(pending) > self.max_pending:
+                dropped = len(pending) - self.max_pending
+                self.dropped += dropped
+                logger.error(f"Dropped {dropped} acknowledged impressions, {self.max_pending} are already waiting")
+            self._pending = pending[:self.max_pending]
+
+    def _write(self, rows: List[Tuple[int, int, str]]) -> int:
+        conn = self.get_connection()
+        try:
+            conn.autocommit = False
+            cur = conn.cursor()
+            try:
+                self._write_rows(cur, rows)
+            except psycopg2.IntegrityError:
+                # Some impressions reference unknown posts or users: drop them and retry
+                conn.rollback()
+                kept = self._drop_orphans(cur, rows)
+                self.orphans += len(rows) - len(kept)
+                rows = kept
+                self._write_rows(cur, rows)
+            conn.commit()
+            return len(rows)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.release_connection(conn)
+
+    @staticmethod
+    def _write_rows(cur, rows: List[Tuple[int, int, str]]):
+        write_impressions(cur, rows)
+
+    @staticmethod
+    def _drop_orphans(cur, rows: List[Tuple[int, int, str]]) -> List[Tuple[int, int, str]]:
+        cur.execute('SELECT post_id FROM Post_table WHERE post_id = ANY(%s)', (list({row[0] for row in rows}),))
+        post_ids = {row[0] for row in cur.fetchall()}
+        cur.execute('SELECT user_id FROM User_table WHERE user_id = ANY(%s)', (list({row[1] for row in rows}),))
+        user_ids = {row[0] for row in cur.fetchall()}
+        kept = [row for row in rows if row[0] in post_ids and row[1] in user_ids]
+        logger.error(f"Dropped {len(rows) - len(kept)} impressions referencing unknown posts or users")
+        return kept
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            'pending': pending,
+            'flushed': self.flushed,
+            'orphans': self.orphans,
+            'dead_lettered': self.dead_lettered,
+            'dropped': self.dropped
+        }
+
+
+def write_impressions(cur, rows: List[Tuple[int, int, str]]):
+    '''Insert (post_id, user_id, impression_type) rows and apply one aggregated score delta per post.'''
+    if not rows:
+        return
+    execute_values(
+        cur,
+        'INSERT INTO Impression_table (post_id, user_id, impression_type, time_of_impression) VALUES %s',
+        rows,
+        template='(%s, %s, %s, NOW())',
+        page_size=1000
+    )
+    deltas = defaultdict(int)
+    for post_id, _, impression_type in rows:
+        deltas[post_id] += 1 if impression_type == 'UP' else -1
+    execute_values(
+        cur,
+        'UPDATE Score_table AS s SET score = s.score + d.delta, '
+        f'trending = s.trending + d.delta * {TRENDING_WEIGHT}, last_updated = NOW() '
+        f'FROM (VALUES %s) AS d(post_id, delta), {TRENDING_EPOCH} WHERE s.post_id = d.post_id',
+        # Rows locked in post_id order, so concurrent flushes of several workers cannot deadlock
+        [(post_id, delta) for post_id, delta in sorted(deltas.items()) if delta],
+        template='(%s::int, %s::int)',
+        page_size=1000
+    )
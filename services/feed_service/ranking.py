@@ -0,0 +1,182 @@
+# ranking.py
+import asyncio
+import base64
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+
+'''
+    ranking
+        TopPostsCache: short-TTL, in-process snapshot of the top `size` rows of
+        Score_table (ordered by score DESC, post_id DESC, together with the post
+        author), shared by every request of the process.
+
+        - get(n) for n <= size is served from the snapshot while it is younger
+          than `ttl` seconds; deeper reads go to the loader (an index scan on
+          Score_table(score DESC, post_id DESC)).
+        - Only one thread refreshes an expired snapshot; the others keep serving
+          the previous one meanwhile instead of piling up on Postgres.
+        - invalidate() is called after local score writes so this process sees
+          its own impressions immediately; writes made by other replicas become
+          visible within `ttl` seconds.
+
+        AsyncTopPostsCache is the same snapshot for a coroutine loader (the
+        asyncio serving mode): one task refreshes an expired snapshot while the
+        other requests keep serving the previous one.
+
+        Feed pages are addressed with a keyset cursor: the (score, post_id) of the
+        last row of the previous page, encoded as an opaque token. The next page
+        is `WHERE (score, post_id) < (cursor) ORDER BY score DESC, post_id DESC`,
+        an index range scan whose cost does not grow with the page number.
+
+        Pages are ranked by the all-time `score` (rank=score, the default) or by
+        the time-decayed `trending` score (rank=trending, see trending.py), each
+        with its own (column DESC, post_id DESC) index, snapshot and cursor.
+
+        Ranked rows are (post_id, rank value, author user_id, title, content), so a
+        feed page can be hydrated (`expand=post,author`) without reading
+        Post_table again.
+'''
+
+
+class TopPostsCache:
+
+    def __init__(self,
+                 loader: Callable[[int], List[Tuple]],
+                 ttl: float = 1.0,
+                 size: int = 100,
+                 clock: Callable[[], float] = time.monotonic):
+        self.loader = loader
+        self.ttl = ttl
+        self.size = size
+        self._clock = clock
+        self._refresh_lock = threading.Lock()
+        self._rows: Optional[List[Tuple]] = None
+        self._expires_at = 0.0
+
+    def get(self, n: int) -> List[Tuple]:
+        if n > self.size or self.ttl <= 0:
+            return self.loader(n)
+
+        rows = self._rows
+        if rows is not None and self._clock() < self._expires_at:
+            return rows[:n]
+
+        if not self._refresh_lock.acquire(blocking=rows is None):
+            # Another thread is refreshing, serve the previous snapshot
+            return rows[:n]
+        try:
+            if self._rows is None or self._clock() >= self._expires_at:
+                self._rows = self.loader(self.size)
+                self._expires_at = self._clock() + self.ttl
+            return self._rows[:n]
+        finally:
+            self._refresh_lock.release()
+
+    def invalidate(self):
+        self._expires_at = 0.0
+
+
+class AsyncTopPostsCache(TopPostsCache):
+
+    def __init__(self,
+                 loader: Callable[[int], Awaitable[List[Tuple]]],
+                 ttl: float = 1.0,
+                 size: int = 100,
+                 clock: Callable[[], float] = time.monotonic):
+        super().__init__(loader, ttl=ttl, size=size, clock=clock)
+        self._refresh: Optional[asyncio.Future] = None
+
+    async def get(self, n: int) -> List[Tuple]:
+        if n > self.size or self.ttl <= 0:
+            return await self.loader(n)
+
+        rows = self._rows
+        if rows is not None and self._clock() < self._expires_at:
+            return rows[:n]
+
+        if self._refresh is None:
+            self._refresh = asyncio.ensure_future(self._reload())
+        elif rows is not None:
+            # Another request is refreshing, serve the previous snapshot
+            return rows[:n]
+        # Shielded: a cancelled request does not cancel the refresh the others wait for
+        return (await asyncio.shield(self._refresh))[:n]
+
+    async def _reload(self) -> List[Tuple]:
+        try:
+            rows = await self.loader(self.size)
+            self._rows, self._expires_at = rows, self._clock() + self.ttl
+            return rows
+        finally:
+            self._refresh = None
+
+
+# Score_table column ordering the feed for each `rank`
+RANK_COLUMNS = {'score': 's.score', 'trending': 's.trending'}
+
+# Fields /fetch_feed can add to each entry through `expand`
+EXPANSIONS = ('post', 'author')
+
+
+def encode_cursor(score: float, post_id: int) -> str:
+    # repr of a float round-trips exactly, so trending cursors compare equal to the stored value
+    return base64.urlsafe_b64encode(f'{score!r}:{post_id}'.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[float, int]:
+    '''Raises ValueError for malformed cursors.'''
+    try:
+        score, post_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(':')
+        return (int(score) if score.lstrip('-').isdigit() else float(score)), int(post_id)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+def parse_page_args(args, default_limit: int, max_limit: int) -> Tuple[int, Optional[Tuple[int, int]]]:
+    '''Read `limit` and `cursor` from query parameters; raises ValueError when they are invalid.'''
+    try:
+        limit = int(args.get('limit', default_limit))
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if limit < 1 or limit > max_limit:
+        raise ValueError(f"limit must be between 1 and {max_limit}")
+    cursor = args.get('cursor')
+    return limit, decode_cursor(cursor) if cursor else None
+
+
+def next_cursor(rows: List[Tuple], limit: int) -> Optional[str]:
+    '''Cursor of the page following `rows` ((post_id, score, ...) tuples), None on the last page.'''
+    if len(rows) < limit:
+        return None
+    post_id, score = rows[-1][0], rows[-1][1]
+    return encode_cursor(score, post_id)
+
+
+def parse_expand(args) -> Set[str]:
+    '''Read the comma separated `expand` query parameter; raises ValueError for unknown fields.'''
+    expand = {field for field in args.get('expand', '').split(',') if field}
+    unknown = expand - set(EXPANSIONS)
+    if unknown:
+        raise ValueError(f"expand must be a subset of {','.join(EXPANSIONS)}")
+    return expand
+
+
+def feed_entry(row: Tuple, expand: Set[str], authors: Dict[int, Any]) -> Dict[str, Any]:
+    '''One /fetch_feed entry for a ranked row; authors missing from `authors` are "No Idea".'''
+    entry = {'post_id': row[0]}
+    if 'post' in expand:
+        entry['title'] = row[3]
+        entry['content'] = row[4]
+    if 'author' in expand:
+        entry['author'] = authors.get(row[2], 'No Idea')
+    return entry
+
+
+def parse_rank(args) -> str:
+    '''Read the `rank` query parameter (score by default); raises ValueError for unknown rankings.'''
+    rank = args.get('rank', 'score')
+    if rank not in RANK_COLUMNS:
+        raise ValueError(f"rank must be one of {','.join(RANK_COLUMNS)}")
+    return rank
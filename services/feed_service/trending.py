@@ -0,0 +1,156 @@
+# trending.py
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from loguru import logger
+
+
+'''
+    trending
+        Time-decayed trending score, kept in Score_table.trending next to the
+        raw all-time `score`.
+
+        Forward decay: an impression made at time t adds +-2^((t - epoch) / half_life)
+        to the trending score of its post, `epoch` being the single row of
+        Trending_state. Every post shares the epoch, so ordering by `trending`
+        is ordering by the decayed score (each impression losing half its weight
+        every `half_life` seconds) at any moment, with no read-time computation:
+        the feed reads it through an index on (trending DESC, post_id DESC).
+
+        - Writers (submit_impression, the impression buffer, bulk ingestion)
+          update `trending` in the same statement as `score`, reading the epoch
+          without a lock: the single Trending_state row is never a hot spot.
+        - Values grow as 2^(elapsed / half_life) since the epoch, so the epoch
+          must be moved forward regularly: TrendingReconciler does it every
+          `interval` seconds (TRENDING_RECONCILE_INTERVAL_SECONDS, default 1h).
+          Under a transaction-level advisory lock (one replica at a time) it sets
+          the epoch to NOW() and rebuilds every trending score from the last
+          `window_half_lives` half-lives of Impression_table (read through its
+          time_of_impression index), which also repairs any drift (e.g.
+          impressions lost by a crashed buffer).
+        - The rebuild aggregates Impression_table before updating any row, so
+          Score_table rows are only locked from their update to the commit.
+          Impressions written while it runs may be weighed against the previous
+          epoch (off by the decay of one interval, ~3% for 1h / 1 day) or be
+          overwritten by the rebuilt value; the next rebuild corrects both.
+'''
+
+
+# Trending_state joined as `t` in the score updates
+TRENDING_EPOCH = '(SELECT epoch FROM Trending_state) AS t'
+HALF_LIFE_SECONDS = float(os.getenv('TRENDING_HALF_LIFE_SECONDS', '86400'))
+# Weight of an impression made NOW(), relative to the epoch
+TRENDING_WEIGHT = f'power(2, extract(epoch FROM NOW() - t.epoch) / {HALF_LIFE_SECONDS!r})'
+
+# Key of the advisory lock held by the replica rebuilding the scores
+RECONCILE_LOCK_KEY = 0x7472656e64
+
+
+class TrendingReconciler:
+
+    def __init__(self,
+                 get_connection: Callable,
+                 release_connection: Callable,
+                 half_life: float = HALF_LIFE_SECONDS,
+                 interval: float = 3600.0,
+                 window_half_lives: float = 10.0,
+                 on_rebuild: Optional[Callable[[], None]] = None):
+        self.get_connection = get_connection
+        self.release_connection = release_connection
+        self.half_life = half_life
+        self.interval = interval
+        self.window_half_lives = window_half_lives
+        self.on_rebuild = on_rebuild
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.runs = 0
+        self.skipped = 0
+        self.failures = 0
+        self.last_rows = 0
+        self.last_duration = 0.0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='trending-reconciler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        logger.info(f"Starting trending reconciler, every {self.interval}s")
+        while not self._stopped.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Trending rebuild failed: {e}")
+
+    def run_once(self) -> Optional[int]:
+        '''Rebuild the trending scores; returns the rows updated, None if another replica is rebuilding.'''
+        start = time.monotonic()
+        conn = self.get_connection()
+        try:
+            conn.autocommit = False
+            cur = conn.cursor()
+            cur.execute('SELECT pg_try_advisory_xact_lock(%s)', (RECONCILE_LOCK_KEY,))
+            if not cur.fetchone()[0]:
+                conn.rollback()
+                self.skipped += 1
+                return None
+            # Writers read the epoch without locking it: they are not blocked by this update
+            cur.execute('UPDATE Trending_state SET epoch = NOW()')
+            # MATERIALIZED: the whole aggregation runs before the first Score_table row is locked
+            cur.execute(
+                'WITH d AS MATERIALIZED ('
+                "    SELECT post_id, SUM(CASE impression_type WHEN 'UP' THEN 1 ELSE -1 END "
+                '               * power(2, extract(epoch FROM time_of_impression - NOW()) / %s)) AS trending '
+                '    FROM Impression_table WHERE time_of_impression > NOW() - make_interval(secs => %s) '
+                '    GROUP BY post_id'
+                ') '
+                'UPDATE Score_table AS s SET trending = COALESCE(d.trending, 0) '
+                'FROM Score_table AS s0 LEFT JOIN d ON d.post_id = s0.post_id '
+                'WHERE s.post_id = s0.post_id AND s.trending IS DISTINCT FROM COALESCE(d.trending, 0)',
+                (self.half_life, self.half_life * self.window_half_lives)
+            )
+            rows = cur.rowcount
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.release_connection(conn)
+
+        self.runs += 1
+        self.last_rows = rows
+        self.last_duration = time.monotonic() - start
+        logger.info(f"Rebuilt {rows} trending scores in {self.last_duration:.3f}s")
+        if self.on_rebuild:
+            self.on_rebuild()
+        return rows
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'runs': self.runs,
+            'skipped': self.skipped,
+            'failures': self.failures,
+            'last_rows': self.last_rows,
+            'last_duration_seconds': self.last_duration
+        }
+
+
+def reconciler_from_env(get_connection: Callable, release_connection: Callable,
+                        on_rebuild: Optional[Callable[[], None]] = None) -> Optional[TrendingReconciler]:
+    '''Build a TrendingReconciler configured through TRENDING_* environment variables, None if disabled (interval 0).'''
+    interval = float(os.getenv('TRENDING_RECONCILE_INTERVAL_SECONDS', '3600'))
+    if interval <= 0:
+        return None
+    return TrendingReconciler(
+        get_connection,
+        release_connection,
+        interval=interval,
+        window_half_lives=float(os.getenv('TRENDING_WINDOW_HALF_LIVES', '10')),
+        on_rebuild=on_rebuild
+    )
@@ -0,0 +1,106 @@
+# post_cache.py
+import os
+import threading
+from typing import Callable, Dict, List, Optional
+
+import redis
+
+from common.ttl_cache import RedisTTLCache, TTLCache
+
+
+'''
+    post_cache
+        PostCache: read-through cache of Post_table rows for /get_post_info.
+
+        Posts never change once inserted, so a cached row is served until it is
+        evicted or `ttl` expires (POST_CACHE_TTL_SECONDS, default 1h), never as a
+        stale fallback (both tiers are common.ttl_cache caches without `max_stale`).
+
+        - The in-process tier is a bounded LRU (POST_CACHE_MAX_ENTRIES).
+        - With POST_CACHE_REDIS=true a second tier shared by all replicas is kept
+          in redis_server under `post:<post_id>`; its hits are copied into the
+          in-process tier. Redis errors are treated as misses.
+        - get_or_load() only calls the loader (the Post_table query) on a miss
+          in both tiers; posts that do not exist are not cached.
+        - get_many_or_load() does the same for a batch: one lookup per tier and
+          a single loader call for all the misses.
+        - put() is called by insert_post, so a new post is served from the cache
+          from its first read on.
+
+        Only the post row is cached: the author is still resolved through the
+        profile client, which has its own TTL, breaker and fallback.
+'''
+
+
+Post = Dict[str, object]
+
+
+class PostCache:
+
+    def __init__(self, cache: TTLCache, shared_cache: Optional[RedisTTLCache] = None):
+        self.cache = cache
+        self.shared_cache = shared_cache
+        self.loads = 0
+        self._lock = threading.Lock()
+
+    def get(self, post_id: int) -> Optional[Post]:
+        return self.get_many([post_id]).get(post_id)
+
+    def get_many(self, post_ids: List[int]) -> Dict[int, Post]:
+        posts = self.cache.get_many(post_ids)
+        missing = [post_id for post_id in post_ids if post_id not in posts]
+        if missing and self.shared_cache:
+            shared_posts, ages = self.shared_cache.get_many(missing)
+            self.cache.put_many(shared_posts, ages)
+            posts.update(shared_posts)
+        return posts
+
+    def get_many_or_load(self, post_ids: List[int],
+                         loader: Callable[[List[int]], Dict[int, Post]]) -> Dict[int, Post]:
+        '''Return {post_id: post} for the posts that exist, loading all the misses with one loader call.'''
+        posts = self.get_many(post_ids)
+        missing = [post_id for post_id in post_ids if post_id not in posts]
+        if missing:
+            loaded = loader(missing)
+            with self._lock:
+                self.loads += 1
+            self.put_many(loaded)
+            posts.update(loaded)
+        return posts
+
+    def get_or_load(self, post_id: int, loader: Callable[[int], Optional[Post]]) -> Optional[Post]:
+        post = self.get(post_id)
+        if post is None:
+            post = loader(post_id)
+            with self._lock:
+                self.loads += 1
+            if post is not None:
+                self.put(post)
+        return post
+
+    def put(self, post: Post):
+        self.put_many({post['post_id']: post})
+
+    def put_many(self, posts: Dict[int, Post]):
+        if not posts:
+            return
+        self.cache.put_many(posts)
+        if self.shared_cache:
+            self.shared_cache.put_many(posts)
+
+    def stats(self) -> Dict[str, int]:
+        stats = self.cache.stats()
+        stats['loads'] = self.loads
+        return stats
+
+
+def post_cache_from_env(redis_client: redis.Redis) -> PostCache:
+    '''Build a PostCache configured through POST_CACHE_* environment variables.'''
+    ttl = float(os.getenv('POST_CACHE_TTL_SECONDS', '3600'))
+    shared_cache = None
+    if os.getenv('POST_CACHE_REDIS', 'false').lower() in ('1', 'true', 'yes'):
+        shared_cache = RedisTTLCache(redis_client, 'post:', ttl=ttl)
+    return PostCache(
+        TTLCache(max_entries=int(os.getenv('POST_CACHE_MAX_ENTRIES', '10000')), ttl=ttl),
+        shared_cache=shared_cache
+    )
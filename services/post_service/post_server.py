@@ -1,6 +1,6 @@
 from flask import Flask, jsonify, request, abort
+from werkzeug.exceptions import HTTPException
 import psycopg2
-from psycopg2 import pool
 import os
 import requests
 from loguru import logger
@@ -8,13 +8,32 @@ from dotenv import load_dotenv
 import redis
 import requests
 import threading
+import time
+from typing import Any, Dict, List
+from psycopg2.extras import execute_values
+from common.bulk_ingest import bulk_response, required_int, required_str
+from common.db_pool import PoolTimeout, pool_from_env
+from common.health import init_health
+from common.breaker_status import STATUS_CHANNEL, broadcaster_from_env
+from common.bulkhead import bulkhead_from_env
+from common.circuit_breaker import breaker_from_env
+from common.health_prober import prober_from_env
+from common.metrics import init_metrics, observe_breaker, register_stats
+from common.http_client import session_from_env, timeout_from_env
+from common.profile_cache import cache_from_env, shared_cache_from_env
+from common.profile_client import ProfileClient
+from post_cache import post_cache_from_env
 
 
 '''
     post_server
         API endpoints:
+            - '/healthz', methods=['GET']
+            - '/readyz', methods=['GET']
             - '/get_post_info', methods=['GET']
+            - '/get_posts_info', methods=['GET']
             - '/insert_post', methods=['POST']
+            - '/bulk_insert_posts', methods=['POST']
 '''
 
 
@@ -30,38 +49,60 @@ DB_USER = os.getenv('DB_USER', 'your_user')
 DB_PASSWORD = os.getenv('DB_PASSWORD', 'your_password')
 PROFILE_SERVICE_URL = os.getenv('PROFILE_SERVICE_URL', 'http://profile_service:5002')
 PORT=os.getenv('PORT',"5001")
+# Most post_ids accepted by /get_posts_info
+MAX_BATCH_SIZE = int(os.getenv('POST_MAX_BATCH_SIZE', '100'))
 
 
 redis_client = redis.StrictRedis(host='redis_server', port=6379, db=0)
-# Initial state variables
-count = 0
-profile_service_status = "Unknown"
-cached_value = {}
-
-
-# Subscribe to the profile_service_status channel
-pubsub = redis_client.pubsub()
-pubsub.subscribe('profile_service_status')
-
-# Create a connection pool (minconn: minimum connections, maxconn: maximum connections)
-connection_pool = psycopg2.pool.SimpleConnectionPool(
-    minconn=1,
-    maxconn=10,
-    host=DB_HOST,
-    database=DB_NAME,
-    user=DB_USER,
-    password=DB_PASSWORD
-)
+# Circuit breaker guarding every call to profile_service
+profile_breaker = breaker_from_env('profile_service')
+# Bounded LRU/TTL cache of profiles, also used as fallback while the breaker is open,
+# optionally backed by a cache in redis_server shared by all replicas
+profile_cache = cache_from_env()
+shared_profile_cache = shared_cache_from_env(redis_client)
+# Request threads allowed to wait on profile_service at a time (half the worker's threads by default);
+# a full bulkhead sends requests to the cache fallback instead of queueing
+profile_bulkhead = bulkhead_from_env('profile_service',
+                                     default_max_concurrent=max(1, int(os.getenv('WEB_THREADS', '8')) // 2))
+profile_client = ProfileClient(PROFILE_SERVICE_URL, profile_breaker, profile_cache,
+                               shared_cache=shared_profile_cache,
+                               session=session_from_env(),
+                               timeout=timeout_from_env(),
+                               bulkhead=profile_bulkhead,
+                               max_batch_size=int(os.getenv('PROFILE_BATCH_SIZE', '100')))
+# Breaker state changes (not individual calls) are shared with the other replicas
+status_broadcaster = broadcaster_from_env(profile_breaker, redis_client)
+# Background /healthz probes of profile_service drive the breaker, one replica probing at a time
+health_prober = prober_from_env(profile_breaker, PROFILE_SERVICE_URL, redis_client, status_broadcaster.origin)
+# Posts are immutable once inserted: rows read (or inserted) once are served from memory,
+# optionally shared with the other replicas through redis_server
+post_cache = post_cache_from_env(redis_client)
+
+
+
+# Connection pool, created in each worker process by init_db_pool
+connection_pool = None
+
+def init_db_pool():
+    global connection_pool
+    # Thread-safe pool: waits up to DB_POOL_TIMEOUT_SECONDS for a free connection
+    connection_pool = pool_from_env(
+        host=DB_HOST,
+        database=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD
+    )
 
 # Function to get a connection from the pool
 def get_db_connection():
     try:
         # Get a connection from the pool
-        conn = connection_pool.getconn()
-        if conn:
-            return conn
+        return connection_pool.getconn()
+    except PoolTimeout as e:
+        logger.error(f"Error getting connection: {e}")
+        abort(503)
     except Exception as e:
-        print(f"Error getting connection: {e}")
+        logger.error(f"Error getting connection: {e}")
         abort(500)
 
 # Function to release the connection back to the pool
@@ -69,58 +110,94 @@ def release_db_connection(conn):
     if conn:
         connection_pool.putconn(conn)
 
+# Route to get the DB pool statistics (in use, waiters, wait time, ...)
+@app.route('/pool_stats', methods=['GET'])
+def pool_stats():
+    return jsonify(connection_pool.stats()), 200
+
+# Readiness of this worker: a pooled connection answers SELECT 1 and redis_server answers PING
+def check_database():
+    if connection_pool is None:
+        raise RuntimeError('database pool not initialised')
+    connection_pool.ping(timeout=float(os.getenv('READINESS_DB_TIMEOUT_SECONDS', '0.5')))
+
+readiness = init_health(app, {'database': check_database, 'redis': lambda: redis_client.ping()})
+
+# Prometheus metrics served at /metrics
+init_metrics(app)
+register_stats('db_pool', lambda: connection_pool.stats() if connection_pool else {},
+               counters=('waits', 'wait_seconds_total', 'timeouts'))
+observe_breaker(profile_breaker)
+register_stats('breaker_status', status_broadcaster.stats, counters=('published', 'applied', 'ignored'))
+register_stats('profile_bulkhead', profile_bulkhead.stats, counters=('admitted', 'rejected'))
+register_stats('profile_single_flight', profile_client.single_flight.stats, counters=('flights', 'shared_keys'))
+if health_prober:
+    register_stats('health_prober', health_prober.stats, counters=('probes', 'probe_failures'))
+register_stats('profile_cache', profile_cache.stats,
+               counters=('hits', 'misses', 'fallback_hits', 'fallback_misses', 'evictions'))
+register_stats('post_cache', post_cache.stats, counters=('hits', 'misses', 'evictions', 'loads'))
+if post_cache.shared_cache:
+    register_stats('shared_post_cache', post_cache.shared_cache.stats, counters=('hits', 'misses', 'errors'))
+if shared_profile_cache:
+    register_stats('shared_profile_cache', shared_profile_cache.stats,
+                   counters=('hits', 'misses', 'fallback_hits', 'fallback_misses', 'errors'))
+
 
 def redis_listener():
     logger.info("Starting Redis listener...")
-    global profile_service_status,count
-    for message in pubsub.listen():
-        # Check if the message is from the 'profile_service_status' channel
-        if message['type'] == 'message' and message['channel'] == b'profile_service_status':
-            if message['data'].decode('utf-8') in ["UP","DOWN"]:
-                profile_service_status=message['data'].decode('utf-8')
-                count=0
-                logger.info(f" profile_service_status: updated to {profile_service_status}")
-        else:
-            logger.info(f"Ignored message from channel: {message['channel']}")
-    return
-
-
-def get_user_info_gracefully(user_id : str):
-    global count, profile_service_status, cached_value
-    
-    # Check service status or retry logic
-    if profile_service_status == "Unknown" or profile_service_status == "UP" or count == 2:
+    while True:
         try:
-            # Hit the profile_service to fetch user info
-            logger.info(f"Hitting profile_service for user_id: {user_id}")
-            user_response = requests.get(f'{PROFILE_SERVICE_URL}/get_user_info', params={'user_id': user_id})
-            user_response.raise_for_status()  # Raise exception if the response is not 2xx
-
-            user_info = user_response.json()
-            # Cache the fetched user info
-            cached_value[user_id] = user_info
-
-            # Broadcast that profile_service is "UP" after successful fetch
-            redis_client.publish('profile_service_status', 'UP')
-            count = 0  # Reset the count
-
-            return user_info
-
-        except requests.exceptions.ConnectionError:
-            logger.error(f"Failed to connect to profile_service for user_id: {user_id}, broadcasting status as Down")
-
-            # Broadcast that profile_service is "Down"
-            redis_client.publish('profile_service_status', 'Down')
-            count = 0  # Reset the count
-            # Return cached value if available
-            return cached_value.get(user_id,"No Idea")
-
-    else:
-        # Return cached value if service is Down
-        logger.info(f"Returning cached value as profile_service is {profile_service_status}")
-        count += 1
-        return cached_value.get(user_id,"No Idea")
-    
+            # Subscribe to the profile_service_status channel
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(STATUS_CHANNEL)
+            # Redis may have restarted and lost the version counter
+            status_broadcaster.reset_sequence()
+            for message in pubsub.listen():
+                status_broadcaster.handle_message(message['data'])
+        except redis.ConnectionError as e:
+            logger.error(f"Redis listener lost its connection ({e}), reconnecting")
+            time.sleep(1)
+
+
+def get_users_info_gracefully(user_ids : List[int]) -> Dict[int, Any]:
+    users = profile_client.get_users_info(user_ids)
+    return {user_id: users.get(user_id,"No Idea") for user_id in user_ids}
+
+
+def get_user_info_gracefully(user_id : int):
+    return get_users_info_gracefully([user_id])[user_id]
+
+
+
+# Read a post row from Post_table, None if there is no such post
+def load_post(post_id : int):
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        logger.debug("Hitting the database to fetch post information")
+        cur.execute('SELECT post_id, user_id, title, content FROM Post_table WHERE post_id = %s', (post_id,))
+        post = cur.fetchone()
+    finally:
+        # Give the connection back before calling profile_service, a slow
+        # profile lookup must not hold a database connection as well
+        release_db_connection(conn)
+    if not post:
+        return None
+    return {'post_id': post[0], 'user_id': post[1], 'title': post[2], 'content': post[3]}
+
+
+# Read many post rows from Post_table with a single query, {post_id: post} for those that exist
+def load_posts(post_ids : List[int]):
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        logger.debug(f"Hitting the database to fetch {len(post_ids)} posts")
+        cur.execute('SELECT post_id, user_id, title, content FROM Post_table WHERE post_id = ANY(%s)', (post_ids,))
+        rows = cur.fetchall()
+    finally:
+        release_db_connection(conn)
+    return {post[0]: {'post_id': post[0], 'user_id': post[1], 'title': post[2], 'content': post[3]}
+            for post in rows}
 
 
 # Route to get post info
@@ -131,25 +208,24 @@ def get_post_info():
     
     if not post_id:
         return jsonify({'error': 'post_id is required'}), 400
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        logger.debug("Hitting the database to fetch post information")
-        # Fetch post information from Post_table
-        cur.execute('SELECT post_id, user_id, title, content FROM Post_table WHERE post_id = %s', (post_id,))
-        post = cur.fetchone()
+        post_id = int(post_id)
+    except ValueError:
+        return jsonify({'error': 'post_id must be an integer'}), 400
+    try:
+        # Served from the post cache, Post_table is only read on a miss
+        post = post_cache.get_or_load(post_id, load_post)
         
         if not post:
             return jsonify({'error': 'Post not found'}), 404
         
         post_info = {
-            'post_id': post[0],
-            'title': post[2],
-            'content': post[3]
+            'post_id': post['post_id'],
+            'title': post['title'],
+            'content': post['content']
         }
         
-        user_id = post[1]
+        user_id = post['user_id']
         
         logger.debug(f"Hitting the {PROFILE_SERVICE_URL} to fetch user information")
         # Fetch user information from profile service
@@ -159,12 +235,53 @@ def get_post_info():
         
         return jsonify(post_info), 200
     
+    except HTTPException:
+        # e.g. 503 from get_db_connection when the pool is exhausted
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    
-    finally:
-        if conn:
-            release_db_connection(conn)
+
+# Route to get info for many posts: one Post_table query and one author lookup for the whole batch
+@app.route('/get_posts_info', methods=['GET'])
+def get_posts_info():
+    logger.debug("Got a new request to get_posts_info")
+    raw_post_ids = request.args.get('post_ids')
+
+    if not raw_post_ids:
+        return jsonify({'error': 'post_ids is required'}), 400
+
+    try:
+        post_ids = [int(post_id) for post_id in raw_post_ids.split(',')]
+    except ValueError:
+        return jsonify({'error': 'post_ids must be a comma separated list of integers'}), 400
+
+    # Keep request order, drop duplicates
+    post_ids = list(dict.fromkeys(post_ids))
+    if len(post_ids) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'at most {MAX_BATCH_SIZE} post_ids are allowed'}), 400
+
+    try:
+        posts = post_cache.get_many_or_load(post_ids, load_posts)
+        authors = get_users_info_gracefully([post['user_id'] for post in posts.values()])
+    except HTTPException:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    # One entry per requested post, in request order; unknown posts carry their own error
+    posts_info = []
+    for post_id in post_ids:
+        post = posts.get(post_id)
+        if post is None:
+            posts_info.append({'post_id': post_id, 'error': 'Post not found'})
+            continue
+        posts_info.append({
+            'post_id': post_id,
+            'title': post['title'],
+            'content': post['content'],
+            'author': authors[post['user_id']]
+        })
+    return jsonify({'posts': posts_info}), 200
 
 # Route to insert a new post
 @app.route('/insert_post', methods=['POST'])
@@ -202,9 +319,13 @@ def insert_post():
         
         # Commit transaction
         conn.commit()
+        # The post is read back from the cache from now on
+        post_cache.put({'post_id': post_id, 'user_id': int(user_id), 'title': title, 'content': content})
         
         return jsonify({'message': 'Post inserted successfully', 'post_id': post_id}), 201
     
+    except HTTPException:
+        raise
     except Exception as e:
         conn.rollback()
         return jsonify({'error': str(e)}), 500
@@ -213,8 +334,47 @@ def insert_post():
         if conn:
             release_db_connection(conn)
 
+# Bulk ingestion: (user_id, title, content) rows of an NDJSON stream; every chunk is one
+# statement inserting the posts and their initial Score_table rows
+def parse_post(record):
+    content = record.get('content')
+    if content is not None and not isinstance(content, str):
+        raise ValueError('content must be a string')
+    return (required_int(record, 'user_id'), required_str(record, 'title', max_length=255), content)
+
+def write_posts(cur, rows):
+    execute_values(
+        cur,
+        'WITH inserted AS (INSERT INTO Post_table (user_id, title, content) VALUES %s RETURNING post_id) '
+        'INSERT INTO Score_table (post_id, last_updated) SELECT post_id, NOW() FROM inserted',
+        rows, page_size=len(rows)
+    )
+
+# Route to insert many posts from an NDJSON body ({"user_id", "title", "content"} per line).
+# Bulk-loaded posts are not put in the post cache, a backfill would evict the hot posts
+@app.route('/bulk_insert_posts', methods=['POST'])
+def bulk_insert_posts():
+    logger.debug("Got a new request to bulk_insert_posts")
+    return bulk_response(request.stream, parse_post, write_posts, get_db_connection, release_db_connection)
+
+# Initialise the per-process resources (pools, Redis listener) and return the app.
+# Called once per worker, after the WSGI server forked, e.g. gunicorn "module:create_app()"
+initialised = False
+init_lock = threading.Lock()
+
+def create_app():
+    global initialised
+    with init_lock:
+        if not initialised:
+            init_db_pool()
+            listener_thread = threading.Thread(target=redis_listener, name='redis-listener', daemon=True)
+            listener_thread.start()
+            status_broadcaster.start()
+            if health_prober:
+                health_prober.start()
+            initialised = True
+    return app
+
+# Start the Flask development server
 if __name__ == '__main__':
-    listener_thread = threading.Thread(target=redis_listener)
-    listener_thread.start()
-    print("Thread started on post_service")
-    app.run(host='0.0.0.0', port=int(PORT))
+    create_app().run(host='0.0.0.0', port=int(PORT), threaded=True)
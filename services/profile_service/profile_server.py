@@ -1,19 +1,29 @@
 # profile_service.py
 
 from flask import Flask, jsonify, request, abort
+from werkzeug.exceptions import HTTPException
 import psycopg2
-from psycopg2 import pool
 import os
 import requests
 from loguru import logger
 from dotenv import load_dotenv
+import threading
+from psycopg2.extras import execute_values
+from common.bulk_ingest import bulk_response, required_str
+from common.db_pool import PoolTimeout, pool_from_env
+from common.health import init_health
+from common.metrics import init_metrics, register_stats
 
 
 '''
     Profile_server
         API endpoints:
+            - '/healthz', methods=['GET']
+            - '/readyz', methods=['GET']
             - /get_user_info', methods=['GET']
+            - '/get_users_info', methods=['GET']
             - '/insert_new_user', methods=['POST']
+            - '/bulk_insert_users', methods=['POST']
 '''
 
 
@@ -28,27 +38,33 @@ DB_NAME = os.getenv('DB_NAME', 'impressions_db')
 DB_USER = os.getenv('DB_USER', 'your_user')
 DB_PASSWORD = os.getenv('DB_PASSWORD', 'your_password')
 PORT=os.getenv('PORT',"5002")
+# Upper bound on the number of user_ids accepted by /get_users_info
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', '100'))
 
 
-# Create a connection pool (minconn: minimum connections, maxconn: maximum connections)
-connection_pool = psycopg2.pool.SimpleConnectionPool(
-    minconn=1,
-    maxconn=10,
-    host=DB_HOST,
-    database=DB_NAME,
-    user=DB_USER,
-    password=DB_PASSWORD
-)
+# Connection pool, created in each worker process by init_db_pool
+connection_pool = None
+
+def init_db_pool():
+    global connection_pool
+    # Thread-safe pool: waits up to DB_POOL_TIMEOUT_SECONDS for a free connection
+    connection_pool = pool_from_env(
+        host=DB_HOST,
+        database=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD
+    )
 
 # Function to get a connection from the pool
 def get_db_connection():
     try:
         # Get a connection from the pool
-        conn = connection_pool.getconn()
-        if conn:
-            return conn
+        return connection_pool.getconn()
+    except PoolTimeout as e:
+        logger.error(f"Error getting connection: {e}")
+        abort(503)
     except Exception as e:
-        print(f"Error getting connection: {e}")
+        logger.error(f"Error getting connection: {e}")
         abort(500)
 
 # Function to release the connection back to the pool
@@ -56,6 +72,24 @@ def release_db_connection(conn):
     if conn:
         connection_pool.putconn(conn)
 
+# Route to get the DB pool statistics (in use, waiters, wait time, ...)
+@app.route('/pool_stats', methods=['GET'])
+def pool_stats():
+    return jsonify(connection_pool.stats()), 200
+
+# Readiness of this worker: a pooled connection answers SELECT 1
+def check_database():
+    if connection_pool is None:
+        raise RuntimeError('database pool not initialised')
+    connection_pool.ping(timeout=float(os.getenv('READINESS_DB_TIMEOUT_SECONDS', '0.5')))
+
+readiness = init_health(app, {'database': check_database})
+
+# Prometheus metrics served at /metrics
+init_metrics(app)
+register_stats('db_pool', lambda: connection_pool.stats() if connection_pool else {},
+               counters=('waits', 'wait_seconds_total', 'timeouts'))
+
 # Route to get post info
 @app.route('/get_user_info', methods=['GET'])
 def get_user_info():
@@ -86,6 +120,9 @@ def get_user_info():
         
         return jsonify(user_info), 200
     
+    except HTTPException:
+        # e.g. 503 from get_db_connection when the pool is exhausted
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     
@@ -93,6 +130,50 @@ def get_user_info():
         if conn:
             release_db_connection(conn)
 
+# Route to get info for many users with a single query
+@app.route('/get_users_info', methods=['GET'])
+def get_users_info():
+
+    logger.info(f"Got a new request to get_users_info")
+    raw_user_ids = request.args.get('user_ids')
+
+    if not raw_user_ids:
+        return jsonify({'error': 'user_ids is required'}), 400
+
+    try:
+        user_ids = [int(user_id) for user_id in raw_user_ids.split(',')]
+    except ValueError:
+        return jsonify({'error': 'user_ids must be a comma separated list of integers'}), 400
+
+    # Keep request order, drop duplicates
+    user_ids = list(dict.fromkeys(user_ids))
+    if len(user_ids) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'at most {MAX_BATCH_SIZE} user_ids are allowed'}), 400
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        logger.info(f"Fetching user info for {len(user_ids)} user_ids")
+
+        # Fetch all requested users from User_table in one round trip
+        cur.execute('SELECT user_id, user_name FROM User_table WHERE user_id = ANY(%s)', (user_ids,))
+        found = {user[0]: {'user_id': user[0], 'user_name': user[1]} for user in cur.fetchall()}
+
+        return jsonify({
+            'users': [found[user_id] for user_id in user_ids if user_id in found],
+            'not_found': [user_id for user_id in user_ids if user_id not in found]
+        }), 200
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    finally:
+        if conn:
+            release_db_connection(conn)
+
 # Route to insert a new user
 @app.route('/insert_new_user', methods=['POST'])
 def insert_new_user():
@@ -125,6 +206,8 @@ def insert_new_user():
         
         return jsonify({'user_id': user_id}), 201
     
+    except HTTPException:
+        raise
     except Exception as e:
         conn.rollback()
         return jsonify({'error': str(e)}), 500
@@ -133,5 +216,32 @@ def insert_new_user():
         if conn:
             release_db_connection(conn)
 
+# Bulk ingestion: (user_name,) rows of an NDJSON stream, one multi-row INSERT per chunk
+def parse_user(record):
+    return (required_str(record, 'user_name', max_length=255),)
+
+def write_users(cur, rows):
+    execute_values(cur, 'INSERT INTO User_table (user_name) VALUES %s', rows, page_size=len(rows))
+
+# Route to insert many users from an NDJSON body ({"user_name": ...} per line)
+@app.route('/bulk_insert_users', methods=['POST'])
+def bulk_insert_users():
+    logger.info(f"Got a new request to bulk_insert_users")
+    return bulk_response(request.stream, parse_user, write_users, get_db_connection, release_db_connection)
+
+# Initialise the per-process resources (DB pool) and return the app.
+# Called once per worker, after the WSGI server forked, e.g. gunicorn "module:create_app()"
+initialised = False
+init_lock = threading.Lock()
+
+def create_app():
+    global initialised
+    with init_lock:
+        if not initialised:
+            init_db_pool()
+            initialised = True
+    return app
+
+# Start the Flask development server
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=int(PORT))
+    create_app().run(host='0.0.0.0', port=int(PORT), threaded=True)
@@ -2,6 +2,14 @@ import requests
 import json
 from faker import Faker
 import random
+import argparse
+import math
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
 
 
 
@@ -121,9 +129,269 @@ def do_sequence_of_actions():
     
 
 
-if __name__ == "__main__":
-    
-    for _ in range(1):
+'''
+    Load generator
+        python3 simulate_user.py --load --concurrency 32 --duration 60
+        python3 simulate_user.py --load --rate 200 --duration 60            (open loop)
+        python3 simulate_user.py --load --duration 90 --kill-profile-at 30 --restore-profile-at 60
+
+        - Closed loop (default): `--concurrency` threads each send the next request
+          as soon as the previous one answered.
+        - Open loop (`--rate`): requests arrive as a Poisson process at `--rate`
+          requests per second whatever the latency, and are served by up to
+          `--concurrency` threads. Latency is measured from the scheduled arrival
+          time, so queueing behind a slow system is part of the measurement.
+        - `--mix` weights the endpoints, e.g. get_post_info=5,fetch_feed=3.
+        - `--kill-profile-at` / `--restore-profile-at` run `--kill-cmd` /
+          `--restore-cmd` (docker compose stop / start profile_service by
+          default) that many seconds into the run, and the report is split in
+          before / during / after phases.
+
+        The report gives, per endpoint (and phase), the request count, errors,
+        throughput and p50 / p95 / p99 / max latency in milliseconds. Requests
+        are counted in the phase they were sent in, and the throughput of a
+        phase is over the duration of that phase.
+'''
+
+
+DEFAULT_MIX = "get_post_info=5,fetch_feed=3,submit_impression=2,get_trending_user_info=1"
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for item in mix.split(','):
+        name, weight = item.split('=')
+        weights[name.strip()] = float(weight)
+    unknown = set(weights) - set(ENDPOINTS)
+    if unknown:
+        raise ValueError(f"Unknown endpoints in mix: {sorted(unknown)}")
+    return weights
+
+
+def _get_post_info(session, ids):
+    return session.get(f"{POST_SERVICE_URL}/get_post_info", params={'post_id': random.choice(ids['posts'])})
+
+def _fetch_feed(session, ids):
+    return session.get(f"{FEED_SERVICE_URL}/fetch_feed")
+
+def _submit_impression(session, ids):
+    return session.post(f"{FEED_SERVICE_URL}/submit_impression",
+                        json={'post_id': random.choice(ids['posts']),
+                              'user_id': random.choice(ids['users']),
+                              'impression_type': random.choice(choices)})
+
+def _get_trending_user_info(session, ids):
+    return session.get(f"{FEED_SERVICE_URL}/get_trending_user_info")
+
+def _get_user_info(session, ids):
+    return session.get(f"{PROFILE_SERVICE_URL}/get_user_info", params={'user_id': random.choice(ids['users'])})
+
+
+ENDPOINTS = {
+    'get_post_info': _get_post_info,
+    'fetch_feed': _fetch_feed,
+    'submit_impression': _submit_impression,
+    'get_trending_user_info': _get_trending_user_info,
+    'get_user_info': _get_user_info,
+}
+
+
+def seed_data(n_users: int, n_posts: int) -> Dict[str, List[int]]:
+    '''Create users and posts to run the load against.'''
+    users, posts = [], []
+    for _ in range(n_users):
+        response = requests.post(f"{PROFILE_SERVICE_URL}/insert_new_user", json={'user_name': fake.name()})
+        response.raise_for_status()
+        users.append(response.json()['user_id'])
+    for _ in range(n_posts):
+        response = requests.post(f"{POST_SERVICE_URL}/insert_post",
+                                 json={'user_id': random.choice(users), 'title': fake.job(), 'content': fake.sentence()})
+        response.raise_for_status()
+        posts.append(response.json()['post_id'])
+    print(f"Seeded {len(users)} users and {len(posts)} posts")
+    return {'users': users, 'posts': posts}
+
+
+class LoadRecorder:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (phase, endpoint) -> latencies in seconds / error count
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.phase = 'all'
+        # phase -> [start, end] in perf_counter seconds, end is None while the phase is running
+        self.phase_times: Dict[str, List[Optional[float]]] = {}
+
+    def start(self):
+        self.set_phase(self.phase)
+
+    def set_phase(self, phase: str):
+        now = time.perf_counter()
+        with self._lock:
+            if self.phase in self.phase_times:
+                self.phase_times[self.phase][1] = now
+            self.phase = phase
+            self.phase_times[phase] = [now, None]
+
+    def stop(self):
+        with self._lock:
+            self.phase_times[self.phase][1] = time.perf_counter()
+
+    def phase_duration(self, phase: str) -> float:
+        start, end = self.phase_times[phase]
+        return (time.perf_counter() if end is None else end) - start
+
+    def record(self, phase: str, endpoint: str, latency: float, ok: bool):
+        with self._lock:
+            key = (phase, endpoint)
+            self.latencies[key].append(latency)
+            if not ok:
+                self.errors[key] += 1
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    # Nearest-rank percentile
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def run_load(ids: Dict[str, List[int]], mix: Dict[str, float], duration: float, concurrency: int,
+             rate: Optional[float], recorder: LoadRecorder) -> float:
+    names, weights = list(mix), list(mix.values())
+    local = threading.local()
+
+    # Requests count in the phase they were sent in, even when they complete in the next one
+    def send(endpoint: str, scheduled: float, phase: str):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        try:
+            response = ENDPOINTS[endpoint](local.session, ids)
+            ok = response.status_code < 400
+        except requests.exceptions.RequestException:
+            ok = False
+        recorder.record(phase, endpoint, time.perf_counter() - scheduled, ok)
+
+    start = time.perf_counter()
+    deadline = start + duration
+    recorder.start()
+    if rate:
+        # Open loop: Poisson arrivals, latency measured from the scheduled time
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            scheduled = start
+            while True:
+                scheduled += random.expovariate(rate)
+                if scheduled >= deadline:
+                    break
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(send, random.choices(names, weights)[0], scheduled, recorder.phase)
+    else:
+        # Closed loop: each worker sends its next request once the previous one answered
+        def worker():
+            while time.perf_counter() < deadline:
+                send(random.choices(names, weights)[0], time.perf_counter(), recorder.phase)
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    recorder.stop()
+    return time.perf_counter() - start
+
+
+def schedule_fault(recorder: LoadRecorder, kill_at: Optional[float], restore_at: Optional[float],
+                   kill_cmd: str, restore_cmd: str) -> List[threading.Timer]:
+    timers = []
+    if kill_at is None:
+        return timers
+    recorder.phase = 'before_fault'
+
+    def kill():
+        # Switch first: requests failing while the command runs belong to the fault
+        recorder.set_phase('during_fault')
+        print(f"Killing profile_service: {kill_cmd}")
+        subprocess.run(kill_cmd, shell=True, check=False)
+
+    def restore():
+        recorder.set_phase('after_fault')
+        print(f"Restoring profile_service: {restore_cmd}")
+        subprocess.run(restore_cmd, shell=True, check=False)
+
+    timers.append(threading.Timer(kill_at, kill))
+    if restore_at is not None:
+        timers.append(threading.Timer(restore_at, restore))
+    for timer in timers:
+        timer.daemon = True
+        timer.start()
+    return timers
+
+
+def build_report(recorder: LoadRecorder) -> List[dict]:
+    '''One row per (phase, endpoint); throughput is over the duration of the phase.'''
+    rows = []
+    for (phase, endpoint), latencies in sorted(recorder.latencies.items()):
+        latencies = sorted(latencies)
+        rows.append({
+            'phase': phase,
+            'endpoint': endpoint,
+            'requests': len(latencies),
+            'errors': recorder.errors[(phase, endpoint)],
+            'throughput_rps': round(len(latencies) / recorder.phase_duration(phase), 2),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            'max_ms': round(latencies[-1] * 1000, 2),
+        })
+    return rows
+
+
+def print_report(rows: List[dict], elapsed: float):
+    total = sum(row['requests'] for row in rows)
+    print(f"\n{total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s)")
+    header = f"{'phase':<14}{'endpoint':<24}{'requests':>9}{'errors':>8}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}"
+    print(header)
+    print('-' * len(header))
+    for row in rows:
+        print(f"{row['phase']:<14}{row['endpoint']:<24}{row['requests']:>9}{row['errors']:>8}{row['throughput_rps']:>9}"
+              f"{row['p50_ms']:>9}{row['p95_ms']:>9}{row['p99_ms']:>9}{row['max_ms']:>9}")
+    print("(latencies in ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate users or generate load against the services")
+    parser.add_argument('--load', action='store_true', help="run the load generator instead of one action sequence")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30, help="seconds")
+    parser.add_argument('--rate', type=float, help="open loop: target arrival rate in requests per second")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help="endpoint weights, e.g. get_post_info=5,fetch_feed=3")
+    parser.add_argument('--seed-users', type=int, default=20)
+    parser.add_argument('--seed-posts', type=int, default=100)
+    parser.add_argument('--kill-profile-at', type=float, help="seconds into the run")
+    parser.add_argument('--restore-profile-at', type=float, help="seconds into the run")
+    parser.add_argument('--kill-cmd', default="docker compose stop profile_service")
+    parser.add_argument('--restore-cmd', default="docker compose start profile_service")
+    parser.add_argument('--json', help="also write the report to this file")
+    args = parser.parse_args()
+
+    if not args.load:
         do_sequence_of_actions()
+        return
 
-        
+    ids = seed_data(args.seed_users, args.seed_posts)
+    recorder = LoadRecorder()
+    schedule_fault(recorder, args.kill_profile_at, args.restore_profile_at, args.kill_cmd, args.restore_cmd)
+    elapsed = run_load(ids, parse_mix(args.mix), args.duration, args.concurrency, args.rate, recorder)
+    rows = build_report(recorder)
+    print_report(rows, elapsed)
+    if args.json:
+        with open(args.json, 'w') as f:
+            phases = {phase: round(recorder.phase_duration(phase), 3) for phase in recorder.phase_times}
+            json.dump({'elapsed_seconds': elapsed, 'phase_seconds': phases, 'endpoints': rows}, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
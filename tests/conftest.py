@@ -0,0 +1,326 @@
+# conftest.py
+import json
+import os
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import fakeredis
+import pytest
+from psycopg2 import extensions
+from werkzeug.serving import make_server
+from werkzeug.wrappers import Request, Response
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in ('services', 'services/post_service', 'services/feed_service', 'services/profile_service'):
+    sys.path.insert(0, os.path.join(ROOT, path))
+
+from common.breaker_status import BreakerStatusBroadcaster
+from common.bulkhead import Bulkhead
+from common.circuit_breaker import CircuitBreaker
+from common.db_pool import ConnectionPool
+from common.profile_cache import ProfileCache
+from common.profile_client import ProfileClient
+from common.ttl_cache import TTLCache
+
+
+'''
+    conftest
+        Fixtures to run post_server / feed_server on one machine, without Docker:
+
+        - profile_stub: a real HTTP server on 127.0.0.1 standing in for
+          profile_service's /get_users_info and /healthz, with injectable
+          latency, error status codes and hangs (longer than the client read
+          timeout).
+        - fake_db: in-memory Post_table / Score_table behind the real
+          ConnectionPool.
+        - clock: manual clock driving the breaker cooldown and the profile
+          cache TTL, so state transitions do not depend on wall time.
+        - post_server / feed_server: the service modules wired to the above
+          and to fakeredis, with a fresh breaker, cache and client per test.
+'''
+
+
+class ManualClock:
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+class ProfileStub:
+    '''Stand-in for profile_service, faults are set through the attributes.'''
+
+    def __init__(self, users: Dict[int, str]):
+        self.users = users
+        self.latency = 0.0
+        self.status = 200
+        self.calls = 0
+        self.health_checks = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requested: List[List[int]] = []
+        # Like profile_service's MAX_BATCH_SIZE
+        self.max_batch_size = 100
+        self._lock = threading.Lock()
+        self._server = make_server('127.0.0.1', 0, self._app, threaded=True)
+        self.url = f'http://127.0.0.1:{self._server.server_port}'
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def healthy(self):
+        self.latency = 0.0
+        self.status = 200
+
+    @Request.application
+    def _app(self, request: Request) -> Response:
+        with self._lock:
+            if request.path == '/healthz':
+                self.health_checks += 1
+            else:
+                self.calls += 1
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            return self._respond(request)
+        finally:
+            if request.path != '/healthz':
+                with self._lock:
+                    self.in_flight -= 1
+
+    def _respond(self, request: Request) -> Response:
+        if self.latency:
+            time.sleep(self.latency)
+        if self.status != 200:
+            return Response('injected failure', status=self.status)
+        if request.path == '/healthz':
+            return Response(json.dumps({'status': 'ok'}), mimetype='application/json')
+        user_ids = [int(user_id) for user_id in request.args['user_ids'].split(',')]
+        with self._lock:
+            self.requested.append(user_ids)
+        if len(user_ids) > self.max_batch_size:
+            return Response('too many user_ids', status=400)
+        users = [{'user_id': user_id, 'user_name': self.users[user_id]}
+                 for user_id in user_ids if user_id in self.users]
+        return Response(
+            json.dumps({'users': users, 'not_found': [u for u in user_ids if u not in self.users]}),
+            mimetype='application/json'
+        )
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class _FakeInfo:
+    transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+
+class FakeCursor:
+
+    def __init__(self, db: "FakeDatabase"):
+        self.db = db
+        self._rows: List[Tuple] = []
+        self.rowcount = -1
+
+    def execute(self, query: str, params: Tuple = ()):
+        self.db.queries.append(query)
+        if self.db.latency:
+            time.sleep(self.db.latency)
+        if query.startswith('SELECT 1'):
+            self._rows = [(1,)]
+        elif 'FROM Post_table WHERE post_id = %s' in query:
+            post = self.db.posts.get(int(params[0]))
+            self._rows = [post] if post else []
+        elif 'FROM Post_table WHERE post_id = ANY(%s)' in query:
+            self._rows = [self.db.posts[post_id] for post_id in params[0] if post_id in self.db.posts]
+        elif 'FROM User_table WHERE user_id = ANY(%s)' in query:
+            self._rows = [(user_id,) for user_id in params[0] if user_id in USERS]
+        elif query.startswith('INSERT INTO Post_table'):
+            post_id = max(self.db.posts, default=0) + 1
+            self.db.posts[post_id] = (post_id, int(params[0]), params[1], params[2])
+            self._rows = [(post_id,)]
+        elif query.startswith('INSERT INTO Score_table'):
+            self.db.scores[params[0]] = 0
+            self._rows = []
+        elif query.startswith('INSERT INTO Impression_table'):
+            self.db.impressions.append((int(params[0]), int(params[1]), params[2]))
+            self._rows = []
+        elif query.startswith('UPDATE Score_table AS s SET score'):
+            # Every impression weighs trending_weight, the fake has no clock
+            delta, post_id = params[0], int(params[2])
+            self.db.scores[post_id] += delta
+            self.db.trending[post_id] = self.db.trending.get(post_id, 0.0) + delta * self.db.trending_weight
+            self.rowcount = 1
+        elif query.startswith('SELECT pg_try_advisory_xact_lock'):
+            self._rows = [(self.db.reconcile_lock_free,)]
+        elif query.startswith('UPDATE Trending_state'):
+            self._rows = []
+        elif query.startswith('WITH d AS MATERIALIZED') and 'UPDATE Score_table AS s SET trending' in query:
+            # Rebuilt from the impressions, all of them as recent as the new epoch
+            rebuilt = {post_id: 0.0 for post_id in self.db.scores}
+            for post_id, _, impression_type in self.db.impressions:
+                rebuilt[post_id] += 1 if impression_type == 'UP' else -1
+            self.rowcount = sum(1 for post_id, value in rebuilt.items() if self.db.trending.get(post_id, 0.0) != value)
+            self.db.trending = rebuilt
+        elif 'FROM Score_table s' in query:
+            values = self.db.trending if 's.trending' in query else self.db.scores
+            rows = sorted(((post_id, values.get(post_id, 0)) + self.db.posts[post_id][1:]
+                           for post_id in self.db.scores),
+                          key=lambda row: (row[1], row[0]), reverse=True)
+            if len(params) == 3:
+                rows = [row for row in rows if (row[1], row[0]) < (params[0], params[1])]
+            self._rows = rows[:params[-1]]
+        else:
+            raise NotImplementedError(query)
+
+    def fetchone(self) -> Optional[Tuple]:
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self) -> List[Tuple]:
+        return list(self._rows)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FakeConnection:
+
+    def __init__(self, db: "FakeDatabase"):
+        self.db = db
+        self.closed = 0
+        self.autocommit = True
+        self.info = _FakeInfo()
+
+    def cursor(self) -> FakeCursor:
+        return FakeCursor(self.db)
+
+    def commit(self):
+        self.db.commits += 1
+
+    def rollback(self):
+        self.db.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+
+class FakeDatabase:
+    '''Post_table rows are (post_id, user_id, title, content); scores are {post_id: score}.'''
+
+    def __init__(self):
+        self.posts: Dict[int, Tuple] = {}
+        self.scores: Dict[int, int] = {}
+        self.queries: List[str] = []
+        self.latency = 0.0
+        self.commits = 0
+        self.rollbacks = 0
+        self.impressions: List[Tuple] = []
+        self.trending: Dict[int, float] = {}
+        self.trending_weight = 1.0
+        self.reconcile_lock_free = True
+
+    def add_post(self, post_id: int, user_id: int, score: int = 0):
+        self.posts[post_id] = (post_id, user_id, f'title {post_id}', f'content {post_id}')
+        self.scores[post_id] = score
+
+
+USERS = {user_id: f'user_{user_id}' for user_id in range(1, 11)}
+
+
+@pytest.fixture
+def clock() -> ManualClock:
+    return ManualClock()
+
+
+@pytest.fixture
+def profile_stub():
+    stub = ProfileStub(dict(USERS))
+    stub.start()
+    yield stub
+    stub.stop()
+
+
+@pytest.fixture
+def fake_redis():
+    return fakeredis.FakeStrictRedis()
+
+
+@pytest.fixture
+def fake_db() -> FakeDatabase:
+    db = FakeDatabase()
+    # post i is written by user i and ranked by its id
+    for post_id in range(1, 11):
+        db.add_post(post_id, user_id=post_id, score=post_id)
+    return db
+
+
+@pytest.fixture
+def breaker(clock) -> CircuitBreaker:
+    return CircuitBreaker('profile_service', failure_rate_threshold=0.5, slow_call_rate_threshold=0.5,
+                          slow_call_duration=0.1, window_size=4, minimum_calls=4, cooldown=5.0,
+                          half_open_max_calls=1, clock=clock)
+
+
+@pytest.fixture
+def profile_cache(clock) -> ProfileCache:
+    # Entries are fresh for 1s and may be served as a fallback for 60s more
+    return ProfileCache(max_entries=100, ttl=1.0, max_stale=60.0, clock=clock)
+
+
+def _wire(module, monkeypatch, profile_stub, fake_redis, fake_db, breaker, profile_cache):
+    bulkhead = Bulkhead('profile_service', max_concurrent=4)
+    client = ProfileClient(profile_stub.url, breaker, profile_cache, timeout=(0.2, 0.3), bulkhead=bulkhead)
+    pool = ConnectionPool(lambda: FakeConnection(fake_db), min_size=1, max_size=4, timeout=1.0)
+    monkeypatch.setattr(module, 'redis_client', fake_redis)
+    monkeypatch.setattr(module, 'profile_breaker', breaker)
+    monkeypatch.setattr(module, 'profile_cache', profile_cache)
+    monkeypatch.setattr(module, 'profile_bulkhead', bulkhead)
+    monkeypatch.setattr(module, 'profile_client', client)
+    # Not started: tests publish with flush() instead of the background thread
+    monkeypatch.setattr(module, 'status_broadcaster', BreakerStatusBroadcaster(breaker, fake_redis))
+    monkeypatch.setattr(module, 'connection_pool', pool)
+    monkeypatch.setattr(module, 'PROFILE_SERVICE_URL', profile_stub.url)
+    # Readiness is checked on every call instead of being cached across tests
+    monkeypatch.setattr(module.readiness, 'ttl', 0)
+    module.app.config['TESTING'] = True
+    return module
+
+
+@pytest.fixture
+def post_server(monkeypatch, profile_stub, fake_redis, fake_db, breaker, profile_cache):
+    import post_server
+    from post_cache import PostCache
+    monkeypatch.setattr(post_server, 'post_cache', PostCache(TTLCache(max_entries=100, ttl=3600)))
+    return _wire(post_server, monkeypatch, profile_stub, fake_redis, fake_db, breaker, profile_cache)
+
+
+@pytest.fixture
+def profile_server(monkeypatch, fake_db):
+    import profile_server
+    monkeypatch.setattr(profile_server, 'connection_pool', ConnectionPool(lambda: FakeConnection(fake_db)))
+    monkeypatch.setattr(profile_server.readiness, 'ttl', 0)
+    return profile_server
+
+
+@pytest.fixture
+def feed_server(monkeypatch, profile_stub, fake_redis, fake_db, breaker, profile_cache):
+    import feed_server
+    # Every request reads Score_table, the snapshot cache is tested on its own (test_top_posts_cache.py)
+    monkeypatch.setattr(feed_server.top_posts_cache, 'ttl', 0)
+    monkeypatch.setattr(feed_server.trending_posts_cache, 'ttl', 0)
+    return _wire(feed_server, monkeypatch, profile_stub, fake_redis, fake_db, breaker, profile_cache)
@@ -0,0 +1,136 @@
+# test_breaker_permits.py
+import asyncio
+
+import httpx
+import pytest
+import requests
+
+from common.async_profile_client import AsyncProfileClient
+from common.circuit_breaker import HALF_OPEN, OPEN
+from common.profile_client import ProfileClient
+
+
+'''
+    test_breaker_permits
+        Every call let through by the breaker records exactly one outcome, so
+        an unexpected error during the HALF_OPEN trial call cannot leave the
+        breaker waiting forever for its result.
+'''
+
+
+class BrokenSession:
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+    def get(self, *args, **kwargs):
+        raise self.error
+
+
+class BodySession:
+
+    def __init__(self, body: bytes):
+        self.body = body
+
+    def get(self, *args, **kwargs):
+        response = requests.Response()
+        response.status_code, response._content = 200, self.body
+        return response
+
+
+# Not JSON, and JSON without the expected payload
+INVALID_BODIES = [b'{"users": [{"user_id": 1', b'{"error": "maintenance"}', b'[1, 2]']
+
+
+def half_open(breaker, clock):
+    breaker.apply_remote_status('DOWN')
+    clock.advance(breaker.cooldown + 1)
+
+
+@pytest.mark.parametrize('error', [requests.exceptions.ChunkedEncodingError('truncated'),
+                                   requests.exceptions.ContentDecodingError('bad gzip')])
+def test_unreadable_body_during_the_trial_call_reopens_the_breaker(breaker, profile_cache, clock, error):
+    profile_cache.put(1, {'user_id': 1, 'user_name': 'user_1'})
+    client = ProfileClient('http://profile', breaker, profile_cache, session=BrokenSession(error))
+    half_open(breaker, clock)
+    clock.advance(2)
+
+    # Served from the stale cache, and the trial call counts as a failure
+    assert client.get_users_info([1]) == {1: {'user_id': 1, 'user_name': 'user_1'}}
+    assert breaker.state == OPEN
+
+    clock.advance(breaker.cooldown + 1)
+    assert breaker.allow_request()
+    assert breaker.state == HALF_OPEN
+
+
+def test_unexpected_error_still_returns_the_permit(breaker, profile_cache, clock):
+    client = ProfileClient('http://profile', breaker, profile_cache, session=BrokenSession(RuntimeError('bug')))
+    half_open(breaker, clock)
+
+    with pytest.raises(RuntimeError):
+        client.get_users_info([1])
+    assert breaker.state == OPEN
+    clock.advance(breaker.cooldown + 1)
+    assert breaker.allow_request()
+
+
+def test_cancelled_async_trial_call_returns_the_permit(breaker, profile_cache, clock):
+    async def scenario():
+        async def hang(request):
+            await asyncio.sleep(10)
+
+        async with httpx.AsyncClient(transport=httpx.MockTransport(hang)) as http_client:
+            client = AsyncProfileClient('http://profile', breaker, profile_cache, http_client)
+            half_open(breaker, clock)
+            task = asyncio.ensure_future(client.get_users_info([1]))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+    asyncio.run(scenario())
+    assert breaker.state == OPEN
+    clock.advance(breaker.cooldown + 1)
+    assert breaker.allow_request()
+
+
+def test_undecodable_async_body_falls_back(breaker, profile_cache, clock):
+    async def scenario():
+        def truncated(request):
+            raise httpx.DecodingError('bad gzip', request=request)
+
+        async with httpx.AsyncClient(transport=httpx.MockTransport(truncated)) as http_client:
+            client = AsyncProfileClient('http://profile', breaker, profile_cache, http_client)
+            half_open(breaker, clock)
+            return await client.get_users_info([1])
+
+    assert asyncio.run(scenario()) == {}
+    assert breaker.state == OPEN
+
+
+@pytest.mark.parametrize('body', INVALID_BODIES)
+def test_invalid_body_falls_back_to_the_stale_cache(breaker, profile_cache, clock, body):
+    profile_cache.put(1, {'user_id': 1, 'user_name': 'user_1'})
+    client = ProfileClient('http://profile', breaker, profile_cache, session=BodySession(body))
+    half_open(breaker, clock)
+    clock.advance(2)
+
+    assert client.get_users_info([1]) == {1: {'user_id': 1, 'user_name': 'user_1'}}
+    assert breaker.state == OPEN
+
+
+@pytest.mark.parametrize('body', INVALID_BODIES)
+def test_invalid_async_body_falls_back_to_the_stale_cache(breaker, profile_cache, clock, body):
+    profile_cache.put(1, {'user_id': 1, 'user_name': 'user_1'})
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, content=body))) \
+                as http_client:
+            client = AsyncProfileClient('http://profile', breaker, profile_cache, http_client)
+            half_open(breaker, clock)
+            clock.advance(2)
+            return await client.get_users_info([1])
+
+    assert asyncio.run(scenario()) == {1: {'user_id': 1, 'user_name': 'user_1'}}
+    assert breaker.state == OPEN
@@ -0,0 +1,148 @@
+# test_breaker_status.py
+import json
+import time
+
+import fakeredis
+
+from common.breaker_status import STATUS_CHANNEL, BreakerStatusBroadcaster
+from common.circuit_breaker import CLOSED, OPEN, CircuitBreaker
+
+
+'''
+    test_breaker_status
+        Breaker state shared between replicas: one message per status change,
+        coalesced, versioned, and never echoed back by the receivers.
+'''
+
+
+def make_breaker(clock):
+    return CircuitBreaker('profile_service', window_size=2, minimum_calls=2, cooldown=5.0, clock=clock)
+
+
+def trip(breaker):
+    for _ in range(2):
+        assert breaker.allow_request()
+        breaker.record_failure()
+
+
+def recover(breaker, clock):
+    clock.advance(5)
+    assert breaker.allow_request()
+    breaker.record_success()
+
+
+def published(pubsub):
+    return [json.loads(m['data']) for m in iter(pubsub.get_message, None) if m['type'] == 'message']
+
+
+def subscribe(redis_client):
+    pubsub = redis_client.pubsub()
+    pubsub.subscribe(STATUS_CHANNEL)
+    return pubsub
+
+
+def test_calls_alone_publish_nothing(clock, fake_redis):
+    breaker = make_breaker(clock)
+    broadcaster = BreakerStatusBroadcaster(breaker, fake_redis)
+    pubsub = subscribe(fake_redis)
+
+    for _ in range(100):
+        assert breaker.allow_request()
+        breaker.record_success()
+
+    assert not broadcaster.flush()
+    assert published(pubsub) == []
+
+
+def test_transitions_publish_a_versioned_payload(clock, fake_redis):
+    breaker = make_breaker(clock)
+    broadcaster = BreakerStatusBroadcaster(breaker, fake_redis, origin='replica-a', clock=lambda: 1234.5)
+    pubsub = subscribe(fake_redis)
+
+    trip(breaker)
+    assert broadcaster.flush()
+    recover(breaker, clock)
+    assert broadcaster.flush()
+
+    assert published(pubsub) == [
+        {'breaker': 'profile_service', 'status': 'DOWN', 'version': 1, 'timestamp': 1234.5, 'origin': 'replica-a'},
+        {'breaker': 'profile_service', 'status': 'UP', 'version': 2, 'timestamp': 1234.5, 'origin': 'replica-a'},
+    ]
+
+
+def test_bursts_of_transitions_are_coalesced(clock, fake_redis):
+    breaker = make_breaker(clock)
+    broadcaster = BreakerStatusBroadcaster(breaker, fake_redis)
+    pubsub = subscribe(fake_redis)
+
+    # OPEN -> HALF_OPEN -> OPEN -> HALF_OPEN -> CLOSED -> OPEN before the publisher runs
+    trip(breaker)
+    clock.advance(5)
+    assert breaker.allow_request()
+    breaker.record_failure()
+    recover(breaker, clock)
+    trip(breaker)
+
+    assert broadcaster.flush()
+    assert not broadcaster.flush()
+    assert [m['status'] for m in published(pubsub)] == ['DOWN']
+
+    # Flapping back to the status already broadcast sends nothing
+    recover(breaker, clock)
+    trip(breaker)
+    assert not broadcaster.flush()
+    assert published(pubsub) == []
+
+
+def test_background_thread_publishes_after_the_coalesce_window(clock, fake_redis):
+    breaker = make_breaker(clock)
+    broadcaster = BreakerStatusBroadcaster(breaker, fake_redis, coalesce_window=0.05)
+    pubsub = subscribe(fake_redis)
+    broadcaster.start()
+
+    trip(breaker)
+    deadline = time.monotonic() + 2
+    while broadcaster.published == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert [m['status'] for m in published(pubsub)] == ['DOWN']
+
+
+def test_replicas_follow_each_other_without_echo(clock):
+    server = fakeredis.FakeServer()
+    breaker_a, breaker_b = make_breaker(clock), make_breaker(clock)
+    replica_a = BreakerStatusBroadcaster(breaker_a, fakeredis.FakeStrictRedis(server=server), origin='a')
+    replica_b = BreakerStatusBroadcaster(breaker_b, fakeredis.FakeStrictRedis(server=server), origin='b')
+    pubsub = subscribe(fakeredis.FakeStrictRedis(server=server))
+
+    trip(breaker_a)
+    replica_a.flush()
+    [message] = published(pubsub)
+    data = json.dumps(message).encode()
+
+    # The sender ignores its own message, the other replica trips without re-broadcasting
+    assert not replica_a.handle_message(data)
+    assert replica_b.handle_message(data)
+    assert breaker_b.state == OPEN
+    assert not replica_b.flush()
+    # Duplicate or older versions are dropped
+    assert not replica_b.handle_message(data)
+
+    recover(breaker_b, clock)
+    assert replica_b.flush()
+    [message] = published(pubsub)
+    assert (message['status'], message['version'], message['origin']) == ('UP', 2, 'b')
+    assert replica_a.handle_message(json.dumps(message).encode())
+    assert breaker_a.state == CLOSED
+
+
+def test_unknown_payloads_are_ignored(clock, fake_redis):
+    breaker = make_breaker(clock)
+    broadcaster = BreakerStatusBroadcaster(breaker, fake_redis)
+
+    for data in (b'Down', b'UP', b'{"status": "DOWN"}',
+                 json.dumps({'breaker': 'other', 'status': 'DOWN', 'version': 1}).encode()):
+        assert not broadcaster.handle_message(data)
+
+    assert breaker.state == CLOSED
+    assert broadcaster.stats() == {'published': 0, 'applied': 0, 'ignored': 4}
@@ -0,0 +1,99 @@
+# test_bulk_ingest.py
+import io
+import json
+
+from common.bulk_ingest import ingest_ndjson
+
+
+'''
+    test_bulk_ingest
+        NDJSON bulk endpoints write chunk by chunk, one transaction per chunk,
+        and report every chunk (and every invalid line) as they go.
+'''
+
+
+def ndjson(*records):
+    return '\n'.join(record if isinstance(record, str) else json.dumps(record) for record in records) + '\n'
+
+
+def results_of(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_rows_are_written_in_chunked_transactions(fake_db):
+    from conftest import FakeConnection
+    written = []
+
+    def parse(record):
+        if 'v' not in record:
+            raise ValueError('v is required')
+        return (record['v'],)
+
+    def write(cur, rows):
+        if any(row == ('boom',) for row in rows):
+            raise RuntimeError('constraint violated')
+        written.extend(rows)
+
+    stream = io.BytesIO(ndjson({'v': 'a'}, {'v': 'b'}, 'not json', {'v': 'boom'}, '', {'v': 'c'}, {}, {'v': 'd'})
+                        .encode())
+    results = list(ingest_ndjson(stream, parse, write, lambda: FakeConnection(fake_db), lambda conn: None,
+                                 chunk_size=2))
+
+    assert results[0] == {'chunk': 0, 'first_line': 1, 'last_line': 2, 'rows': 2, 'status': 'committed'}
+    assert results[1]['status'] == 'failed'
+    assert results[1]['error'] == 'constraint violated'
+    assert results[1]['invalid'] == [{'line': 3, 'error': 'invalid JSON: Expecting value: line 1 column 1 (char 0)'}]
+    assert (results[1]['first_line'], results[1]['last_line']) == (3, 6)
+    assert results[2]['status'] == 'committed'
+    assert results[2]['invalid'] == [{'line': 7, 'error': 'v is required'}]
+    assert results[-1]['summary'] == {'chunks': 3, 'failed_chunks': 1, 'rows': 3, 'invalid_lines': 2,
+                                      'seconds': results[-1]['summary']['seconds']}
+    assert written == [('a',), ('b',), ('d',)]
+    assert (fake_db.commits, fake_db.rollbacks) == (2, 1)
+
+
+def test_bulk_insert_posts_reports_each_chunk(post_server, monkeypatch, fake_db):
+    monkeypatch.setenv('BULK_CHUNK_SIZE', '2')
+    batches = []
+
+    def write_posts(cur, rows):
+        batches.append(rows)
+
+    monkeypatch.setattr(post_server, 'write_posts', write_posts)
+    body = ndjson({'user_id': 1, 'title': 'a', 'content': 'x'},
+                  {'user_id': '2', 'title': 'b', 'content': None},
+                  {'user_id': 'x', 'title': 'c'},
+                  {'user_id': 3, 'title': 'd', 'content': 'z'})
+
+    response = post_server.app.test_client().post('/bulk_insert_posts', data=body,
+                                                  content_type='application/x-ndjson')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    results = results_of(response)
+    # No per-row ids in the lines streamed while the body is being read
+    assert [(result['rows'], result['status']) for result in results[:-1]] == [(2, 'committed'), (1, 'committed')]
+    assert all('ids' not in result for result in results)
+    assert results[1]['invalid'] == [{'line': 3, 'error': 'user_id must be an integer'}]
+    assert batches == [[(1, 'a', 'x'), (2, 'b', None)], [(3, 'd', 'z')]]
+    assert results[-1]['summary']['rows'] == 3
+
+
+def test_bulk_impressions_refresh_the_feed(feed_server, monkeypatch, fake_db):
+    def write_impressions(cur, rows):
+        for post_id, _, impression_type in rows:
+            fake_db.scores[post_id] += 1 if impression_type == 'UP' else -1
+
+    monkeypatch.setattr(feed_server, 'write_impressions', write_impressions)
+    monkeypatch.setattr(feed_server.top_posts_cache, 'ttl', 60)
+    client = feed_server.app.test_client()
+    assert client.get('/fetch_feed', query_string={'limit': 1}).json['top_posts'] == [{'post_id': 10}]
+
+    body = ndjson(*[{'post_id': 1, 'user_id': 2, 'impression_type': 'UP'}] * 20,
+                  {'post_id': 1, 'user_id': 2, 'impression_type': 'SIDEWAYS'})
+    results = results_of(client.post('/bulk_submit_impressions', data=body))
+
+    assert results[-1]['summary']['rows'] == 20
+    assert results[-1]['summary']['invalid_lines'] == 1
+    # The ranking snapshot was invalidated by the committed chunk
+    assert client.get('/fetch_feed', query_string={'limit': 1}).json['top_posts'] == [{'post_id': 1}]
@@ -0,0 +1,74 @@
+# test_bulkhead.py
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common.bulkhead import Bulkhead
+
+
+'''
+    test_bulkhead
+        A slow profile_service holds at most `max_concurrent` request threads;
+        the other requests take the cache fallback immediately.
+'''
+
+
+def timed_get(server, path, **params):
+    start = time.perf_counter()
+    response = server.app.test_client().get(path, query_string=params)
+    return response, time.perf_counter() - start
+
+
+def test_full_bulkhead_rejects_without_waiting():
+    bulkhead = Bulkhead('profile_service', max_concurrent=2)
+
+    assert bulkhead.acquire()
+    assert bulkhead.acquire()
+    start = time.perf_counter()
+    assert not bulkhead.acquire()
+    assert time.perf_counter() - start < 0.01
+
+    bulkhead.release()
+    assert bulkhead.acquire()
+    assert bulkhead.stats() == {'in_flight': 2, 'max_concurrent': 2, 'peak': 2, 'admitted': 3, 'rejected': 1}
+
+
+def test_bulkhead_waits_up_to_max_wait_for_a_slot():
+    bulkhead = Bulkhead('profile_service', max_concurrent=1, max_wait=1.0)
+    assert bulkhead.acquire()
+    threading.Timer(0.05, bulkhead.release).start()
+
+    assert bulkhead.acquire()
+    assert not bulkhead.acquire(timeout=0.05)
+
+
+def test_slow_profile_service_holds_at_most_max_concurrent_threads(post_server, profile_stub):
+    profile_stub.latency = 0.25
+
+    with ThreadPoolExecutor(max_workers=12) as executor:
+        results = list(executor.map(lambda post_id: timed_get(post_server, '/get_post_info', post_id=post_id),
+                                    [post_id % 10 + 1 for post_id in range(12)]))
+
+    assert profile_stub.max_in_flight <= 4
+    assert all(response.status_code == 200 for response, _ in results)
+    rejected = post_server.profile_bulkhead.stats()['rejected']
+    assert rejected >= 6
+    # Rejected requests answer from the fallback without waiting for the slow calls
+    fast = [response for response, elapsed in results if elapsed < 0.15]
+    assert len(fast) == rejected
+    assert all(response.json['author'] == 'No Idea' for response in fast)
+
+
+def test_requests_without_profile_lookups_are_not_affected(feed_server, profile_stub):
+    bulkhead = feed_server.profile_bulkhead
+    for _ in range(bulkhead.max_concurrent):
+        assert bulkhead.acquire()
+
+    response, elapsed = timed_get(feed_server, '/get_trending_user_info', limit=3)
+    assert response.status_code == 200
+    assert response.json['trending_users'] == []
+    assert elapsed < 0.1
+    assert profile_stub.calls == 0
+
+    response = feed_server.app.test_client().get('/fetch_feed', query_string={'limit': 3})
+    assert response.json['top_posts'] == [{'post_id': 10}, {'post_id': 9}, {'post_id': 8}]
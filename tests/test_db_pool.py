@@ -0,0 +1,160 @@
+# test_db_pool.py
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+import pytest
+
+from common.db_pool import ConnectionPool, PoolTimeout
+
+
+'''
+    test_db_pool
+        Exhausted pools make callers wait up to `timeout`, then fail (503 for
+        the endpoints); idle connections are checked before reuse and old ones
+        recycled.
+'''
+
+
+class Connections:
+    '''connect() for the pool, keeping every connection it opened.'''
+
+    def __init__(self, fake_db):
+        from conftest import FakeConnection
+        self.opened = []
+        self._new = lambda: FakeConnection(fake_db)
+
+    def __call__(self):
+        conn = self._new()
+        self.opened.append(conn)
+        return conn
+
+
+class BrokenCursor:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def execute(self, query, params=()):
+        raise psycopg2.OperationalError('server closed the connection unexpectedly')
+
+
+@pytest.fixture
+def exhausted_pool(fake_db):
+    from conftest import FakeConnection
+    pool = ConnectionPool(lambda: FakeConnection(fake_db), min_size=1, max_size=1, timeout=0.05)
+    held = pool.getconn()
+    yield pool
+    pool.putconn(held)
+
+
+@pytest.mark.parametrize('server_name, method, path, params', [
+    ('post_server', 'get', '/get_post_info', {'query_string': {'post_id': 1}}),
+    ('post_server', 'get', '/get_posts_info', {'query_string': {'post_ids': '1,2'}}),
+    ('post_server', 'post', '/insert_post', {'json': {'user_id': 1, 'title': 't', 'content': 'c'}}),
+    ('feed_server', 'get', '/fetch_feed', {}),
+    ('feed_server', 'get', '/get_trending_user_info', {}),
+    ('feed_server', 'post', '/submit_impression', {'json': {'post_id': 1, 'user_id': 1, 'impression_type': 'UP'}}),
+    ('profile_server', 'get', '/get_user_info', {'query_string': {'user_id': 1}}),
+    ('profile_server', 'get', '/get_users_info', {'query_string': {'user_ids': '1,2'}}),
+    ('profile_server', 'post', '/insert_new_user', {'json': {'user_name': 'someone'}}),
+])
+def test_exhausted_pool_answers_503(request, exhausted_pool, monkeypatch, server_name, method, path, params):
+    server = request.getfixturevalue(server_name)
+    monkeypatch.setattr(server, 'connection_pool', exhausted_pool)
+
+    response = getattr(server.app.test_client(), method)(path, **params)
+
+    assert response.status_code == 503
+    assert exhausted_pool.stats()['timeouts'] == 1
+
+
+def test_getconn_waits_for_a_returned_connection(fake_db):
+    pool = ConnectionPool(Connections(fake_db), min_size=1, max_size=1, timeout=1.0)
+    held = pool.getconn()
+    threading.Timer(0.05, pool.putconn, (held,)).start()
+
+    assert pool.getconn() is held
+    stats = pool.stats()
+    assert (stats['waits'], stats['timeouts'], stats['in_use']) == (1, 0, 1)
+    assert stats['wait_seconds_max'] >= 0.04
+
+
+def test_getconn_times_out_when_every_connection_is_in_use(fake_db):
+    pool = ConnectionPool(Connections(fake_db), min_size=0, max_size=2, timeout=0.05)
+    pool.getconn()
+    pool.getconn()
+
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    assert pool.stats()['timeouts'] == 1
+
+
+def test_idle_connections_are_checked_before_reuse(fake_db, clock):
+    connections = Connections(fake_db)
+    pool = ConnectionPool(connections, min_size=1, check_after_idle=10.0, clock=clock)
+    conn = pool.getconn()
+    pool.putconn(conn)
+
+    # Recently used: handed out without a check
+    assert pool.getconn() is conn
+    assert fake_db.queries == []
+    pool.putconn(conn)
+
+    clock.advance(11.0)
+    conn.cursor = BrokenCursor
+    fresh = pool.getconn()
+
+    assert fresh is not conn and conn.closed
+    assert len(connections.opened) == 2
+    assert pool.stats()['size'] == 1
+
+
+def test_connections_are_recycled_after_max_lifetime(fake_db, clock):
+    connections = Connections(fake_db)
+    pool = ConnectionPool(connections, min_size=1, max_lifetime=100.0, clock=clock)
+    conn = pool.getconn()
+
+    clock.advance(101.0)
+    pool.putconn(conn)
+
+    assert conn.closed
+    assert pool.stats()['size'] == 0
+    assert pool.getconn() is connections.opened[1]
+
+
+def test_connections_being_rolled_back_count_towards_max_size(fake_db):
+    connections = Connections(fake_db)
+    pool = ConnectionPool(connections, min_size=0, max_size=2, timeout=1.0)
+    first, second = pool.getconn(), pool.getconn()
+    rolling_back, release = threading.Event(), threading.Event()
+
+    class InTransaction:
+        transaction_status = 'INTRANS'
+
+    def slow_rollback():
+        rolling_back.set()
+        release.wait(1)
+
+    first.info, first.rollback = InTransaction(), slow_rollback
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        returned = executor.submit(pool.putconn, first)
+        assert rolling_back.wait(1)
+        # The returned connection is neither idle nor in use during its rollback, but still open
+        waiting = executor.submit(pool.getconn)
+        deadline = time.monotonic() + 1
+        while pool.stats()['waiters'] < 1 and not waiting.done() and time.monotonic() < deadline:
+            time.sleep(0.001)
+        assert pool.stats()['size'] == 2
+        release.set()
+        returned.result()
+
+        assert waiting.result() is first
+    assert len(connections.opened) == 2
+    assert pool.stats()['size'] == 2
+    pool.putconn(second)
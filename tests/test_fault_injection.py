@@ -0,0 +1,203 @@
+# test_fault_injection.py
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common.circuit_breaker import CLOSED, OPEN
+from common.breaker_status import STATUS_CHANNEL
+from common.profile_client import ProfileClient
+
+
+'''
+    test_fault_injection
+        post_server / feed_server against a profile_service stub that is
+        healthy, failing (5xx), hanging (timeouts) or slow, checking breaker
+        transitions, what the fallback serves, and that requests stay fast
+        while the dependency is degraded.
+
+        The breaker under test trips when 2 of its last 4 calls failed or were
+        slower than 0.1s, and retries after a 5s cooldown of the manual clock.
+'''
+
+
+def get_post(server, post_id):
+    return server.app.test_client().get('/get_post_info', query_string={'post_id': post_id})
+
+
+def get_trending(server, limit):
+    return server.app.test_client().get('/get_trending_user_info', query_string={'limit': limit})
+
+
+def user(user_id):
+    return {'user_id': user_id, 'user_name': f'user_{user_id}'}
+
+
+def trip_breaker(server, post_ids=(1, 2, 3, 4)):
+    for post_id in post_ids:
+        assert get_post(server, post_id).status_code == 200
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def test_healthy_profile_service_is_called_once_per_author(post_server, profile_stub, breaker):
+    response = get_post(post_server, 3)
+
+    assert response.status_code == 200
+    assert response.json == {'post_id': 3, 'title': 'title 3', 'content': 'content 3', 'author': user(3)}
+    # Fresh cache hit, profile_service is not called again
+    assert get_post(post_server, 3).json['author'] == user(3)
+    assert profile_stub.calls == 1
+    assert breaker.state == CLOSED
+
+
+def test_errors_open_breaker_and_serve_stale_profiles(post_server, profile_stub, breaker, clock, fake_redis):
+    pubsub = fake_redis.pubsub()
+    pubsub.subscribe(STATUS_CHANNEL)
+    get_post(post_server, 1)
+    get_post(post_server, 2)
+    # Authors 1 and 2 are now stale, only usable as a fallback
+    clock.advance(2)
+
+    profile_stub.status = 500
+    responses = [get_post(post_server, post_id) for post_id in (1, 2, 3, 4)]
+
+    assert breaker.state == OPEN
+    assert [r.status_code for r in responses] == [200] * 4
+    assert [r.json['author'] for r in responses] == [user(1), user(2), 'No Idea', 'No Idea']
+    # One broadcast for the transition, none for the individual failures
+    assert post_server.status_broadcaster.flush()
+    messages = [json.loads(m['data']) for m in iter(pubsub.get_message, None) if m['type'] == 'message']
+    assert [(m['status'], m['version']) for m in messages] == [('DOWN', 1)]
+
+    # While open, profile_service is not called at all
+    calls = profile_stub.calls
+    for post_id in (1, 2, 3, 4) * 5:
+        author = get_post(post_server, post_id).json['author']
+        assert author == (user(post_id) if post_id <= 2 else 'No Idea')
+    assert profile_stub.calls == calls
+
+
+def test_timeouts_count_as_failures(post_server, profile_stub, breaker):
+    profile_stub.latency = 1.0
+
+    for post_id in (1, 2, 3, 4):
+        response, elapsed = timed(get_post, post_server, post_id)
+        assert response.json['author'] == 'No Idea'
+        # Bounded by the client read timeout (0.3s), not by the 1s hang
+        assert elapsed < 0.8
+
+    assert breaker.state == OPEN
+
+
+def test_slow_successes_open_breaker(post_server, profile_stub, breaker):
+    profile_stub.latency = 0.15
+
+    responses = [get_post(post_server, post_id) for post_id in (1, 2, 3, 4)]
+
+    # Slow answers are still used, but they count against the dependency
+    assert [r.json['author'] for r in responses] == [user(1), user(2), user(3), user(4)]
+    assert breaker.state == OPEN
+
+
+def test_breaker_closes_after_successful_trial_call(post_server, profile_stub, breaker, clock):
+    profile_stub.status = 503
+    trip_breaker(post_server)
+    calls = profile_stub.calls
+
+    # Still failing after the cooldown: one trial call, then open again
+    clock.advance(5)
+    assert get_post(post_server, 5).json['author'] == 'No Idea'
+    assert profile_stub.calls == calls + 1
+    assert breaker.state == OPEN
+
+    profile_stub.healthy()
+    clock.advance(5)
+    assert get_post(post_server, 5).json['author'] == user(5)
+    assert breaker.state == CLOSED
+    assert get_post(post_server, 6).json['author'] == user(6)
+    assert profile_stub.calls == calls + 3
+
+
+def test_half_open_lets_a_single_trial_call_through(post_server, profile_stub, breaker, clock):
+    profile_stub.status = 500
+    trip_breaker(post_server)
+    profile_stub.healthy()
+    profile_stub.latency = 0.15
+    clock.advance(5)
+    calls = profile_stub.calls
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        responses = list(executor.map(lambda post_id: get_post(post_server, post_id), range(1, 9)))
+
+    assert profile_stub.calls == calls + 1
+    assert all(r.status_code == 200 for r in responses)
+    assert breaker.state == CLOSED
+
+
+def test_degraded_dependency_does_not_slow_requests(post_server, profile_stub, breaker):
+    get_post(post_server, 1)
+    profile_stub.latency = 1.0
+    trip_breaker(post_server, (2, 3, 4, 5))
+    assert breaker.state == OPEN
+
+    def worker(_):
+        return [timed(get_post, post_server, post_id) for post_id in (1, 2, 3, 4, 5) * 5]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = [result for batch in executor.map(worker, range(8)) for result in batch]
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for _, latency in results)
+    assert all(response.status_code == 200 for response, _ in results)
+    # 200 requests; a single call to the hanging service would cost 0.3s
+    assert latencies[int(len(latencies) * 0.99) - 1] < 0.1
+    assert len(results) / elapsed > 100
+    assert breaker.state == OPEN
+
+
+def test_trending_users_fall_back_to_cached_authors(feed_server, profile_stub, breaker, clock):
+    response = get_trending(feed_server, 5)
+    assert response.json['trending_users'] == [user(user_id) for user_id in (10, 9, 8, 7, 6)]
+    assert profile_stub.requested == [[10, 9, 8, 7, 6]]
+
+    clock.advance(2)
+    profile_stub.status = 500
+    for _ in range(4):
+        get_trending(feed_server, 7)
+    assert breaker.state == OPEN
+
+    response, elapsed = timed(get_trending, feed_server, 7)
+    # Unknown authors are left out of the trending list
+    assert response.status_code == 200
+    assert response.json['trending_users'] == [user(user_id) for user_id in (10, 9, 8, 7, 6)]
+    assert elapsed < 0.1
+
+
+def test_breaker_state_from_another_replica(feed_server, profile_stub, breaker):
+    breaker.apply_remote_status('DOWN')
+
+    response = get_trending(feed_server, 3)
+
+    assert response.json['trending_users'] == []
+    assert profile_stub.calls == 0
+
+    breaker.apply_remote_status('UP')
+    assert get_trending(feed_server, 3).json['trending_users'] == [user(10), user(9), user(8)]
+    assert profile_stub.calls == 1
+
+
+def test_large_lookups_are_split_in_profile_service_batches(breaker, profile_cache, profile_stub):
+    profile_stub.max_batch_size = 3
+    client = ProfileClient(profile_stub.url, breaker, profile_cache, max_batch_size=3)
+
+    users = client.get_users_info(list(range(1, 9)))
+
+    assert sorted(users) == list(range(1, 9))
+    assert profile_stub.requested == [[1, 2, 3], [4, 5, 6], [7, 8]]
+    # One breaker call for the whole lookup
+    assert breaker._calls == 1
@@ -0,0 +1,61 @@
+# test_feed_expand.py
+import time
+
+from common.circuit_breaker import OPEN
+
+
+'''
+    test_feed_expand
+        /fetch_feed?expand=post,author serves a whole feed page, posts and
+        authors included, in one request.
+'''
+
+
+def fetch_feed(server, **params):
+    return server.app.test_client().get('/fetch_feed', query_string=params)
+
+
+def test_plain_feed_is_unchanged(feed_server, profile_stub):
+    response = fetch_feed(feed_server, limit=2)
+
+    assert response.json['top_posts'] == [{'post_id': 10}, {'post_id': 9}]
+    assert profile_stub.calls == 0
+
+
+def test_expanded_feed_page_in_one_request(feed_server, fake_db, profile_stub):
+    fake_db.add_post(11, user_id=10, score=20)
+
+    response = fetch_feed(feed_server, limit=3, expand='post,author')
+
+    assert response.json['top_posts'] == [
+        {'post_id': 11, 'title': 'title 11', 'content': 'content 11', 'author': {'user_id': 10, 'user_name': 'user_10'}},
+        {'post_id': 10, 'title': 'title 10', 'content': 'content 10', 'author': {'user_id': 10, 'user_name': 'user_10'}},
+        {'post_id': 9, 'title': 'title 9', 'content': 'content 9', 'author': {'user_id': 9, 'user_name': 'user_9'}},
+    ]
+    # One ranking query and one batched author lookup
+    assert response.headers['X-DB-Round-Trips'] == '1'
+    assert profile_stub.requested == [[10, 9]]
+
+
+def test_post_only_expansion_skips_profile_service(feed_server, profile_stub):
+    posts = fetch_feed(feed_server, limit=1, expand='post').json['top_posts']
+
+    assert posts == [{'post_id': 10, 'title': 'title 10', 'content': 'content 10'}]
+    assert profile_stub.calls == 0
+
+
+def test_authors_fall_back_while_profile_service_is_down(feed_server, profile_stub, breaker):
+    breaker.apply_remote_status('DOWN')
+    assert breaker.state == OPEN
+    profile_stub.latency = 1.0
+
+    start = time.perf_counter()
+    posts = fetch_feed(feed_server, limit=2, expand='author').json['top_posts']
+
+    assert time.perf_counter() - start < 0.1
+    assert [post['author'] for post in posts] == ['No Idea', 'No Idea']
+    assert profile_stub.calls == 0
+
+
+def test_unknown_expansion_is_rejected(feed_server):
+    assert fetch_feed(feed_server, expand='post,score').status_code == 400
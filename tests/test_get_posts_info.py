@@ -0,0 +1,59 @@
+# test_get_posts_info.py
+from common.circuit_breaker import OPEN
+
+
+'''
+    test_get_posts_info
+        /get_posts_info resolves a feed page with one Post_table query and one
+        profile_service call, answering in request order with per-post errors.
+'''
+
+
+BATCH_QUERY = 'SELECT post_id, user_id, title, content FROM Post_table WHERE post_id = ANY(%s)'
+
+
+def get_posts(server, post_ids):
+    return server.app.test_client().get('/get_posts_info', query_string={'post_ids': post_ids})
+
+
+def test_one_query_and_one_author_lookup_per_batch(post_server, fake_db, profile_stub):
+    fake_db.add_post(11, user_id=3)
+
+    response = get_posts(post_server, '11,3,99,3,1')
+
+    assert response.status_code == 200
+    assert response.json['posts'] == [
+        {'post_id': 11, 'title': 'title 11', 'content': 'content 11', 'author': {'user_id': 3, 'user_name': 'user_3'}},
+        {'post_id': 3, 'title': 'title 3', 'content': 'content 3', 'author': {'user_id': 3, 'user_name': 'user_3'}},
+        {'post_id': 99, 'error': 'Post not found'},
+        {'post_id': 1, 'title': 'title 1', 'content': 'content 1', 'author': {'user_id': 1, 'user_name': 'user_1'}},
+    ]
+    assert fake_db.queries.count(BATCH_QUERY) == 1
+    assert profile_stub.requested == [[3, 1]]
+
+
+def test_cached_posts_are_not_read_again(post_server, fake_db):
+    get_posts(post_server, '1,2')
+    get_posts(post_server, '2,3')
+
+    # Only post 3 was missing from the cache on the second call
+    assert fake_db.queries.count(BATCH_QUERY) == 2
+    assert post_server.post_cache.stats()['loads'] == 2
+    assert get_posts(post_server, '1,2,3').json['posts'][2]['post_id'] == 3
+    assert fake_db.queries.count(BATCH_QUERY) == 2
+
+
+def test_unknown_authors_while_the_breaker_is_open(post_server, breaker, profile_stub):
+    breaker.apply_remote_status('DOWN')
+    assert breaker.state == OPEN
+
+    posts = get_posts(post_server, '1,2').json['posts']
+
+    assert [post['author'] for post in posts] == ['No Idea', 'No Idea']
+    assert profile_stub.calls == 0
+
+
+def test_invalid_requests(post_server):
+    assert get_posts(post_server, '').status_code == 400
+    assert get_posts(post_server, '1,x').status_code == 400
+    assert get_posts(post_server, ','.join(str(post_id) for post_id in range(101))).status_code == 400
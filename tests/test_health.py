@@ -0,0 +1,115 @@
+# test_health.py
+import asyncio
+import fakeredis
+import pytest
+
+from common.db_pool import ConnectionPool
+from common.health import ReadinessCheck
+
+
+'''
+    test_health
+        /healthz answers without any I/O, /readyz reports the database pool and
+        Redis and caches its outcome.
+'''
+
+
+def broken_database():
+    raise ConnectionRefusedError('database is down')
+
+
+@pytest.fixture(params=['post', 'feed', 'profile'])
+def server(request):
+    return request.getfixturevalue(f'{request.param}_server')
+
+
+def test_healthz_does_no_io(server, fake_db, monkeypatch):
+    monkeypatch.setattr(server, 'connection_pool', None)
+
+    response = server.app.test_client().get('/healthz')
+
+    assert response.status_code == 200
+    assert response.json == {'status': 'ok'}
+    assert fake_db.queries == []
+
+
+def test_readyz_checks_the_database(server, fake_db):
+    response = server.app.test_client().get('/readyz')
+
+    assert response.status_code == 200
+    assert response.json['status'] == 'ready'
+    assert set(response.json['checks'].values()) == {'ok'}
+    assert fake_db.queries == ['SELECT 1']
+
+
+def test_readyz_reports_an_unreachable_database(server, monkeypatch):
+    monkeypatch.setattr(server, 'connection_pool', ConnectionPool(broken_database, min_size=0))
+
+    response = server.app.test_client().get('/readyz')
+
+    assert response.status_code == 503
+    assert response.json['checks']['database'] == 'ConnectionRefusedError: database is down'
+
+
+@pytest.mark.parametrize('server_name', ['post_server', 'feed_server'])
+def test_readyz_reports_an_unreachable_redis(request, server_name, monkeypatch):
+    server = request.getfixturevalue(server_name)
+    redis_server = fakeredis.FakeServer()
+    redis_server.connected = False
+    monkeypatch.setattr(server, 'redis_client', fakeredis.FakeStrictRedis(server=redis_server))
+
+    response = server.app.test_client().get('/readyz')
+
+    assert response.status_code == 503
+    assert response.json['checks']['database'] == 'ok'
+    assert response.json['checks']['redis'].startswith('ConnectionError')
+
+
+def test_readiness_is_cached(clock):
+    calls = []
+    readiness = ReadinessCheck({'database': lambda: calls.append(1)}, ttl=0.5, clock=clock)
+
+    for _ in range(100):
+        assert readiness.status() == (True, {'database': 'ok'})
+    assert len(calls) == 1
+
+    clock.advance(0.5)
+    readiness.status()
+    assert len(calls) == 2
+
+
+def test_a_hanging_async_check_times_out():
+    async def exhausted_pool():
+        await asyncio.sleep(10)
+
+    async def redis_ping():
+        pass
+
+    readiness = ReadinessCheck({'database': exhausted_pool, 'redis': redis_ping}, ttl=0, timeout=0.05)
+
+    ready, checks = asyncio.run(readiness.async_status())
+
+    assert not ready
+    assert checks == {'database': 'TimeoutError: no answer within 0.05s', 'redis': 'ok'}
+
+
+def test_one_coroutine_refreshes_async_readiness(clock):
+    calls = []
+
+    async def database():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+
+    readiness = ReadinessCheck({'database': database}, ttl=0.5, clock=clock)
+
+    async def probes():
+        return await asyncio.gather(*(readiness.async_status() for _ in range(10)))
+
+    # Nothing cached yet: every probe waits for the same refresh
+    assert asyncio.run(probes()) == [(True, {'database': 'ok'})] * 10
+    assert len(calls) == 1
+
+    # Expired: one probe refreshes, the others answer with the previous result
+    clock.advance(0.5)
+    assert asyncio.run(probes()) == [(True, {'database': 'ok'})] * 10
+    assert len(calls) == 2
@@ -0,0 +1,154 @@
+# test_health_prober.py
+import time
+
+import fakeredis
+
+from common.breaker_status import BreakerStatusBroadcaster
+from common.circuit_breaker import CLOSED, HALF_OPEN, OPEN
+from common.health_prober import HealthProber
+
+
+'''
+    test_health_prober
+        Background /healthz probes elected across replicas drive the breaker;
+        user requests are never used as recovery trials.
+'''
+
+
+def make_prober(breaker, profile_stub, redis_client, origin='a', **kwargs):
+    options = dict(interval=0.05, timeout=0.1, rise=2, fall=2, min_open=5.0, fallback_cooldown=30.0,
+                   clock=breaker._clock)
+    options.update(kwargs)
+    return HealthProber(breaker, profile_stub.url, redis_client, origin, **options)
+
+
+def get_post(server, post_id):
+    return server.app.test_client().get('/get_post_info', query_string={'post_id': post_id})
+
+
+def test_a_single_replica_probes(breaker, profile_stub):
+    server = fakeredis.FakeServer()
+    leader = make_prober(breaker, profile_stub, fakeredis.FakeStrictRedis(server=server), origin='a')
+    follower = make_prober(breaker, profile_stub, fakeredis.FakeStrictRedis(server=server), origin='b',
+                           lock_ttl=0.1)
+
+    assert leader.run_once() is True
+    assert follower.run_once() is None
+    assert leader.run_once() is True
+    assert profile_stub.health_checks == 2
+
+    # The leader stops renewing its lock, the follower takes over once it expires
+    time.sleep(0.4)
+    assert follower.run_once() is True
+    assert leader.run_once() is None
+    assert (leader.is_leader, follower.is_leader) == (False, True)
+
+
+def test_failed_probes_open_the_breaker_before_users_notice(post_server, profile_stub, breaker, fake_redis):
+    prober = make_prober(breaker, profile_stub, fake_redis)
+    profile_stub.latency = 1.0
+
+    assert prober.run_once() is False
+    assert breaker.state == CLOSED
+    assert prober.run_once() is False
+    assert breaker.state == OPEN
+    # Broadcast to the other replicas like any other transition
+    assert post_server.status_broadcaster.flush()
+
+    start = time.perf_counter()
+    assert get_post(post_server, 1).json['author'] == 'No Idea'
+    assert time.perf_counter() - start < 0.1
+    assert profile_stub.calls == 0
+
+
+def test_recovery_is_detected_by_the_prober_not_by_user_requests(post_server, profile_stub, breaker, clock,
+                                                                fake_redis):
+    prober = make_prober(breaker, profile_stub, fake_redis)
+    profile_stub.status = 500
+    prober.run_once()
+    prober.run_once()
+    assert breaker.state == OPEN
+
+    profile_stub.healthy()
+    # Past the breaker's own 5s cooldown: no HALF_OPEN trial on user traffic
+    clock.advance(6)
+    assert get_post(post_server, 1).json['author'] == 'No Idea'
+    assert profile_stub.calls == 0
+
+    assert prober.run_once() is True
+    assert breaker.state == OPEN
+    assert prober.run_once() is True
+    assert breaker.state == CLOSED
+    assert get_post(post_server, 1).json['author'] == {'user_id': 1, 'user_name': 'user_1'}
+    assert profile_stub.calls == 1
+
+
+def test_breaker_stays_open_for_min_open_seconds(breaker, profile_stub, clock, fake_redis):
+    prober = make_prober(breaker, profile_stub, fake_redis)
+    breaker.apply_remote_status('DOWN')
+
+    for _ in range(3):
+        assert prober.run_once() is True
+    assert breaker.state == OPEN
+
+    clock.advance(5)
+    prober.run_once()
+    assert breaker.state == CLOSED
+
+
+def test_probes_close_a_half_open_breaker(breaker, profile_stub, clock, fake_redis):
+    prober = make_prober(breaker, profile_stub, fake_redis)
+    breaker.apply_remote_status('DOWN')
+    # The fallback cooldown let a user request through as the trial call, still in flight
+    clock.advance(30)
+    assert breaker.allow_request()
+    assert breaker.state == HALF_OPEN
+
+    prober.run_once()
+    prober.run_once()
+    assert breaker.state == CLOSED
+
+
+def test_probers_follow_the_leader_through_broadcasts(profile_stub, clock, breaker):
+    server = fakeredis.FakeServer()
+    leader_redis, follower_redis = fakeredis.FakeStrictRedis(server=server), fakeredis.FakeStrictRedis(server=server)
+    follower_breaker = type(breaker)('profile_service', clock=clock)
+    leader_broadcaster = BreakerStatusBroadcaster(breaker, leader_redis, origin='a')
+    follower_broadcaster = BreakerStatusBroadcaster(follower_breaker, follower_redis, origin='b')
+    pubsub = follower_redis.pubsub()
+    pubsub.subscribe(follower_broadcaster.channel)
+    prober = make_prober(breaker, profile_stub, leader_redis, origin='a')
+
+    profile_stub.status = 503
+    prober.run_once()
+    prober.run_once()
+    leader_broadcaster.flush()
+
+    [message] = [m for m in iter(pubsub.get_message, None) if m['type'] == 'message']
+    assert follower_broadcaster.handle_message(message['data'])
+    assert follower_breaker.state == OPEN
+
+
+def test_every_replica_probes_when_redis_is_down(breaker, profile_stub):
+    server = fakeredis.FakeServer()
+    server.connected = False
+    prober = make_prober(breaker, profile_stub, fakeredis.FakeStrictRedis(server=server))
+
+    assert prober.run_once() is True
+    assert prober.is_leader
+    assert profile_stub.health_checks == 1
+
+
+def test_background_thread_probes_at_the_interval(breaker, profile_stub, fake_redis):
+    prober = make_prober(breaker, profile_stub, fake_redis)
+    profile_stub.status = 500
+    prober.start()
+    try:
+        deadline = time.monotonic() + 2
+        while breaker.state != OPEN and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        prober.stop()
+
+    assert breaker.state == OPEN
+    assert profile_stub.health_checks >= 2
@@ -0,0 +1,155 @@
+# test_impression_buffer.py
+import psycopg2
+import pytest
+
+from impression_buffer import ImpressionBuffer
+
+
+'''
+    test_impression_buffer
+        Buffered impressions are written by flushes, one transaction each;
+        impressions of unknown posts or users are dropped, other rows that can
+        never be written are dead-lettered, transient failures are retried, and
+        no acknowledged impression disappears without being counted.
+'''
+
+
+@pytest.fixture
+def written():
+    return []
+
+
+@pytest.fixture
+def buffer(fake_db, written):
+    from conftest import FakeConnection
+    buffer = ImpressionBuffer(lambda: FakeConnection(fake_db), lambda conn: None,
+                              flush_interval=3600, flush_size=10**6, max_pending=10)
+
+    def write_rows(cur, rows):
+        # post_id 0 stands for a value the database refuses (DataError), whatever the batch
+        if any(row[0] == 0 for row in rows):
+            raise psycopg2.DataError('value out of range')
+        written.extend(rows)
+
+    buffer._write_rows = write_rows
+    return buffer
+
+
+def test_flush_writes_everything_pending_in_one_transaction(fake_db, written):
+    from conftest import FakeConnection
+    flushes = []
+    buffer = ImpressionBuffer(lambda: FakeConnection(fake_db), lambda conn: None,
+                              flush_interval=3600, flush_size=10**6, on_flush=lambda: flushes.append(1))
+    buffer._write_rows = lambda cur, rows: written.extend(rows)
+    for post_id in (1, 2, 1):
+        buffer.add(post_id, 3, 'UP')
+
+    assert buffer.flush() == 3
+    assert buffer.flush() == 0
+
+    assert written == [(1, 3, 'UP'), (2, 3, 'UP'), (1, 3, 'UP')]
+    assert (fake_db.commits, fake_db.rollbacks) == (1, 0)
+    assert flushes == [1]
+    assert buffer.stats()['flushed'] == 3
+
+
+def test_impressions_of_unknown_posts_or_users_are_dropped(buffer, written, fake_db):
+    def write_rows(cur, rows):
+        # Foreign keys of Impression_table: posts 1-10, users 1-10
+        if any(not (1 <= post_id <= 10 and 1 <= user_id <= 10) for post_id, user_id, _ in rows):
+            raise psycopg2.IntegrityError('violates foreign key constraint')
+        written.extend(rows)
+
+    buffer._write_rows = write_rows
+    for row in [(1, 1, 'UP'), (404, 1, 'UP'), (2, 404, 'DOWN'), (3, 2, 'DOWN')]:
+        buffer.add(*row)
+
+    assert buffer.flush() == 2
+
+    assert written == [(1, 1, 'UP'), (3, 2, 'DOWN')]
+    assert (fake_db.commits, fake_db.rollbacks) == (1, 1)
+    assert buffer.stats() == {'pending': 0, 'flushed': 2, 'orphans': 2, 'dead_lettered': 0, 'dropped': 0}
+
+
+def test_ids_outside_int4_are_rejected(buffer):
+    with pytest.raises(ValueError):
+        buffer.add(99999999999, 1, 'UP')
+    assert buffer.stats()['pending'] == 0
+
+
+@pytest.mark.parametrize('impression', [
+    {'post_id': 99999999999, 'user_id': 1, 'impression_type': 'UP'},
+    {'post_id': 1, 'user_id': 1, 'impression_type': 'SIDEWAYS'},
+])
+def test_submit_impression_rejects_invalid_impressions(feed_server, buffer, monkeypatch, impression):
+    monkeypatch.setattr(feed_server, 'impression_buffer', buffer)
+
+    response = feed_server.app.test_client().post('/submit_impression', json=impression)
+
+    assert response.status_code == 400
+    assert buffer.stats()['pending'] == 0
+
+
+def test_score_deltas_are_applied_in_post_id_order(monkeypatch):
+    import impression_buffer
+    statements = []
+    monkeypatch.setattr(impression_buffer, 'execute_values',
+                        lambda cur, query, rows, **kwargs: statements.append((query, rows)))
+
+    impression_buffer.write_impressions(None, [(7, 1, 'UP'), (3, 1, 'UP'), (9, 2, 'DOWN'), (3, 2, 'UP'), (5, 1, 'UP'),
+                                               (5, 2, 'DOWN')])
+
+    [(_, inserted), (_, deltas)] = statements
+    assert len(inserted) == 6
+    # Every flush locks the Score_table rows in the same order
+    assert deltas == [(3, 2), (7, 1), (9, -1)]
+
+
+def test_non_transient_errors_dead_letter_only_the_offending_rows(buffer, written):
+    rows = [(1, 1, 'UP'), (2, 1, 'UP'), (0, 1, 'UP'), (3, 1, 'DOWN'), (4, 1, 'UP')]
+    for row in rows:
+        buffer.add(*row)
+
+    assert buffer.flush() == 4
+
+    assert written == [row for row in rows if row[0] != 0]
+    assert buffer.stats() == {'pending': 0, 'flushed': 4, 'orphans': 0, 'dead_lettered': 1, 'dropped': 0}
+    # Nothing is put back, the next flush has nothing to do
+    assert buffer.flush() == 0
+
+
+def test_transient_errors_requeue_and_count_what_does_not_fit(buffer, written):
+    def unreachable(cur, rows):
+        raise psycopg2.OperationalError('server closed the connection unexpectedly')
+
+    write_rows, buffer._write_rows = buffer._write_rows, unreachable
+    for post_id in range(1, 7):
+        buffer.add(post_id, 1, 'UP')
+    with pytest.raises(psycopg2.OperationalError):
+        buffer.flush()
+    assert buffer.stats()['pending'] == 6
+
+    # Received while the database was down, then the flush fails again with 10 rows waiting
+    for post_id in range(7, 11):
+        buffer.add(post_id, 1, 'UP')
+    with pytest.raises(psycopg2.OperationalError):
+        buffer.flush()
+    assert buffer.stats()['pending'] == 10
+    assert buffer.stats()['dropped'] == 0
+
+    buffer._write_rows = write_rows
+    assert buffer.flush() == 10
+    assert [row[0] for row in written] == list(range(1, 11))
+
+
+def test_requeued_rows_over_max_pending_are_counted(buffer):
+    for post_id in range(1, 9):
+        buffer.add(post_id, 1, 'UP')
+    rows, buffer._pending = buffer._pending, [(post_id, 1, 'UP') for post_id in range(9, 13)]
+
+    buffer._requeue(rows)
+
+    assert buffer.stats()['pending'] == 10
+    assert buffer.stats()['dropped'] == 2
+    assert [row[0] for row in buffer._pending] == list(range(1, 11))
+    assert buffer.flush() == 10
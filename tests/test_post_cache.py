@@ -0,0 +1,90 @@
+# test_post_cache.py
+import fakeredis
+
+from common.ttl_cache import RedisTTLCache, TTLCache
+from post_cache import PostCache
+
+
+'''
+    test_post_cache
+        /get_post_info reads a post from Post_table once, then serves it from
+        the post cache (or from another replica's entry in Redis).
+'''
+
+
+POST_QUERY = 'SELECT post_id, user_id, title, content FROM Post_table WHERE post_id = %s'
+
+
+def get_post(server, post_id):
+    return server.app.test_client().get('/get_post_info', query_string={'post_id': post_id})
+
+
+def post_reads(fake_db):
+    return fake_db.queries.count(POST_QUERY)
+
+
+def test_hot_posts_are_read_from_postgres_once(post_server, fake_db):
+    first = get_post(post_server, 3)
+    second = get_post(post_server, 3)
+
+    assert first.json == second.json == {'post_id': 3, 'title': 'title 3', 'content': 'content 3',
+                                         'author': {'user_id': 3, 'user_name': 'user_3'}}
+    assert post_reads(fake_db) == 1
+    assert post_server.post_cache.stats()['hits'] == 1
+
+
+def test_missing_posts_are_not_cached(post_server, fake_db):
+    assert get_post(post_server, 99).status_code == 404
+    assert get_post(post_server, 99).status_code == 404
+    assert post_reads(fake_db) == 2
+    assert get_post(post_server, 'abc').status_code == 400
+
+
+def test_inserted_posts_are_served_from_the_cache(post_server, fake_db):
+    response = post_server.app.test_client().post('/insert_post',
+                                                  json={'user_id': 5, 'title': 'new', 'content': 'post'})
+    assert response.status_code == 201
+
+    post = get_post(post_server, response.json['post_id']).json
+    assert post['title'] == 'new'
+    assert post['author'] == {'user_id': 5, 'user_name': 'user_5'}
+    assert post_reads(fake_db) == 0
+
+
+def test_cache_is_bounded():
+    cache = PostCache(TTLCache(max_entries=2, ttl=3600))
+    for post_id in (1, 2, 3):
+        cache.put({'post_id': post_id, 'user_id': post_id, 'title': 't', 'content': 'c'})
+
+    assert cache.get(1) is None
+    assert cache.get(3) is not None
+    assert cache.stats() == {'size': 2, 'hits': 1, 'misses': 1, 'evictions': 1, 'loads': 0}
+
+
+def test_replicas_share_posts_through_redis(fake_db):
+    redis_client = fakeredis.FakeStrictRedis()
+    replicas = [PostCache(TTLCache(ttl=3600), RedisTTLCache(redis_client, 'post:', ttl=3600))
+                for _ in range(2)]
+    loads = []
+
+    def loader(post_id):
+        loads.append(post_id)
+        return {'post_id': post_id, 'user_id': 1, 'title': 't', 'content': 'c'}
+
+    assert replicas[0].get_or_load(7, loader) == replicas[1].get_or_load(7, loader)
+    assert loads == [7]
+    # Copied into the second replica's own tier
+    assert replicas[1].cache.get(7)['post_id'] == 7
+
+
+def test_unreadable_redis_entries_are_misses():
+    redis_client = fakeredis.FakeStrictRedis()
+    shared = RedisTTLCache(redis_client, 'post:', ttl=3600)
+    shared.put_many({1: {'post_id': 1}})
+    redis_client.mset({'post:2': b'\xff not json', 'post:3': b'{"value": 3}', 'post:4': b'[4]',
+                       'post:5': b'{"value": 5, "stored_at": "yesterday"}'})
+
+    found, _ = shared.get_many([1, 2, 3, 4, 5])
+
+    assert found == {1: {'post_id': 1}}
+    assert shared.stats() == {'hits': 1, 'misses': 4, 'errors': 4}
@@ -0,0 +1,142 @@
+# test_single_flight.py
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from common.bulkhead import Bulkhead
+from common.profile_client import ProfileClient
+from common.single_flight import AsyncSingleFlight, SingleFlight
+
+
+'''
+    test_single_flight
+        Concurrent lookups of the same user share one profile_service call.
+'''
+
+
+def get_post(server, post_id):
+    return server.app.test_client().get('/get_post_info', query_string={'post_id': post_id})
+
+
+def test_followers_share_the_leaders_fetch():
+    single_flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    fetched = []
+
+    def slow_fetch(keys):
+        fetched.append(keys)
+        started.set()
+        release.wait(1)
+        return {key: key * 10 for key in keys}
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(single_flight.do_many, [1, 2], slow_fetch)
+        started.wait(1)
+        # 2 is already being fetched, only 3 needs a new call
+        follower = executor.submit(single_flight.do_many, [2, 3], lambda keys: fetched.append(keys) or {3: 30})
+        while single_flight.stats()['shared_keys'] < 1:
+            pass
+        release.set()
+
+        assert leader.result() == {1: 10, 2: 20}
+        assert follower.result() == {2: 20, 3: 30}
+    assert fetched == [[1, 2], [3]]
+    assert single_flight.stats() == {'in_flight_keys': 0, 'flights': 2, 'shared_keys': 1}
+
+
+def test_followers_get_nothing_when_the_leader_fails():
+    single_flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def failing_fetch(keys):
+        started.set()
+        release.wait(1)
+        raise RuntimeError('profile_service is down')
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(single_flight.do_many, [1], failing_fetch)
+        started.wait(1)
+        follower = executor.submit(single_flight.do_many, [1], lambda keys: {1: 'not called'})
+        while single_flight.stats()['shared_keys'] < 1:
+            pass
+        release.set()
+
+        with pytest.raises(RuntimeError):
+            leader.result()
+        assert follower.result() == {}
+    # The failed flight is forgotten, the next lookup calls again
+    assert single_flight.do_many([1], lambda keys: {1: 'fetched'}) == {1: 'fetched'}
+
+
+def test_async_lookups_share_one_fetch():
+    single_flight = AsyncSingleFlight()
+    fetched = []
+
+    async def fetch(keys):
+        fetched.append(keys)
+        await asyncio.sleep(0.01)
+        return {key: key * 10 for key in keys}
+
+    async def lookups():
+        return await asyncio.gather(*(single_flight.do_many([1, 2], fetch) for _ in range(5)))
+
+    assert asyncio.run(lookups()) == [{1: 10, 2: 20}] * 5
+    assert fetched == [[1, 2]]
+    assert single_flight.stats() == {'in_flight_keys': 0, 'flights': 1, 'shared_keys': 8}
+
+
+def test_async_followers_survive_a_cancelled_leader():
+    single_flight = AsyncSingleFlight()
+
+    async def fetch(keys):
+        await asyncio.sleep(1)
+        return {key: key for key in keys}
+
+    async def lookups():
+        leader = asyncio.ensure_future(single_flight.do_many([1], fetch))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(single_flight.do_many([1], fetch))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(lookups()) == {}
+
+
+def test_concurrent_requests_for_one_author_make_one_call(post_server, fake_db, profile_stub):
+    # Ten posts by the same author, all requested at once with a cold cache
+    for post_id in range(11, 21):
+        fake_db.add_post(post_id, user_id=7)
+    profile_stub.latency = 0.1
+
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        responses = list(executor.map(lambda post_id: get_post(post_server, post_id), range(11, 21)))
+
+    assert all(response.json['author'] == {'user_id': 7, 'user_name': 'user_7'} for response in responses)
+    assert profile_stub.calls == 1
+    assert post_server.profile_bulkhead.stats()['rejected'] == 0
+    assert post_server.profile_client.single_flight.stats()['shared_keys'] == 9
+
+
+def test_followers_of_a_slow_call_get_stale_entries_at_once(profile_stub, breaker, profile_cache, clock):
+    bulkhead = Bulkhead('profile_service', max_concurrent=1)
+    client = ProfileClient(profile_stub.url, breaker, profile_cache, timeout=(0.5, 1.0), bulkhead=bulkhead)
+    profile_cache.put(1, {'user_id': 1, 'user_name': 'stale'})
+    clock.advance(2)
+    profile_stub.latency = 0.5
+
+    def lookup(_):
+        start = time.perf_counter()
+        return client.get_users_info([1])[1]['user_name'], time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lookup, range(8)))
+
+    # One thread waits for profile_service inside the bulkhead, the others answer from the cache
+    assert sorted(name for name, _ in results) == ['stale'] * 7 + ['user_1']
+    assert sum(elapsed < 0.25 for _, elapsed in results) == 7
+    assert profile_stub.calls == 1
+    assert bulkhead.stats()['admitted'] == 1
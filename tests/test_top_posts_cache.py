@@ -0,0 +1,119 @@
+# test_top_posts_cache.py
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from ranking import AsyncTopPostsCache, TopPostsCache
+
+
+'''
+    test_top_posts_cache
+        The feed snapshot is loaded once per `ttl`, by one thread at a time,
+        while the others keep serving the previous snapshot; the same holds
+        for the coroutine loader of the asyncio server.
+'''
+
+
+class Loader:
+
+    def __init__(self):
+        self.calls = []
+        self.version = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, n):
+        self.calls.append(n)
+        self.started.set()
+        self.release.wait(1)
+        return [(post_id, self.version) for post_id in range(n, 0, -1)]
+
+
+def test_snapshot_is_served_until_it_expires(clock):
+    loader = Loader()
+    cache = TopPostsCache(loader, ttl=1.0, size=5, clock=clock)
+
+    assert cache.get(3) == [(5, 0), (4, 0), (3, 0)]
+    loader.version = 1
+    assert cache.get(5) == [(post_id, 0) for post_id in range(5, 0, -1)]
+    assert loader.calls == [5]
+
+    clock.advance(1.0)
+    assert cache.get(2) == [(5, 1), (4, 1)]
+    assert loader.calls == [5, 5]
+
+
+def test_reads_deeper_than_the_snapshot_go_to_the_loader(clock):
+    loader = Loader()
+    cache = TopPostsCache(loader, ttl=1.0, size=5, clock=clock)
+
+    assert len(cache.get(8)) == 8
+    assert len(cache.get(8)) == 8
+    assert loader.calls == [8, 8]
+
+
+def test_invalidate_reloads_on_the_next_read(clock):
+    loader = Loader()
+    cache = TopPostsCache(loader, ttl=60.0, size=5, clock=clock)
+    cache.get(5)
+
+    loader.version = 1
+    cache.invalidate()
+
+    assert cache.get(1) == [(5, 1)]
+    assert loader.calls == [5, 5]
+
+
+def test_one_thread_refreshes_while_the_others_serve_the_stale_snapshot(clock):
+    loader = Loader()
+    cache = TopPostsCache(loader, ttl=1.0, size=5, clock=clock)
+    cache.get(5)
+    clock.advance(1.0)
+    loader.version, loader.started = 1, threading.Event()
+    loader.release.clear()
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        refresher = executor.submit(cache.get, 5)
+        assert loader.started.wait(1)
+        # The refresh is blocked in the loader: every other read answers at once with the old rows
+        stale = [cache.get(5) for _ in range(10)]
+        loader.release.set()
+        fresh = refresher.result()
+
+    assert stale == [[(post_id, 0) for post_id in range(5, 0, -1)]] * 10
+    assert fresh == [(post_id, 1) for post_id in range(5, 0, -1)]
+    assert loader.calls == [5, 5]
+    assert cache.get(5) == fresh
+
+
+def test_one_task_refreshes_while_the_others_serve_the_stale_snapshot(clock):
+    calls, release = [], None
+
+    async def loader(n):
+        calls.append(n)
+        if release is not None:
+            await release.wait()
+        return [(post_id, len(calls) - 1) for post_id in range(n, 0, -1)]
+
+    async def scenario():
+        nonlocal release
+        cache = AsyncTopPostsCache(loader, ttl=1.0, size=5, clock=clock)
+        # First read: nothing to serve yet, concurrent readers share the one load
+        first = await asyncio.gather(*(cache.get(2) for _ in range(5)))
+        assert first == [[(5, 0), (4, 0)]] * 5
+
+        clock.advance(1.0)
+        release = asyncio.Event()
+        refresher = asyncio.ensure_future(cache.get(5))
+        await asyncio.sleep(0)
+        # The refresh is blocked in the loader: every other read answers with the old rows
+        stale = [await cache.get(1) for _ in range(10)]
+        release.set()
+        return stale, await refresher, await cache.get(5)
+
+    stale, fresh, cached = asyncio.run(scenario())
+
+    assert stale == [[(5, 0)]] * 10
+    assert fresh == cached == [(post_id, 1) for post_id in range(5, 0, -1)]
+    assert calls == [5, 5]
@@ -0,0 +1,88 @@
+# test_trending.py
+from conftest import FakeConnection
+from trending import TrendingReconciler
+
+
+'''
+    test_trending
+        rank=trending orders the feed by the time-decayed score, kept up to
+        date by the impression writes and rebuilt by the reconciler.
+'''
+
+
+def fetch_feed(server, **params):
+    return server.app.test_client().get('/fetch_feed', query_string=params)
+
+
+def post_ids(response):
+    return [post['post_id'] for post in response.json['top_posts']]
+
+
+def test_trending_ranks_recent_activity_over_all_time_score(feed_server, fake_db):
+    fake_db.trending.update({2: 4.5, 10: 0.25, 7: 1.75})
+
+    assert post_ids(fetch_feed(feed_server, limit=3)) == [10, 9, 8]
+    assert post_ids(fetch_feed(feed_server, limit=3, rank='trending')) == [2, 7, 10]
+
+
+def test_trending_pages_follow_a_float_cursor(feed_server, fake_db):
+    fake_db.trending.update({2: 4.5, 10: 0.25, 7: 1.75, 4: 0.1})
+
+    first = fetch_feed(feed_server, limit=2, rank='trending')
+    second = fetch_feed(feed_server, limit=2, rank='trending', cursor=first.json['next_cursor'])
+
+    assert post_ids(first) == [2, 7]
+    assert post_ids(second) == [10, 4]
+
+
+def test_trending_users_past_the_last_page_are_an_empty_page(feed_server, fake_db):
+    client = feed_server.app.test_client()
+    first = client.get('/get_trending_user_info', query_string={'limit': 5})
+    second = client.get('/get_trending_user_info', query_string={'limit': 5, 'cursor': first.json['next_cursor']})
+    # The last full page still hands out a cursor: it leads to an empty page, not a 404
+    third = client.get('/get_trending_user_info', query_string={'limit': 5, 'cursor': second.json['next_cursor']})
+
+    assert len(fake_db.scores) == 10
+    assert [first.status_code, second.status_code, third.status_code] == [200, 200, 200]
+    assert third.json == {'trending_users': [], 'next_cursor': None}
+
+
+def test_impressions_update_the_trending_score(feed_server, fake_db):
+    feed_server.trending_posts_cache.ttl = 60
+    fake_db.trending_weight = 8.0
+    assert post_ids(fetch_feed(feed_server, limit=1, rank='trending')) == [10]
+
+    response = feed_server.app.test_client().post('/submit_impression',
+                                                  json={'post_id': 3, 'user_id': 1, 'impression_type': 'UP'})
+
+    assert response.status_code == 201
+    assert (fake_db.scores[3], fake_db.trending[3]) == (4, 8.0)
+    # The trending snapshot was invalidated by the write
+    assert post_ids(fetch_feed(feed_server, limit=1, rank='trending')) == [3]
+
+
+def test_reconciler_rebuilds_under_the_advisory_lock(fake_db):
+    rebuilds = []
+    reconciler = TrendingReconciler(lambda: FakeConnection(fake_db), lambda conn: None,
+                                    on_rebuild=lambda: rebuilds.append(True))
+    fake_db.impressions = [(1, 2, 'UP'), (1, 3, 'UP'), (2, 3, 'DOWN')]
+    fake_db.trending = {1: 7.0}
+
+    assert reconciler.run_once() == 2
+    assert fake_db.trending[1] == 2.0 and fake_db.trending[2] == -1.0
+    assert rebuilds == [True]
+    assert fake_db.commits == 1
+    # Score writers never wait on Trending_state: nothing locks it explicitly
+    assert not any('FOR UPDATE' in query or 'FOR SHARE' in query for query in fake_db.queries)
+
+    # Another replica holds the lock: nothing is rebuilt
+    fake_db.reconcile_lock_free = False
+    assert reconciler.run_once() is None
+    assert reconciler.stats()['skipped'] == 1
+    assert (fake_db.commits, fake_db.rollbacks) == (1, 1)
+
+
+def test_unknown_rank_is_rejected(feed_server):
+    assert fetch_feed(feed_server, rank='hot').status_code == 400
+    assert feed_server.app.test_client().get('/get_trending_user_info',
+                                             query_string={'rank': 'hot'}).status_code == 400
@@ -34,3 +34,23 @@ CREATE TABLE Score_table (
     CONSTRAINT fk_post FOREIGN KEY(post_id) REFERENCES Post_table(post_id) ON DELETE CASCADE
 );
 
+
+
+-- Serves the feed ranking (ORDER BY score DESC, post_id DESC) and its keyset pagination
+-- (WHERE (score, post_id) < (...)) with an index range scan instead of a full sort
+CREATE INDEX IF NOT EXISTS idx_score_table_score_post_id ON Score_table (score DESC, post_id DESC);
+
+-- Time-decayed trending score (services/feed_service/trending.py): every impression adds
+-- +-2^((time - epoch) / half_life) to Score_table.trending, epoch being the single row of
+-- Trending_state, moved forward by the periodic rebuild. Databases created before it was added
+-- need these statements applied by hand.
+ALTER TABLE Score_table ADD COLUMN IF NOT EXISTS trending DOUBLE PRECISION NOT NULL DEFAULT 0;
+CREATE TABLE IF NOT EXISTS Trending_state (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    epoch TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+INSERT INTO Trending_state (id) VALUES (TRUE) ON CONFLICT DO NOTHING;
+-- Serves rank=trending the way idx_score_table_score_post_id serves rank=score
+CREATE INDEX IF NOT EXISTS idx_score_table_trending_post_id ON Score_table (trending DESC, post_id DESC);
+-- Serves the rebuild's scan of the recent impressions (time_of_impression > NOW() - window)
+CREATE INDEX IF NOT EXISTS idx_impression_table_time ON Impression_table (time_of_impression);